@@ -1,7 +1,8 @@
 from django.contrib import admin
 
 from .models import Competition, Genre, Season, Tournament, Role, Person, Team, TeamTournamentRegistration, GameStage, \
-    Group, PlayerTournamentRegistration, MatchStatus, Match, MatchEventType, MatchEvent, Venue
+    Group, PlayerTournamentRegistration, MatchStatus, Match, MatchEventType, MatchEvent, Venue, PersonStats, \
+    TeamStats
 
 
 @admin.register(Competition)
@@ -69,6 +70,9 @@ class MatchAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'matchno', 'group', 'hometeamreg', 'awayteamreg', 'datetime', 'refree', 'matchofficial', 'status',
         'venue', 'summarytext', 'summaryphoto')
+    readonly_fields = ('homegoals', 'awaygoals', 'homeowngoals', 'awayowngoals', 'hometiebreakgoals',
+                       'awaytiebreakgoals', 'homefouls', 'awayfouls', 'homeyellowcards', 'awayyellowcards',
+                       'homeredcards', 'awayredcards')
 
 
 @admin.register(MatchEventType)
@@ -85,3 +89,28 @@ class MatchEventAdmin(admin.ModelAdmin):
 @admin.register(Venue)
 class VenueAdmin(admin.ModelAdmin):
     list_display = ('id', 'name', 'address', 'website')
+
+
+class StatsAdmin(admin.ModelAdmin):
+    """Shows the stored stats, which are only changed by the match events (or rebuilt by rebuild_stats)"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(PersonStats)
+class PersonStatsAdmin(StatsAdmin):
+    list_display = ('id', 'person', 'tournaments', 'matches', 'wins', 'draws', 'losses', 'goals', 'fouls',
+                    'yellowcards', 'redcards')
+
+
+@admin.register(TeamStats)
+class TeamStatsAdmin(StatsAdmin):
+    list_display = ('id', 'team', 'tournaments', 'matches', 'wins', 'draws', 'losses', 'goalsscored', 'goalsconceded',
+                    'titles', 'runnerups', 'thirdplaces')
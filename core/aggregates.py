@@ -0,0 +1,259 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Match, MatchEvent, Person, PlayerTournamentRegistration, PersonStats, \
+    Team, TeamStats, TeamTournamentRegistration
+from .pagecache import bump_person_versions, bump_tournament_versions
+from .registry import registry, GAMESTAGE_FINAL, GAMESTAGE_THIRDPLACE
+from .standings import MATCH_FIELDS, empty_result, add_match_result
+
+# Event types counted for a player, by PersonStats field
+PERSON_EVENTTYPES = {
+    'goals': 'goal',
+    'owngoals': 'own goal',
+    'fouls': 'foul',
+    'yellowcards': 'yellow card',
+    'redcards': 'red card',
+}
+
+# Extra keys of a team registration record, besides the standings result keys
+RECORD_FIELDS = ('owngoals', 'tiebreakgoalsconceded', 'foulsagainst', 'cleansheets', 'titles', 'runnerups',
+                 'thirdplaces')
+
+# Record keys added to the stats of everyone registered with a team, by PersonStats field
+PERSON_RECORD_FIELDS = {
+    'matches': 'matches',
+    'wins': 'wins',
+    'draws': 'draws',
+    'losses': 'losses',
+    'tiebreakgoals': 'tiebreakgoals',
+    'goalsconceded': 'goalsconceded',
+    'cleansheets': 'cleansheets',
+}
+
+# Record keys added to the stats of a team, by TeamStats field
+TEAM_RECORD_FIELDS = {
+    'matches': 'matches',
+    'wins': 'wins',
+    'draws': 'draws',
+    'losses': 'losses',
+    'goalsscored': 'goalsscored',
+    'goalsconceded': 'goalsconceded',
+    'tiebreakgoalsscored': 'tiebreakgoals',
+    'tiebreakgoalsconceded': 'tiebreakgoalsconceded',
+    'fouls': 'fouls',
+    'foulsagainst': 'foulsagainst',
+    'yellowcards': 'yellowcards',
+    'redcards': 'redcards',
+    'owngoals': 'owngoals',
+    'cleansheets': 'cleansheets',
+    'titles': 'titles',
+    'runnerups': 'runnerups',
+    'thirdplaces': 'thirdplaces',
+}
+
+
+def empty_record():
+    return dict(empty_result(), **dict.fromkeys(RECORD_FIELDS, 0))
+
+
+def add_match_record(record, match, home):
+    """Adds a match to the all-time record of the home (home=True) or away (home=False) team registration"""
+    add_match_result(record, match, home)
+    side, other = ('home', 'away') if home else ('away', 'home')
+    scored, conceded = (match.get_homescore(), match.get_awayscore()) if home else \
+        (match.get_awayscore(), match.get_homescore())
+    record['owngoals'] += getattr(match, f'{side}owngoals')
+    record['tiebreakgoalsconceded'] += getattr(match, f'{other}tiebreakgoals')
+    record['foulsagainst'] += getattr(match, f'{other}fouls')
+    record['cleansheets'] += 1 if conceded == 0 else 0
+    # Wins (losses) in the final are titles (runner-up places) and wins in the third place match are third places
+    if match.gamestage_id == registry.gamestage_id(GAMESTAGE_FINAL):
+        record['titles'] += 1 if scored > conceded else 0
+        record['runnerups'] += 1 if scored < conceded else 0
+    elif match.gamestage_id == registry.gamestage_id(GAMESTAGE_THIRDPLACE):
+        record['thirdplaces'] += 1 if scored > conceded else 0
+    return record
+
+
+def get_teamreg_records(teamreg_ids):
+    """Returns {teamreg_id: record} over every match of the team registrations, in a single query.
+
+    As the TeamTournamentRegistration getters, every match is counted whatever its status."""
+    records = {teamreg_id: empty_record() for teamreg_id in teamreg_ids}
+    matches = Match.objects.filter(Q(hometeamreg_id__in=records) | Q(awayteamreg_id__in=records)) \
+        .only(*MATCH_FIELDS).annotate(gamestage_id=F('group__gamestage_id'))
+    for match in matches:
+        if match.hometeamreg_id in records:
+            add_match_record(records[match.hometeamreg_id], match, home=True)
+        if match.awayteamreg_id in records:
+            add_match_record(records[match.awayteamreg_id], match, home=False)
+    return records
+
+
+@transaction.atomic
+def refresh_person_stats(person_ids):
+    """Recomputes the career stats of the given people and returns them as {person_id: PersonStats}"""
+    # Locking the people before counting serializes concurrent refreshes of the same stats rows, so that the last one
+    # stored counts every committed change
+    person_ids = set(Person.objects.select_for_update().filter(id__in=person_ids).order_by('id')
+                     .values_list('id', flat=True))
+    registrations = list(PlayerTournamentRegistration.objects.filter(person_id__in=person_ids)
+                         .values_list('person_id', 'teamreg_id'))
+    records = get_teamreg_records({teamreg_id for _, teamreg_id in registrations})
+    eventtype_names = registry.eventtype_names()
+    eventtype_ids = [registry.eventtype_id(eventtype) for eventtype in PERSON_EVENTTYPES.values()]
+    events = MatchEvent.objects.filter(playerreg__person_id__in=person_ids, eventtype_id__in=eventtype_ids) \
+        .values('playerreg__person_id', 'eventtype_id').annotate(count=Count('id'))
+    event_counts = {(row['playerreg__person_id'], eventtype_names.get(row['eventtype_id'])): row['count']
+                    for row in events}
+    stats = {person_id: PersonStats(person_id=person_id, **{field: event_counts.get((person_id, eventtype), 0)
+                                                            for field, eventtype in PERSON_EVENTTYPES.items()})
+             for person_id in person_ids}
+    for person_id, teamreg_id in registrations:
+        record = records[teamreg_id]
+        person_stats = stats[person_id]
+        person_stats.tournaments += 1
+        person_stats.matches += record['matches']
+        person_stats.wins += record['wins']
+        person_stats.draws += record['draws']
+        person_stats.losses += record['losses']
+        person_stats.tiebreakgoals += record['tiebreakgoals']
+        person_stats.goalsconceded += record['goalsconceded']
+        person_stats.cleansheets += record['cleansheets']
+    PersonStats.objects.filter(person_id__in=person_ids).delete()
+    PersonStats.objects.bulk_create(stats.values())
+    # Bumped along with the new stats, as the refresh may run once the change was committed (see
+    # refresh_stats_on_commit), after a page showing the former stats was cached under the version the change bumped.
+    # The player boxes show the number of tournaments, and the player pages the stats of every tournament
+    bump_person_versions(person_ids=person_ids)
+    bump_tournament_versions(person_ids=person_ids)
+    return stats
+
+
+@transaction.atomic
+def refresh_team_stats(team_ids):
+    """Recomputes the all-time stats of the given teams and returns them as {team_id: TeamStats}"""
+    # Locking the teams before counting serializes concurrent refreshes of the same stats rows
+    team_ids = set(Team.objects.select_for_update().filter(id__in=team_ids).order_by('id')
+                   .values_list('id', flat=True))
+    registrations = list(TeamTournamentRegistration.objects.filter(team_id__in=team_ids)
+                         .values_list('team_id', 'id'))
+    records = get_teamreg_records({teamreg_id for _, teamreg_id in registrations})
+    stats = {team_id: TeamStats(team_id=team_id) for team_id in team_ids}
+    for team_id, teamreg_id in registrations:
+        record = records[teamreg_id]
+        team_stats = stats[team_id]
+        team_stats.tournaments += 1
+        team_stats.matches += record['matches']
+        team_stats.wins += record['wins']
+        team_stats.draws += record['draws']
+        team_stats.losses += record['losses']
+        team_stats.goalsscored += record['goalsscored']
+        team_stats.goalsconceded += record['goalsconceded']
+        team_stats.tiebreakgoalsscored += record['tiebreakgoals']
+        team_stats.tiebreakgoalsconceded += record['tiebreakgoalsconceded']
+        team_stats.fouls += record['fouls']
+        team_stats.foulsagainst += record['foulsagainst']
+        team_stats.yellowcards += record['yellowcards']
+        team_stats.redcards += record['redcards']
+        team_stats.owngoals += record['owngoals']
+        team_stats.cleansheets += record['cleansheets']
+        team_stats.titles += record['titles']
+        team_stats.runnerups += record['runnerups']
+        team_stats.thirdplaces += record['thirdplaces']
+    TeamStats.objects.filter(team_id__in=team_ids).delete()
+    TeamStats.objects.bulk_create(stats.values())
+    # The team pages show the stats of every tournament, as refresh_person_stats
+    bump_tournament_versions(team_ids=team_ids)
+    return stats
+
+
+def refresh_teamreg_people_stats(teamreg_ids):
+    """Recomputes the career stats of everyone registered with the given team registrations"""
+    person_ids = PlayerTournamentRegistration.objects.filter(teamreg_id__in=teamreg_ids) \
+        .values_list('person_id', flat=True)
+    refresh_person_stats(person_ids)
+
+
+def get_record_change(previous, match, home):
+    """Returns the change of the record of the home (home=True) or away (home=False) team of a match, from the
+    previous summary of the match to its current one, as {record key: change} without the unchanged keys"""
+    before, after = add_match_record(empty_record(), previous, home), add_match_record(empty_record(), match, home)
+    return {key: after[key] - before[key] for key in after if after[key] != before[key]}
+
+
+def add_stats_changes(matches=(), events=None):
+    """Adds the changes of match summaries and of player events to the stored stats, with F() updates, in the
+    transaction that made them.
+
+    matches holds (previous, match) pairs of the summaries of a match before and after the change (see
+    Match.update_summary), both with the gamestage_id of the match, and events {(playerreg_id, eventtype_id): change}
+    of the event counts of the players. Only the stats of the teams of the matches and of the people registered with
+    them change, by the difference, instead of recounting their whole career. The people and teams are locked first,
+    so that a full refresh of their stats (see refresh_person_stats) runs either before or after, never in between."""
+    teamreg_changes = {}
+    for previous, match in matches:
+        for teamreg_id, home in ((match.hometeamreg_id, True), (match.awayteamreg_id, False)):
+            teamreg_changes.setdefault(teamreg_id, Counter()).update(get_record_change(previous, match, home))
+    teamreg_changes = {teamreg_id: change for teamreg_id, change in teamreg_changes.items() if any(change.values())}
+    eventtype_names = registry.eventtype_names()
+    event_fields = {eventtype: field for field, eventtype in PERSON_EVENTTYPES.items()}
+    events = {(playerreg_id, event_fields.get(eventtype_names.get(eventtype_id))): change
+              for (playerreg_id, eventtype_id), change in (events or {}).items() if playerreg_id is not None and change}
+    events = {key: change for key, change in events.items() if key[1] is not None}
+    if not teamreg_changes and not events:
+        return
+    playerregs = PlayerTournamentRegistration.objects \
+        .filter(Q(teamreg_id__in=teamreg_changes) | Q(id__in={playerreg_id for playerreg_id, _ in events})) \
+        .values_list('id', 'person_id', 'teamreg_id')
+    person_changes, person_ids = {}, {}
+    for playerreg_id, person_id, teamreg_id in playerregs:
+        person_ids[playerreg_id] = person_id
+        if teamreg_id in teamreg_changes:
+            change = person_changes.setdefault(person_id, Counter())
+            for field, key in PERSON_RECORD_FIELDS.items():
+                change[field] += teamreg_changes[teamreg_id].get(key, 0)
+    for (playerreg_id, field), change in events.items():
+        if playerreg_id in person_ids:
+            person_changes.setdefault(person_ids[playerreg_id], Counter())[field] += change
+    team_changes = {}
+    for teamreg_id, team_id in TeamTournamentRegistration.objects.filter(id__in=teamreg_changes) \
+            .values_list('id', 'team_id'):
+        change = team_changes.setdefault(team_id, Counter())
+        for field, key in TEAM_RECORD_FIELDS.items():
+            change[field] += teamreg_changes[teamreg_id].get(key, 0)
+
+    list(Person.objects.select_for_update(no_key=True).filter(id__in=person_changes).order_by('id').values_list('id'))
+    list(Team.objects.select_for_update(no_key=True).filter(id__in=team_changes).order_by('id').values_list('id'))
+    # The rows with the same change (as the teammates of the players who scored) are updated at once
+    for model, key, changes in ((PersonStats, 'person_id', person_changes), (TeamStats, 'team_id', team_changes)):
+        ids_by_change = {}
+        for row_id, change in changes.items():
+            change = frozenset((field, value) for field, value in change.items() if value)
+            if change:
+                ids_by_change.setdefault(change, []).append(row_id)
+        for change, row_ids in ids_by_change.items():
+            model.objects.filter(**{f'{key}__in': row_ids}).update(**{field: F(field) + value
+                                                                       for field, value in change})
+
+
+def refresh_stats_on_commit(teamreg_ids=(), person_ids=(), team_ids=()):
+    """Schedules the refresh of the stats affected by a change, once the current transaction is committed.
+
+    A change to the matches of team registrations affects their teams and everyone registered with them."""
+    teamreg_ids, person_ids, team_ids = set(teamreg_ids) - {None}, set(person_ids) - {None}, set(team_ids) - {None}
+
+    def refresh():
+        if teamreg_ids:
+            refresh_teamreg_people_stats(teamreg_ids)
+            team_ids.update(TeamTournamentRegistration.objects.filter(id__in=teamreg_ids)
+                            .values_list('team_id', flat=True))
+        if person_ids:
+            refresh_person_stats(person_ids)
+        if team_ids:
+            refresh_team_stats(team_ids)
+
+    transaction.on_commit(refresh)
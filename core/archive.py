@@ -0,0 +1,107 @@
+import html
+import os
+import shutil
+from contextvars import ContextVar
+from urllib.parse import parse_qsl, quote, urlsplit
+
+from django.conf import settings
+from django.test import Client
+from django.urls import reverse
+from django.utils.translation import get_language
+
+from .models import Group, Match, Tournament
+
+# Languages the pages of a closed season are archived in
+ARCHIVE_LANGUAGES = ('pt-br', 'en')
+
+# Whether the pages are being rendered for the archive, and so must not be redirected to their previous archive
+rendering_archive = ContextVar('rendering_archive', default=False)
+
+
+def normalize_url(url):
+    """Returns the (path, sorted query items) of a page URL, equal for every spelling of the same page"""
+    parts = urlsplit(html.unescape(url))
+    return parts.path, tuple(sorted(parse_qsl(parts.query)))
+
+
+def archive_name(url):
+    """Returns the file name of an archived page, e.g. 'groups_tournament-1.html' for '/groups/?tournament=1'.
+
+    The parameters are quoted, so that the name of any requested URL stays in the directory of the archive."""
+    path, query = normalize_url(url)
+    return '_'.join([quote(path.strip('/'), safe='') or 'index'] +
+                    [f'{quote(key, safe="")}-{quote(value, safe="")}' for key, value in query]) + '.html'
+
+
+def archive_path(season_id, language, url=None):
+    """Returns the directory of the archived season pages in a language, or the file of one of its pages"""
+    directory = os.path.join(settings.ARCHIVE_ROOT, str(season_id), language)
+    return os.path.join(directory, archive_name(url)) if url is not None else directory
+
+
+def get_archived_page(request, season_id):
+    """Returns the content of the archived copy of the requested page in a season, or None if there is none"""
+    if rendering_archive.get():
+        return None
+    language = get_language() if get_language() in ARCHIVE_LANGUAGES else settings.LANGUAGE_CODE
+    try:
+        with open(archive_path(season_id, language, request.get_full_path()), 'rb') as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+
+def get_season_urls(season):
+    """Returns the URLs of the public pages of a season: the index, and the groups, fixtures, teams, players and
+    awards of the season and of each of its tournaments, with every group and match.
+
+    The team and player pages are left out, as they show the teams and people in every season."""
+    tournament_ids = list(Tournament.objects.filter(season=season).order_by('id').values_list('id', flat=True))
+    urls = [reverse('index')]
+    for name in ('groups', 'fixtures', 'teams', 'players', 'awards'):
+        urls += [reverse(name)] + [f'{reverse(name)}?tournament={tournament_id}' for tournament_id in tournament_ids]
+    urls += [f'{reverse("single-group")}?group={group_id}' for group_id in
+             Group.objects.filter(tournament_id__in=tournament_ids).order_by('id').values_list('id', flat=True)]
+    urls += [f'{reverse("single-result")}?match={match_id}' for match_id in
+             Match.objects.filter(group__tournament_id__in=tournament_ids).order_by('id').values_list('id', flat=True)]
+    return urls
+
+
+def render_season(season, language):
+    """Renders the public pages of a season in a language, as an anonymous visitor, and returns {url: html}"""
+    host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+    client = Client(HTTP_HOST=host, HTTP_ACCEPT_LANGUAGE=language)
+    client.get(f'{reverse("set_season")}?season={season.id}')
+    pages = {}
+    for url in get_season_urls(season):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise RuntimeError(f'{url} answered {response.status_code}')
+        pages[url] = response.content.decode(response.charset)
+    return pages
+
+
+def archive_season(season):
+    """Renders the pages of a season in every archive language into static files, replacing its previous archive.
+
+    The previous archive is served until the new one is complete. Returns the number of files written."""
+    season_directory = os.path.join(settings.ARCHIVE_ROOT, str(season.id))
+    token = rendering_archive.set(True)
+    try:
+        rendered = {language: render_season(season, language) for language in ARCHIVE_LANGUAGES}
+    finally:
+        rendering_archive.reset(token)
+    temporary_directory, previous_directory = f'{season_directory}.tmp', f'{season_directory}.old'
+    shutil.rmtree(temporary_directory, ignore_errors=True)
+    for language, pages in rendered.items():
+        os.makedirs(os.path.join(temporary_directory, language))
+        for url, content in pages.items():
+            with open(os.path.join(temporary_directory, language, archive_name(url)), 'w', encoding='utf-8') as file:
+                file.write(content)
+    # A directory only replaces an empty one, so the previous archive is moved aside first
+    shutil.rmtree(previous_directory, ignore_errors=True)
+    if os.path.exists(season_directory):
+        os.rename(season_directory, previous_directory)
+    os.replace(temporary_directory, season_directory)
+    shutil.rmtree(previous_directory, ignore_errors=True)
+    return sum(len(pages) for pages in rendered.values())
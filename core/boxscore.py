@@ -0,0 +1,42 @@
+from collections import Counter
+
+from django.db.models import Count
+
+from .models import MatchEvent, PlayerTournamentRegistration
+from .registry import registry
+
+# Event type columns of the player box score, in display order
+BOX_SCORE_EVENTTYPES = ('goal', 'foul', 'yellow card', 'red card', 'own goal', 'tie-break penalty goal')
+
+
+def try_int(x):
+    try:
+        return int(x)
+    except ValueError:
+        return 1000000
+
+
+def get_player_event_counts(match):
+    """Returns a {(playerreg_id, eventtype_id): count} Counter of the events of a match, in a single GROUP BY query"""
+    rows = MatchEvent.objects.filter(match_id=match.id, playerreg__isnull=False) \
+        .values('playerreg_id', 'eventtype_id').annotate(count=Count('id'))
+    return Counter({(row['playerreg_id'], row['eventtype_id']): row['count'] for row in rows})
+
+
+def get_team_tables(match):
+    """Returns the player box scores of the home and away teams of a match, sorted by shirt number.
+
+    Each row is [(shirtno, ), (short name, ), (count, playerreg_id, teamreg_id, event type name), ...], with a count
+    per BOX_SCORE_EVENTTYPES entry. The rosters and the event counts are loaded in two queries."""
+    counts = get_player_event_counts(match)
+    eventtypes = [(registry.eventtype_id(name), name) for name in BOX_SCORE_EVENTTYPES]
+    teamreg_ids = [match.hometeamreg_id, match.awayteamreg_id]
+    team_tables = {teamreg_id: [] for teamreg_id in teamreg_ids}
+    for p in PlayerTournamentRegistration.objects.filter(teamreg_id__in=teamreg_ids).select_related('person') \
+            .order_by('id'):
+        team_tables[p.teamreg_id].append(
+            [(p.shirtno, ), (p.person.short, )] +
+            [(counts[(p.id, eventtype_id)], p.id, p.teamreg_id, name) for eventtype_id, name in eventtypes])
+    for team_table in team_tables.values():
+        team_table.sort(key=lambda x: try_int(x[0][0]))
+    return [team_tables[teamreg_id] for teamreg_id in teamreg_ids]
@@ -0,0 +1,300 @@
+import atexit
+import contextvars
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.cache.backends.memcached import PyMemcacheCache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two writes of the hit, miss and eviction counters of a process to the shared cache
+METRICS_FLUSH_INTERVAL = 30
+
+# Seconds a value may take to compute before the other requests waiting for it compute it themselves
+COMPUTE_LOCK_TIMEOUT = 10
+COMPUTE_POLL_INTERVAL = 0.05
+
+METRICS = ('hits', 'misses', 'evictions')
+
+# Values a process computes at once in the background (see get_or_revalidate). While they are all busy, the other
+# stale values are served without scheduling their computation, which a later request schedules
+REVALIDATE_MAX_WORKERS = 2
+
+_revalidate_executor = ThreadPoolExecutor(max_workers=REVALIDATE_MAX_WORKERS, thread_name_prefix='revalidate')
+_revalidate_slots = threading.BoundedSemaphore(REVALIDATE_MAX_WORKERS)
+
+
+class CacheMetricsMixin:
+    """Counts the hits, misses and evictions of a cache backend, shared by every process using the cache.
+
+    The counts of a process are kept in memory and added to counters stored in the cache itself at most every
+    METRICS_FLUSH_INTERVAL seconds, so that counting costs no round trip on most requests."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metrics_lock = threading.Lock()
+        self._pending_metrics = Counter()
+        self._metrics_flushed_at = time.monotonic()
+        atexit.register(self._flush_metrics_at_exit)
+
+    def _flush_metrics_at_exit(self):
+        try:
+            self.flush_metrics()
+        except Exception:
+            # The counts of the exiting process are lost, but they must not break its shutdown
+            pass
+
+    def record_metrics(self, **counts):
+        with self._metrics_lock:
+            self._pending_metrics.update(counts)
+            due = time.monotonic() - self._metrics_flushed_at > METRICS_FLUSH_INTERVAL
+        if due:
+            self.flush_metrics()
+
+    def flush_metrics(self):
+        """Adds the counts of this process to the shared counters"""
+        with self._metrics_lock:
+            pending, self._pending_metrics = self._pending_metrics, Counter()
+            self._metrics_flushed_at = time.monotonic()
+        for name, count in pending.items():
+            if count and not self.add(f'cache-metrics:{name}', count, None):
+                try:
+                    self.incr(f'cache-metrics:{name}', count)
+                except ValueError:
+                    # The counter went away in between (cleared or evicted)
+                    self.set(f'cache-metrics:{name}', count, None)
+
+    def get_evictions(self, stored):
+        """Returns the number of evicted entries, from the stored counter by default"""
+        return stored
+
+    def get_metrics(self):
+        """Returns the {'hits', 'misses', 'evictions', 'hit_rate'} counts of every process using the cache"""
+        self.flush_metrics()
+        stored = self.get_many_uncounted([f'cache-metrics:{name}' for name in METRICS])
+        metrics = {name: stored.get(f'cache-metrics:{name}', 0) for name in METRICS}
+        metrics['evictions'] = self.get_evictions(metrics['evictions'])
+        lookups = metrics['hits'] + metrics['misses']
+        metrics['hit_rate'] = metrics['hits'] / lookups if lookups else None
+        return metrics
+
+    def get_many_uncounted(self, keys, version=None):
+        """Looks the keys up as get_many, without counting the hits and misses"""
+        return super().get_many(keys, version)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        values = self.get_many_uncounted(keys, version)
+        self.record_metrics(hits=len(values), misses=len(keys) - len(values))
+        return values
+
+
+class SQLiteCache(CacheMetricsMixin, BaseCache):
+    """Cache stored in a local SQLite file (LOCATION), shared by every process of the host.
+
+    Each write is a single transaction, so readers never see a partial entry. When the file holds more than
+    MAX_ENTRIES entries, the expired ones and then the 1/CULL_FREQUENCY ones closest to expiring are evicted."""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+
+    def _connection(self):
+        # One connection per thread, opened again in forked processes
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=COMPUTE_LOCK_TIMEOUT, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, '
+                               'expires REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def _write(self, *statements):
+        """Runs the (sql, params) statements in one transaction and returns the number of rows of the last one"""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, params in statements:
+                rowcount = connection.execute(sql, params).rowcount
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return rowcount
+
+    def _key(self, key, version):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        return key
+
+    def _cull(self):
+        connection = self._connection()
+        if connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0] <= self._max_entries:
+            return
+        self._write(('DELETE FROM cache WHERE expires <= ?', (time.time(), )))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            evicted = self._write(('DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, '
+                                   'expires LIMIT ?)', (count // self._cull_frequency if self._cull_frequency else
+                                                        count, )))
+            self.record_metrics(evictions=evicted)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        added = self._write(('DELETE FROM cache WHERE key = ? AND expires <= ?', (key, time.time())),
+                            ('INSERT OR IGNORE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                             (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self.get_backend_timeout(timeout))))
+        if added:
+            self._cull()
+        return added == 1
+
+    def get_many_uncounted(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        rows = self._connection().execute(
+            f'SELECT key, value FROM cache WHERE key IN ({", ".join("?" * len(keys))}) '
+            f'AND (expires IS NULL OR expires > ?)', (*keys, time.time()))
+        return {keys[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                     (self._key(key, version), pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                      self.get_backend_timeout(timeout))))
+        self._cull()
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._write(('UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                            (self.get_backend_timeout(timeout), self._key(key, version), time.time()))) == 1
+
+    def delete(self, key, version=None):
+        return self._write(('DELETE FROM cache WHERE key = ?', (self._key(key, version), ))) == 1
+
+    def has_key(self, key, version=None):
+        return self._connection().execute('SELECT 1 FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                          (self._key(key, version), time.time())).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        # Atomic, unlike the base implementation: the row stays locked between the read and the write
+        key = self._key(key, version)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                                     (key, time.time())).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            connection.execute('UPDATE cache SET value = ? WHERE key = ?',
+                               (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return value
+
+    def clear(self):
+        self._write(('DELETE FROM cache', ()))
+
+    def close(self, **kwargs):
+        # Connections are kept open between requests
+        pass
+
+
+class MemcachedCache(CacheMetricsMixin, PyMemcacheCache):
+    """Memcached backend counting its hits and misses, with the evictions reported by the servers"""
+
+    def get_evictions(self, stored):
+        stats = [client.stats() for client in self._cache.clients.values()]
+        return sum(int(server_stats.get(b'evictions', 0)) for server_stats in stats)
+
+
+def tournament_key(tournament_id, version, *parts):
+    """Returns a cache key in the namespace of a tournament version, so that every key of the tournament is dropped
+    at once when its version is bumped (see core.pagecache)"""
+    return ':'.join(['tournament', str(tournament_id), str(version), *map(str, parts)])
+
+
+def get_or_compute(key, compute, timeout, cacheable=None):
+    """Returns the cached value of key, or else computes it with compute() and caches it if cacheable(value).
+
+    Only one request at a time computes a missing value: the others wait for it to be cached, for up to
+    COMPUTE_LOCK_TIMEOUT seconds, instead of all computing it at once when a popular entry expires or changes."""
+    value = cache.get(key)
+    if value is not None:
+        return value
+    lock = f'{key}:computing'
+    if cache.add(lock, True, COMPUTE_LOCK_TIMEOUT):
+        try:
+            value = compute()
+            if cacheable is None or cacheable(value):
+                cache.set(key, value, timeout)
+        finally:
+            cache.delete(lock)
+        return value
+    deadline = time.monotonic() + COMPUTE_LOCK_TIMEOUT
+    while time.monotonic() < deadline and cache.has_key(lock):
+        time.sleep(COMPUTE_POLL_INTERVAL)
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return compute()
+
+
+def get_or_revalidate(key, stale_key, compute, timeout, changed_at, max_staleness, cacheable=None):
+    """Returns the cached value of key, or else serves the last value computed for stale_key while a single request
+    computes the value of key in the background.
+
+    stale_key names the value regardless of the version in key, and changed_at is the time (as time.time()) of the
+    change that made the last value stale. Once it has been stale for more than max_staleness seconds, the value is
+    computed in the request instead (see get_or_compute)."""
+    def compute_and_keep():
+        value = compute()
+        if cacheable is None or cacheable(value):
+            cache.set(stale_key, value, timeout)
+        return value
+
+    value = cache.get(key)
+    if value is not None:
+        return value
+    stale = cache.get(stale_key) if changed_at is not None and time.time() - changed_at <= max_staleness else None
+    if stale is None:
+        return get_or_compute(key, compute_and_keep, timeout, cacheable)
+    lock = f'{key}:computing'
+    if cache.add(lock, True, COMPUTE_LOCK_TIMEOUT):
+        slots = _revalidate_slots
+        if slots.acquire(blocking=False):
+            # Run with the context of the request, e.g. its database routing (see core.dbrouter)
+            context = contextvars.copy_context()
+            _revalidate_executor.submit(context.run, revalidate, key, lock, compute_and_keep, timeout, cacheable) \
+                .add_done_callback(lambda future: slots.release())
+        else:
+            cache.delete(lock)
+    return stale
+
+
+def revalidate(key, lock, compute, timeout, cacheable):
+    try:
+        value = compute()
+        if cacheable is None or cacheable(value):
+            cache.set(key, value, timeout)
+    except Exception:
+        logger.exception('Could not compute %s', key)
+    finally:
+        cache.delete(lock)
+        # The connections of the worker thread would otherwise stay open until the process exits
+        connections.close_all()
@@ -0,0 +1,67 @@
+import uuid
+
+from django.core.cache import cache
+
+from .caching import get_or_compute
+from .models import Season, Tournament
+
+# Seconds a season catalog is kept. A catalog is keyed by the version of its season, which is bumped on every change
+# to the seasons or tournaments, so this only bounds how long the catalogs of old versions take up the cache
+CATALOG_TIMEOUT = 60 * 60 * 24
+
+REFEREE_GROUP = 'referee'
+
+
+def get_catalog(season_id=None):
+    """Returns the season menus ('all_seasons', 'season' and 'all_tournaments_season') of a season, or of the last
+    season if there is no such season, loading them only once per season version"""
+    seasons = Season.objects.values_list('id', 'version')
+    row = seasons.filter(id=season_id).first() if season_id is not None else None
+    season_id, version = row if row is not None else seasons.last()
+
+    def load_catalog():
+        all_seasons = list(Season.objects.all())
+        return {'all_seasons': all_seasons,
+                'season': next(season for season in all_seasons if season.id == season_id),
+                'all_tournaments_season': list(Tournament.objects.filter(season_id=season_id))}
+
+    return get_or_compute(f'catalog:{season_id}:{version}', load_catalog, CATALOG_TIMEOUT)
+
+
+def get_groups_stamp(user):
+    """Returns the token that changes whenever the groups of the user change (see invalidate_groups_stamp)"""
+    key = f'groups-stamp:{user.pk}'
+    stamp = cache.get(key)
+    if stamp is None:
+        stamp = uuid.uuid4().hex
+        cache.set(key, stamp, None)
+    return stamp
+
+
+def invalidate_groups_stamp(user_ids):
+    cache.delete_many([f'groups-stamp:{user_id}' for user_id in user_ids])
+
+
+def is_referee(request):
+    """Tells whether the user of the request is a referee, memoized in the session until the user groups change"""
+    if not request.user.is_authenticated:
+        return False
+    stamp = get_groups_stamp(request.user)
+    memo = request.session.get('is_referee')
+    if memo is None or memo[0] != stamp:
+        memo = [stamp, request.user.groups.filter(name=REFEREE_GROUP).exists()]
+        request.session['is_referee'] = memo
+    return memo[1]
+
+
+def get_common_info(request):
+    """Returns the season menus and the user info shown in every page, computed once per request"""
+    if not hasattr(request, '_common_info'):
+        catalog = get_catalog(request.session.get('season'))
+        request._common_info = dict(catalog, season_id=catalog['season'].id, is_referee=is_referee(request))
+    return request._common_info
+
+
+def common_info(request):
+    """Context processor with the season menus and the user info, for the pages that do not pass them explicitly"""
+    return get_common_info(request)
@@ -0,0 +1,77 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Alias of the read replica in settings.DATABASES, configured through REPLICA_DATABASE_URL
+REPLICA_DB_ALIAS = 'replica'
+
+# Seconds the reads of a session stay on the primary database after it wrote, longer than the replication lag
+REPLICA_STICKY_SECONDS = 15
+
+# Session key of the time until which the session reads from the primary database
+PRIMARY_UNTIL_SESSION_KEY = 'primary_until'
+
+_reading_replica = contextvars.ContextVar('reading_replica', default=False)
+_wrote = contextvars.ContextVar('wrote', default=None)
+
+
+def has_replica():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def use_replica(request=None):
+    """Sends the reads of the block to the replica, unless the session of the request wrote recently"""
+    sticky = request is not None and hasattr(request, 'session') and \
+        request.session.get(PRIMARY_UNTIL_SESSION_KEY, 0) > time.time()
+    token = _reading_replica.set(has_replica() and not sticky)
+    try:
+        yield
+    finally:
+        _reading_replica.reset(token)
+
+
+class ReplicaRouter:
+    """Sends the reads of the public pages (see use_replica) to the replica, and everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        # Explicitly the primary otherwise, as instances loaded from the replica would take their lazy loads there
+        return REPLICA_DB_ALIAS if _reading_replica.get() else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        wrote = _wrote.get()
+        if wrote is not None:
+            wrote.append(model)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both databases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets the schema from the primary
+        return db != REPLICA_DB_ALIAS
+
+
+class ReadYourWritesMiddleware:
+    """Keeps the reads of a session on the primary for REPLICA_STICKY_SECONDS after a request of the session wrote,
+    so that it sees its own writes before they reach the replica"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not has_replica():
+            return self.get_response(request)
+        token = _wrote.set([])
+        try:
+            response = self.get_response(request)
+            wrote = bool(_wrote.get())
+        finally:
+            _wrote.reset(token)
+        if wrote and hasattr(request, 'session'):
+            request.session[PRIMARY_UNTIL_SESSION_KEY] = time.time() + REPLICA_STICKY_SECONDS
+        return response
@@ -0,0 +1,15 @@
+# Fair play score of a team registration without matches, as TeamTournamentRegistration.get_fairplay_score
+NO_MATCHES_FAIRPLAY_SCORE = 1000
+
+
+def rank_items(items, key, limit=None):
+    """Sorts in memory items by key (lowest first), then by id, and sets their 'rank', equal for ties.
+
+    Returns the items ranked up to limit (and thus every tie at the limit)."""
+    ranked = sorted(items, key=lambda item: (key(item), item.id))
+    previous = None
+    for position, item in enumerate(ranked, 1):
+        if position == 1 or key(item) != previous:
+            rank, previous = position, key(item)
+        item.rank = rank
+    return [item for item in ranked if limit is None or item.rank <= limit]
@@ -0,0 +1,244 @@
+import asyncio
+import datetime
+import json
+import logging
+import re
+from contextlib import asynccontextmanager
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import Count
+from django.utils import timezone
+
+from .dbrouter import use_replica
+from .matchinput import match_counters
+from .models import Match, MatchEvent
+
+logger = logging.getLogger(__name__)
+
+# Path prefix of the live streams, routed to live_application by futebloco.asgi
+LIVE_PATH = '/live/'
+
+# Seconds between two checks of the versions of the matches followed in a process, whatever the number of streams
+LIVE_POLL_INTERVAL = 1
+
+# Seconds between two comments sent on an idle stream, so that proxies do not close it
+LIVE_HEARTBEAT_INTERVAL = 15
+
+# Milliseconds a browser waits before reconnecting a closed stream
+LIVE_RETRY_MILLISECONDS = 3000
+
+# Whether the queries of the streams run in the single thread shared with the synchronous code (the pages), or in
+# the threads of the default executor, each with its own database connection
+LIVE_QUERY_THREAD_SENSITIVE = False
+
+LIVE_PATH_RE = re.compile(rf'^{LIVE_PATH}(match|tournament)/(\d+)/$')
+
+_feeds = {}
+
+
+def get_match_ids(scope, scope_id, date):
+    """Returns the ids of the matches of a stream: the match itself, or the matches of a tournament on a date"""
+    if scope == 'match':
+        return list(Match.objects.filter(id=scope_id).values_list('id', flat=True))
+    return list(Match.objects.filter(group__tournament_id=scope_id, datetime__date=date).order_by('datetime', 'id')
+                .values_list('id', flat=True))
+
+
+def get_match_versions(match_ids):
+    return dict(Match.objects.filter(id__in=match_ids).values_list('id', 'version'))
+
+
+def match_state(match):
+    """Returns the status, times, scores and counters of a match, and its number of events, as sent in the 'match'
+    messages"""
+    return {**match_counters(match), 'events': match.events}
+
+
+def matchevent_data(matchevent):
+    """Returns an event of a match, as sent in the 'matchevent' messages"""
+    return {'id': matchevent.id, 'match': matchevent.match_id, 'eventtype': matchevent.eventtype.name,
+            'side': 'home' if matchevent.teamreg_id == matchevent.match.hometeamreg_id else 'away',
+            'minutes': matchevent.matchtimeminutes, 'playerreg': matchevent.playerreg_id,
+            'shirtno': matchevent.playerreg.shirtno if matchevent.playerreg is not None else None,
+            'player': matchevent.playerreg.person.short if matchevent.playerreg is not None else None}
+
+
+def get_match_updates(match_ids):
+    """Returns the versions and states of the matches, and all their events in the order they were recorded.
+
+    The matches are read before their events, so that an event committed in between comes with a version of its
+    match that is already outdated, and is looked for again on the next change"""
+    matches = list(Match.objects.filter(id__in=match_ids).annotate(events=Count('matchevent')).order_by('id'))
+    matchevents = MatchEvent.objects.filter(match_id__in=match_ids) \
+        .select_related('eventtype', 'playerreg__person', 'match').order_by('id')
+    return {match.id: match.version for match in matches}, [match_state(match) for match in matches], \
+        [matchevent_data(matchevent) for matchevent in matchevents]
+
+
+async def query(function, *args):
+    """Runs a database function of the streams out of the event loop, on the replica when there is one"""
+    def run():
+        close_old_connections()
+        try:
+            with use_replica():
+                return function(*args)
+        finally:
+            close_old_connections()
+
+    return await sync_to_async(run, thread_sensitive=LIVE_QUERY_THREAD_SENSITIVE)()
+
+
+def format_message(event, data, event_id=None):
+    """Returns a Server-Sent Events message"""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {json.dumps(data, cls=DjangoJSONEncoder)}']
+    return ('\n'.join(lines) + '\n\n').encode()
+
+
+class LiveFeed:
+    """The streams of a process following the same matches, fed by a single poller.
+
+    The poller only checks the match versions every LIVE_POLL_INTERVAL seconds, and loads the events and states of
+    the matches when a version changed, so that the database load does not grow with the number of streams. It starts
+    from the snapshot loaded by the first stream (see seed), and remembers the ids of the events it has seen rather
+    than the last one, as an event may be committed after another one with a greater id."""
+
+    def __init__(self, match_ids):
+        self.match_ids = match_ids
+        self.queues = set()
+        self.task = None
+        self.versions = None
+        self.event_ids = set()
+
+    def seed(self, versions, event_ids):
+        """Starts polling from the versions and events of the snapshot of a stream, unless already started. The
+        changes committed after the snapshot are then pushed, as the snapshot of a later stream was loaded after it
+        started following the feed"""
+        if self.versions is None:
+            self.versions, self.event_ids = dict(versions), set(event_ids)
+
+    async def poll(self):
+        while self.queues:
+            try:
+                await asyncio.sleep(LIVE_POLL_INTERVAL)
+                if self.versions is None:
+                    continue
+                current = await query(get_match_versions, self.match_ids)
+                changed = [match_id for match_id, version in current.items() if self.versions.get(match_id) != version]
+                if not changed:
+                    continue
+                versions, states, matchevents = await query(get_match_updates, changed)
+                self.versions.update(versions)
+                matchevents = [matchevent for matchevent in matchevents if matchevent['id'] not in self.event_ids]
+                self.event_ids.update(matchevent['id'] for matchevent in matchevents)
+                for queue in self.queues:
+                    for matchevent in matchevents:
+                        queue.put_nowait(('matchevent', matchevent, matchevent['id']))
+                    for state in states:
+                        queue.put_nowait(('match', state, None))
+            except Exception:
+                # The streams stay open, and get the changes once the database answers again
+                logger.exception('Could not poll the matches %s', self.match_ids)
+
+
+@asynccontextmanager
+async def follow(match_ids):
+    """Returns the feed of the matches and a queue of its (event, data, event id) messages, while in the block"""
+    key = tuple(match_ids)
+    feed = _feeds.get(key)
+    if feed is None:
+        feed = _feeds[key] = LiveFeed(match_ids)
+    queue = asyncio.Queue()
+    feed.queues.add(queue)
+    if feed.task is None or feed.task.done():
+        feed.task = asyncio.ensure_future(feed.poll())
+    try:
+        yield feed, queue
+    finally:
+        feed.queues.discard(queue)
+        if not feed.queues and _feeds.get(key) is feed:
+            del _feeds[key]
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def send_error(send, status, text):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+    await send({'type': 'http.response.body', 'body': text.encode()})
+
+
+def parse_event_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+async def live_application(scope, receive, send):
+    """ASGI application streaming the events of a match (/live/match/<id>/), or of the matches of a tournament on a
+    date (/live/tournament/<id>/?date=YYYY-MM-DD, today by default), as Server-Sent Events.
+
+    A stream starts with the events recorded after the Last-Event-ID header (sent by browsers when they reconnect)
+    or the last_event_id parameter, and the state of every match. It then sends a 'matchevent' message for each new
+    event and a 'match' message for each change of a match: its status, times, scores and counters."""
+    path = LIVE_PATH_RE.match(scope['path'])
+    if path is None:
+        return await send_error(send, 404, 'Not Found')
+    if scope['method'] != 'GET':
+        return await send_error(send, 405, 'Method Not Allowed')
+    parameters = parse_qs(scope['query_string'].decode('latin-1'))
+    headers = dict(scope['headers'])
+    last_event_id = parse_event_id(headers.get(b'last-event-id', b'').decode('latin-1') or
+                                   parameters.get('last_event_id', [None])[0])
+    try:
+        date = datetime.date.fromisoformat(parameters['date'][0]) if 'date' in parameters else timezone.localdate()
+    except ValueError:
+        return await send_error(send, 400, 'Bad Request')
+    match_ids = await query(get_match_ids, path.group(1), int(path.group(2)), date)
+    if not match_ids:
+        return await send_error(send, 404, 'Not Found')
+
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                            (b'x-accel-buffering', b'no')]})
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        async with follow(match_ids) as (feed, queue):
+            # Loaded once following the feed: the changes the poller finds from now on are queued, even those already
+            # in the snapshot, and the poller starts from this snapshot if it has not started yet
+            versions, states, matchevents = await query(get_match_updates, match_ids)
+            sent_event_ids = {matchevent['id'] for matchevent in matchevents}
+            feed.seed(versions, sent_event_ids)
+            messages = [f'retry: {LIVE_RETRY_MILLISECONDS}\n\n'.encode()]
+            messages += [format_message('matchevent', matchevent, matchevent['id']) for matchevent in matchevents
+                         if matchevent['id'] > last_event_id]
+            messages += [format_message('match', state) for state in states]
+            await send({'type': 'http.response.body', 'body': b''.join(messages), 'more_body': True})
+            while True:
+                message = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({message, disconnected}, timeout=LIVE_HEARTBEAT_INTERVAL,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if disconnected in done:
+                    message.cancel()
+                    break
+                if message not in done:
+                    message.cancel()
+                    await send({'type': 'http.response.body', 'body': b': heartbeat\n\n', 'more_body': True})
+                    continue
+                event, data, event_id = message.result()
+                if event_id is not None:
+                    # Already in the snapshot
+                    if event_id in sent_event_ids:
+                        continue
+                    sent_event_ids.add(event_id)
+                await send({'type': 'http.response.body', 'body': format_message(event, data, event_id),
+                            'more_body': True})
+    finally:
+        disconnected.cancel()
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.archive import ARCHIVE_LANGUAGES, archive_season
+from core.models import Season
+
+
+class Command(BaseCommand):
+    help = 'Renders the public pages of a closed season into static files under ARCHIVE_ROOT, served in their place'
+
+    def add_arguments(self, parser):
+        parser.add_argument('season_id', type=int)
+
+    def handle(self, *args, **options):
+        try:
+            season = Season.objects.get(id=options['season_id'])
+        except Season.DoesNotExist:
+            raise CommandError(f'There is no season {options["season_id"]}')
+        if not season.closed:
+            raise CommandError(f'The season {season} is not closed')
+        count = archive_season(season)
+        self.stdout.write(self.style.SUCCESS(f'Archived {count} pages of the season {season} in '
+                                             f'{", ".join(ARCHIVE_LANGUAGES)}'))
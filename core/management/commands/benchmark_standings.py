@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from core.models import Group
+from core.standings import get_standings
+
+
+class Command(BaseCommand):
+    help = 'Compares the standings engine with the per-team TeamTournamentRegistration.get_group_results'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tournament', type=int, help='Only the groups of this tournament')
+        parser.add_argument('--repeat', type=int, default=5, help='Number of timed runs of each implementation')
+
+    @staticmethod
+    def legacy_standings(groups):
+        standings = {}
+        for group in groups:
+            results = [(teamreg, teamreg.get_group_results(group.id)) for teamreg in group.teams.all()]
+            results.sort(reverse=True, key=lambda item: item[1]['idx'])
+            standings[group.id] = results
+        return standings
+
+    def measure(self, function, groups, repeat):
+        with CaptureQueriesContext(connection) as queries:
+            result = function(groups)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function(groups)
+        return result, len(queries), (time.perf_counter() - start) / repeat
+
+    def handle(self, *args, **options):
+        groups = Group.objects.all().order_by('id')
+        if options['tournament']:
+            groups = groups.filter(tournament_id=options['tournament'])
+        groups = list(groups)
+        legacy, legacy_queries, legacy_time = self.measure(self.legacy_standings, groups, options['repeat'])
+        engine, engine_queries, engine_time = self.measure(get_standings, groups, options['repeat'])
+        self.stdout.write(f'Groups: {len(groups)}')
+        self.stdout.write(f'get_group_results: {legacy_queries:6d} queries {legacy_time * 1000:10.2f} ms')
+        self.stdout.write(f'standings engine:  {engine_queries:6d} queries {engine_time * 1000:10.2f} ms')
+        mismatches = [group.id for group in groups
+                      if [(t.id, r) for t, r in legacy[group.id]] != [(t.id, r) for t, r in engine[group.id]]]
+        if mismatches:
+            self.stderr.write(self.style.ERROR(f'Different standings in groups {mismatches}'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Same standings in every group'))
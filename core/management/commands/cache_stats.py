@@ -0,0 +1,12 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Shows the hits, misses and evictions of the shared cache, counted by every worker'
+
+    def handle(self, *args, **options):
+        metrics = cache.get_metrics()
+        hit_rate = f'{metrics["hit_rate"]:.1%}' if metrics['hit_rate'] is not None else '-'
+        self.stdout.write(f'Hits: {metrics["hits"]}  Misses: {metrics["misses"]}  Hit rate: {hit_rate}  '
+                          f'Evictions: {metrics["evictions"]}')
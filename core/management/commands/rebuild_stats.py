@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.aggregates import refresh_person_stats, refresh_team_stats
+from core.models import Person, Team
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stored career stats from the matches and match events'
+
+    def handle(self, *args, **options):
+        stats = refresh_person_stats(Person.objects.values_list('id', flat=True))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the career stats of {len(stats)} people'))
+        stats = refresh_team_stats(Team.objects.values_list('id', flat=True))
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the all-time stats of {len(stats)} teams'))
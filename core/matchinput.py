@@ -0,0 +1,350 @@
+from collections import Counter
+from datetime import datetime
+
+import pytz
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from futebloco.settings import TIME_ZONE
+from .aggregates import add_stats_changes
+from .caching import get_or_compute
+from .models import MATCH_SUMMARY_EVENTTYPES, Match, MatchEvent, MatchEventType, MatchInputKey, \
+    PlayerTournamentRegistration
+from .pagecache import bump_tournament_versions
+from .registry import registry, STATUS_STARTED, STATUS_FINISHED
+
+# Seconds the rosters of a match are kept. They are dropped whenever the match or a player registration of its teams
+# changes (see invalidate_match_rosters), so this only bounds how long the rosters of past matches take up the cache
+MATCH_ROSTER_TIMEOUT = 60 * 60 * 24
+
+# Actions a batch may hold, so that a single upload does not keep its matches locked for long
+MATCH_INPUT_BATCH_SIZE = 500
+
+MATCH_INPUT_ACTIONS = ('start_match', 'finish_match', 'match_event')
+
+# Matches a matchday upload may hold, and events of a type a sheet may give a player, so that a typo in a count does
+# not create thousands of events
+MATCHDAY_MAX_MATCHES = 50
+MATCHDAY_MAX_EVENT_COUNT = 30
+
+
+def roster_key(match_id):
+    return f'match-roster:{match_id}'
+
+
+def get_match_roster(match_id):
+    """Returns the team registrations of a match and its players, as {'hometeamreg_id', 'awayteamreg_id', 'players':
+    {playerreg_id: (teamreg_id, shirtno, short name)}}, or None if there is no such match"""
+    def load_roster():
+        teamreg_ids = Match.objects.filter(id=match_id).values_list('hometeamreg_id', 'awayteamreg_id').first()
+        if teamreg_ids is None:
+            return None
+        players = PlayerTournamentRegistration.objects.filter(teamreg_id__in=teamreg_ids) \
+            .values_list('id', 'teamreg_id', 'shirtno', 'person__short')
+        return {'hometeamreg_id': teamreg_ids[0], 'awayteamreg_id': teamreg_ids[1],
+                'players': {playerreg_id: (teamreg_id, shirtno, short)
+                            for playerreg_id, teamreg_id, shirtno, short in players}}
+
+    return get_or_compute(roster_key(match_id), load_roster, MATCH_ROSTER_TIMEOUT,
+                          cacheable=lambda roster: roster is not None)
+
+
+def invalidate_match_rosters(match_ids=(), teamreg_ids=()):
+    if teamreg_ids:
+        match_ids = set(match_ids) | set(Match.objects.filter(Q(hometeamreg_id__in=teamreg_ids) |
+                                                              Q(awayteamreg_id__in=teamreg_ids))
+                                         .values_list('id', flat=True))
+    cache.delete_many([roster_key(match_id) for match_id in match_ids])
+
+
+def parse_id(value, name):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValidationError(f'Invalid {name}: {value!r}')
+
+
+def parse_timestamp(value):
+    """Returns the time of an ISO 8601 string, in TIME_ZONE when it has no offset"""
+    try:
+        timestamp = parse_datetime(value) if isinstance(value, str) else None
+    except ValueError:
+        timestamp = None
+    if timestamp is None:
+        raise ValidationError(f'Invalid timestamp: {value!r}')
+    return timestamp if timezone.is_aware(timestamp) else pytz.timezone(TIME_ZONE).localize(timestamp)
+
+
+def parse_match_input(data):
+    """Returns the validated action of a referee, as {'event', 'match', 'roster'} and for match events {'playerreg',
+    'eventtype'}, from the POST data of the match input page or from an item of a batch.
+
+    The match, player and event type are validated against cached rosters and reference tables, so that validating
+    costs no query. Raises ValidationError if the action, match, player or event type is invalid."""
+    action = data.get('event')
+    if action not in MATCH_INPUT_ACTIONS:
+        raise ValidationError(f'Invalid action: {action!r}')
+    match_id = parse_id(data.get('match'), 'match')
+    roster = get_match_roster(match_id)
+    if roster is None:
+        raise ValidationError(f'No match {match_id}')
+    parsed = {'event': action, 'match': match_id, 'roster': roster}
+    if action == 'match_event':
+        parsed['playerreg'] = parse_id(data.get('player'), 'player')
+        if parsed['playerreg'] not in roster['players']:
+            raise ValidationError(f'Player {parsed["playerreg"]} does not play match {match_id}')
+        try:
+            parsed['eventtype'] = registry.eventtype(str(data.get('eventtype')))
+        except MatchEventType.DoesNotExist:
+            raise ValidationError(f'Invalid event type: {data.get("eventtype")!r}')
+    return parsed
+
+
+def match_minutes(match, timestamp):
+    return (timestamp - match.actualstart).total_seconds() / 60 if match.actualstart is not None else 0
+
+
+def apply_match_input(match, parsed, timestamp):
+    """Applies a parsed action to a match: sets its status and time, or returns its new (unsaved) event.
+
+    The status only moves forward: starting a match already started or finished, or finishing a match already
+    finished (as both officials may, or a replayed upload), keeps the recorded status and time."""
+    started_id, finished_id = registry.status_id(STATUS_STARTED), registry.status_id(STATUS_FINISHED)
+    if parsed['event'] == 'start_match':
+        if match.status_id not in (started_id, finished_id):
+            match.actualstart = timestamp
+            match.status_id = started_id
+    elif parsed['event'] == 'finish_match':
+        if match.status_id != finished_id:
+            match.actualfinish = timestamp
+            match.status_id = finished_id
+    else:
+        teamreg_id = parsed['roster']['players'][parsed['playerreg']][0]
+        return MatchEvent(timestamp=timestamp, matchtimeminutes=match_minutes(match, timestamp), match=match,
+                          playerreg_id=parsed['playerreg'], teamreg_id=teamreg_id, eventtype=parsed['eventtype'])
+    return None
+
+
+def matchevent_row(matchevent, roster):
+    """Returns a new event of a match, as in the 'matchevent' messages of core.live"""
+    teamreg_id, shirtno, short = roster['players'][matchevent.playerreg_id]
+    return {'id': matchevent.id, 'match': matchevent.match_id, 'eventtype': matchevent.eventtype.name,
+            'side': 'home' if teamreg_id == roster['hometeamreg_id'] else 'away',
+            'minutes': matchevent.matchtimeminutes, 'playerreg': matchevent.playerreg_id, 'shirtno': shirtno,
+            'player': short}
+
+
+def match_counters(match):
+    """Returns the status, times, scores and counters of a match, as in the 'match' messages of core.live"""
+    counters = {'match': match.id, 'version': match.version, 'status': match.status_id,
+                'actualstart': match.actualstart, 'actualfinish': match.actualfinish,
+                'homescore': match.get_homescore(), 'awayscore': match.get_awayscore()}
+    for side in ('home', 'away'):
+        for field in MATCH_SUMMARY_EVENTTYPES:
+            counters[f'{side}{field}'] = getattr(match, f'{side}{field}')
+    return counters
+
+
+def save_match_changes(matches, matchevents):
+    """Saves the status and times of the matches and creates their new events in bulk, then updates the summaries
+    and versions of the matches, and adds the changes to the stats of their teams and players at once.
+
+    The events are created without their post_save signal, which would update the match and the stats once per
+    event. The matches must be locked by the current transaction."""
+    Match.objects.bulk_update(matches, ['status', 'actualstart', 'actualfinish'])
+    MatchEvent.objects.bulk_create(matchevents)
+    summaries = [match.update_summary() for match in matches]
+    bump_tournament_versions(group_ids={match.group_id for match in matches})
+    add_stats_changes(summaries, Counter((matchevent.playerreg_id, matchevent.eventtype_id)
+                                         for matchevent in matchevents))
+
+
+def record_match_input(data):
+    """Records a start_match, finish_match or match_event action of a referee, from the POST data of the match input
+    page. Raises ValidationError if the action is invalid (see parse_match_input).
+
+    The match is locked until the action is committed, so that the actions of the referee and the match official on
+    the same match are applied one after the other, each to the status and counters left by the previous one."""
+    parsed = parse_match_input(data)
+    with transaction.atomic():
+        match = Match.objects.select_for_update(no_key=True).get(id=parsed['match'])
+        timestamp = datetime.now(pytz.timezone(TIME_ZONE))
+        status_id = match.status_id
+        matchevent = apply_match_input(match, parsed, timestamp)
+        if matchevent is not None:
+            matchevent.save()
+        elif match.status_id != status_id:
+            match.save()
+
+
+def record_match_input_batch(items):
+    """Records a batch of actions recorded on a device, possibly offline, and returns the result of each of them.
+
+    Each item is an action as in record_match_input, with the 'key' the device gave it and the 'timestamp' it was
+    recorded at. The minutes of the events are computed from the recorded start of their match. An action whose key
+    was already recorded (a replayed upload) is not applied again, nor is a start or finish that would move the
+    status of its match backwards (see apply_match_input), and the valid items are recorded together in a single
+    transaction, whatever the invalid ones.
+
+    Returns {'results': [{'key', 'status': 'created', 'duplicate', 'applied', 'ignored' or 'invalid',
+    'matchevent' (the id of the recorded event, for duplicates) or 'error'}, ...], 'matches': [counters of each
+    changed match (see match_counters)]}."""
+    if not isinstance(items, list) or not 0 < len(items) <= MATCH_INPUT_BATCH_SIZE:
+        raise ValidationError(f'A batch holds from 1 to {MATCH_INPUT_BATCH_SIZE} actions')
+    results, parsed = [None] * len(items), {}
+    for index, item in enumerate(items):
+        key = item.get('key') if isinstance(item, dict) else None
+        try:
+            if not isinstance(key, str) or not 0 < len(key) <= MatchEvent._meta.get_field('clientkey').max_length:
+                raise ValidationError(f'Invalid key: {key!r}')
+            parsed[index] = dict(parse_match_input(item), key=key, timestamp=parse_timestamp(item.get('timestamp')))
+        except ValidationError as error:
+            results[index] = {'key': key, 'status': 'invalid', 'error': ' '.join(error.messages)}
+
+    keys = [item['key'] for item in parsed.values()]
+    with transaction.atomic():
+        # Locked until committed, so that the uploads and actions for the same matches are recorded one after the
+        # other (see record_match_input)
+        matches = Match.objects.select_for_update(no_key=True) \
+            .filter(id__in={item['match'] for item in parsed.values()}).order_by('id').in_bulk()
+        recorded = dict(MatchEvent.objects.filter(clientkey__in=keys).values_list('clientkey', 'id'))
+        # The keys of the starts and finishes, which have no event
+        recorded.update(dict.fromkeys(MatchInputKey.objects.filter(clientkey__in=keys).values_list('clientkey',
+                                                                                                   flat=True)))
+        changed, matchevents, inputkeys, duplicates = {}, {}, {}, []
+        for index, item in parsed.items():
+            if item['key'] in recorded or item['key'] in matchevents or item['key'] in inputkeys:
+                duplicates.append(index)
+                continue
+            match = matches[item['match']]
+            status_id = match.status_id
+            matchevent = apply_match_input(match, item, item['timestamp'])
+            if matchevent is not None:
+                matchevent.clientkey = item['key']
+                matchevents[item['key']] = (index, matchevent)
+            else:
+                inputkeys[item['key']] = MatchInputKey(clientkey=item['key'], match=match)
+                if match.status_id == status_id:
+                    results[index] = {'key': item['key'], 'status': 'ignored'}
+                    continue
+                results[index] = {'key': item['key'], 'status': 'applied'}
+            changed[match.id] = match
+        save_match_changes(list(changed.values()), [matchevent for _, matchevent in matchevents.values()])
+        MatchInputKey.objects.bulk_create(inputkeys.values())
+        # Not every database returns the ids of the rows created in bulk
+        recorded.update(MatchEvent.objects.filter(clientkey__in=matchevents).values_list('clientkey', 'id'))
+    for key, (index, matchevent) in matchevents.items():
+        matchevent.id = recorded[key]
+        results[index] = {'key': key, 'status': 'created',
+                          'matchevent': matchevent_row(matchevent, parsed[index]['roster'])}
+    for index in duplicates:
+        key = parsed[index]['key']
+        results[index] = {'key': key, 'status': 'duplicate', 'matchevent': recorded.get(key)}
+    return {'results': results, 'matches': [match_counters(match) for match in changed.values()]}
+
+
+def get_matchday(matches):
+    """Returns the matches of a matchday with the players of their teams and the events already recorded, as
+    [(match, [(teamreg, [(playerreg, [(eventtype name, recorded count), ...]), ...]) for home and away]), ...], in
+    three queries whatever the number of matches"""
+    matches = list(matches.select_related('hometeamreg__team', 'awayteamreg__team', 'group__tournament')
+                   .order_by('datetime', 'matchno'))
+    playerregs = {}
+    for playerreg in PlayerTournamentRegistration.objects.select_related('person') \
+            .filter(teamreg_id__in={teamreg_id for match in matches
+                                    for teamreg_id in (match.hometeamreg_id, match.awayteamreg_id)}) \
+            .order_by('person__name'):
+        playerregs.setdefault(playerreg.teamreg_id, []).append(playerreg)
+    eventtype_names = registry.eventtype_names()
+    recorded = {(row['match_id'], row['playerreg_id'], eventtype_names.get(row['eventtype_id'])): row['count']
+                for row in MatchEvent.objects.filter(match__in=[match.id for match in matches])
+                .values('match_id', 'playerreg_id', 'eventtype_id').annotate(count=Count('id'))}
+    return [(match, [(teamreg, [(playerreg, [(eventtype, recorded.get((match.id, playerreg.id, eventtype), 0))
+                                             for eventtype in MATCH_SUMMARY_EVENTTYPES.values()])
+                                for playerreg in playerregs.get(teamreg.id, [])])
+                     for teamreg in (match.hometeamreg, match.awayteamreg)])
+            for match in matches]
+
+
+def parse_matchday_sheets(sheets):
+    """Returns the final sheets of a matchday as {match_id: {'finished', 'events': [(playerreg_id, eventtype,
+    count), ...]}}, from [{'match', 'finished', 'events': [{'player', 'eventtype', 'count'}, ...]}, ...].
+
+    Only the format is validated here: the matches and players are validated by record_matchday. Raises
+    ValidationError with every error found."""
+    if not isinstance(sheets, list) or not 0 < len(sheets) <= MATCHDAY_MAX_MATCHES:
+        raise ValidationError(f'A matchday holds from 1 to {MATCHDAY_MAX_MATCHES} matches')
+    parsed, errors = {}, []
+    for sheet in sheets:
+        try:
+            if not isinstance(sheet, dict) or not isinstance(sheet.get('events', []), list):
+                raise ValidationError(f'Invalid sheet: {sheet!r}')
+            match_id = parse_id(sheet.get('match'), 'match')
+            if match_id in parsed:
+                raise ValidationError(f'Match {match_id} is given twice')
+            parsed[match_id] = {'finished': bool(sheet.get('finished')), 'events': []}
+        except ValidationError as error:
+            errors += error.messages
+            continue
+        for line in sheet.get('events', []):
+            try:
+                if not isinstance(line, dict):
+                    raise ValidationError(f'Invalid event: {line!r}')
+                playerreg_id = parse_id(line.get('player'), 'player')
+                try:
+                    eventtype = registry.eventtype(str(line.get('eventtype')))
+                except MatchEventType.DoesNotExist:
+                    raise ValidationError(f'Invalid event type: {line.get("eventtype")!r}')
+                count = parse_id(line.get('count', 1), 'count')
+                if not 0 <= count <= MATCHDAY_MAX_EVENT_COUNT:
+                    raise ValidationError(f'Invalid count: {count} (at most {MATCHDAY_MAX_EVENT_COUNT})')
+            except ValidationError as error:
+                errors += [f'Match {match_id}: {message}' for message in error.messages]
+                continue
+            if count:
+                parsed[match_id]['events'].append((playerreg_id, eventtype, count))
+    if errors:
+        raise ValidationError(errors)
+    return parsed
+
+
+def record_matchday(sheets):
+    """Records the final sheets of the matches of a matchday (see parse_matchday_sheets): the scorers, cards and
+    fouls of each match, and whether it is finished. Returns {'created': number of events created, 'matches':
+    [counters of each match (see match_counters)]}.
+
+    The events are added to those already recorded, without minutes, as the sheets do not give them. Every player is
+    validated against the registrations of the teams of their match, in a single query, and nothing is recorded
+    unless every sheet is valid: ValidationError then lists every error. The events and status changes are written
+    in a single transaction, with a single refresh of the stats of the teams (see save_match_changes)."""
+    sheets = parse_matchday_sheets(sheets)
+    with transaction.atomic():
+        # Locked as in record_match_input_batch, so that a referee's input on the same matches waits for the sheets
+        matches = Match.objects.select_for_update(no_key=True).filter(id__in=sheets).order_by('id').in_bulk()
+        teamreg_ids = dict(PlayerTournamentRegistration.objects
+                           .filter(id__in={playerreg_id for sheet in sheets.values()
+                                           for playerreg_id, _, _ in sheet['events']})
+                           .values_list('id', 'teamreg_id'))
+        errors, matchevents = [], []
+        for match_id, sheet in sheets.items():
+            match = matches.get(match_id)
+            if match is None:
+                errors.append(f'No match {match_id}')
+                continue
+            if sheet['finished']:
+                match.status_id = registry.status_id(STATUS_FINISHED)
+            for playerreg_id, eventtype, count in sheet['events']:
+                teamreg_id = teamreg_ids.get(playerreg_id)
+                if teamreg_id is None or teamreg_id not in (match.hometeamreg_id, match.awayteamreg_id):
+                    errors.append(f'Player {playerreg_id} does not play match {match_id}')
+                    continue
+                matchevents += [MatchEvent(match=match, playerreg_id=playerreg_id, teamreg_id=teamreg_id,
+                                           eventtype=eventtype) for _ in range(count)]
+        if errors:
+            raise ValidationError(errors)
+        save_match_changes(list(matches.values()), matchevents)
+    return {'created': len(matchevents), 'matches': [match_counters(match) for match in matches.values()]}
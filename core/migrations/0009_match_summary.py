@@ -0,0 +1,96 @@
+# Generated by Django 3.2.23 on 2026-10-17 17:14
+
+from django.db import migrations, models
+from django.db.models import Count
+
+SUMMARY_EVENTTYPES = {
+    'goals': 'goal',
+    'owngoals': 'own goal',
+    'tiebreakgoals': 'tie-break penalty goal',
+    'fouls': 'foul',
+    'yellowcards': 'yellow card',
+    'redcards': 'red card',
+}
+
+
+def fill_match_summary(apps, schema_editor):
+    Match = apps.get_model('core', 'Match')
+    MatchEvent = apps.get_model('core', 'MatchEvent')
+    counts = {(row['match_id'], row['teamreg_id'], row['eventtype__name']): row['count'] for row in
+              MatchEvent.objects.values('match_id', 'teamreg_id', 'eventtype__name').annotate(count=Count('id'))}
+    for match in Match.objects.filter(id__in={key[0] for key in counts}):
+        for side, teamreg_id in (('home', match.hometeamreg_id), ('away', match.awayteamreg_id)):
+            for field, eventtype in SUMMARY_EVENTTYPES.items():
+                setattr(match, f'{side}{field}', counts.get((match.id, teamreg_id, eventtype), 0))
+        match.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_matcheventtype_name_ptbr'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='awayfouls',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='awaygoals',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='awayowngoals',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='awayredcards',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='awaytiebreakgoals',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='awayyellowcards',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='homefouls',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='homegoals',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='homeowngoals',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='homeredcards',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='hometiebreakgoals',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='homeyellowcards',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_match_summary, migrations.RunPython.noop),
+    ]
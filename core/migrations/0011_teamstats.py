@@ -0,0 +1,42 @@
+# Generated by Django 3.2.23 on 2026-10-17 17:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_personstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tournaments', models.IntegerField(default=0)),
+                ('matches', models.IntegerField(default=0)),
+                ('wins', models.IntegerField(default=0)),
+                ('draws', models.IntegerField(default=0)),
+                ('losses', models.IntegerField(default=0)),
+                ('goalsscored', models.IntegerField(default=0)),
+                ('goalsconceded', models.IntegerField(default=0)),
+                ('tiebreakgoalsscored', models.IntegerField(default=0)),
+                ('tiebreakgoalsconceded', models.IntegerField(default=0)),
+                ('fouls', models.IntegerField(default=0)),
+                ('foulsagainst', models.IntegerField(default=0)),
+                ('yellowcards', models.IntegerField(default=0)),
+                ('redcards', models.IntegerField(default=0)),
+                ('owngoals', models.IntegerField(default=0)),
+                ('cleansheets', models.IntegerField(default=0)),
+                ('titles', models.IntegerField(default=0)),
+                ('runnerups', models.IntegerField(default=0)),
+                ('thirdplaces', models.IntegerField(default=0)),
+                ('team', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stats', to='core.team')),
+            ],
+            options={
+                'verbose_name_plural': 'Team stats',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.23 on 2026-10-17 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_teamstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['hometeamreg', 'group', 'status'], name='match_home_group_status'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['awayteamreg', 'group', 'status'], name='match_away_group_status'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['group', 'datetime'], name='match_group_datetime'),
+        ),
+        migrations.AddIndex(
+            model_name='matchevent',
+            index=models.Index(fields=['match', 'teamreg', 'eventtype'], include=('playerreg',), name='matchevent_match_team_type'),
+        ),
+        migrations.AddIndex(
+            model_name='matchevent',
+            index=models.Index(fields=['playerreg', 'eventtype'], name='matchevent_player_type'),
+        ),
+        migrations.AddIndex(
+            model_name='matchevent',
+            index=models.Index(fields=['playerreg', 'match', 'eventtype'], name='matchevent_player_match_type'),
+        ),
+        migrations.AddIndex(
+            model_name='matchevent',
+            index=models.Index(fields=['teamreg', 'eventtype'], name='matchevent_team_type'),
+        ),
+    ]
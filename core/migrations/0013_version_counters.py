@@ -0,0 +1,23 @@
+# Generated by Django 3.2.23 on 2026-10-17 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='season',
+            name='version',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='version',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
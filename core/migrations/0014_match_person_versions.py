@@ -0,0 +1,23 @@
+# Generated by Django 3.2.23 on 2026-10-17 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_version_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='version',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='person',
+            name='version',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
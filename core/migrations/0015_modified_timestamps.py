@@ -0,0 +1,23 @@
+# Generated by Django 3.2.23 on 2026-10-17 17:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_match_person_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='season',
+            name='modified',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='modified',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
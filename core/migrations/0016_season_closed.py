@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-17 17:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_modified_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='season',
+            name='closed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.23 on 2026-10-17 18:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_season_closed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchevent',
+            name='clientkey',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
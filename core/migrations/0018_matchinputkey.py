@@ -0,0 +1,22 @@
+# Generated by Django 3.2.23 on 2026-10-17 18:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_matchevent_clientkey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchInputKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clientkey', models.CharField(max_length=64, unique=True)),
+                ('match', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.match')),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def check_stats(apps, schema_editor):
+    # The stats are only built by the changes to the matches, as reading them no longer builds the missing records.
+    # They are not backfilled here, where only the models of this migration could be used: the rebuild_stats command
+    # builds them with the current code, once the database is migrated
+    MatchEvent, PersonStats = apps.get_model('core', 'MatchEvent'), apps.get_model('core', 'PersonStats')
+    if MatchEvent.objects.using(schema_editor.connection.alias).exists() and \
+            not PersonStats.objects.using(schema_editor.connection.alias).exists():
+        print('\n  The career stats are empty: run "python manage.py rebuild_stats" once migrated')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_matchinputkey'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_stats, migrations.RunPython.noop, elidable=True),
+    ]
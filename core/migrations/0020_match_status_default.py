@@ -0,0 +1,20 @@
+# Generated by Django 3.2.23 on 2026-10-17 18:46
+
+import core.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_backfill_stats'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='match',
+            name='status',
+            field=models.ForeignKey(default=core.models.get_scheduled_status_id, on_delete=django.db.models.deletion.CASCADE, to='core.matchstatus'),
+        ),
+    ]
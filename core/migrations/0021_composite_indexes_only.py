@@ -0,0 +1,52 @@
+# Generated by Django 3.2.23 on 2026-10-17 18:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_match_status_default'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='matchevent',
+            name='matchevent_match_team_type',
+        ),
+        migrations.AlterField(
+            model_name='match',
+            name='awayteamreg',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='awayteamreg', to='core.teamtournamentregistration'),
+        ),
+        migrations.AlterField(
+            model_name='match',
+            name='group',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.group'),
+        ),
+        migrations.AlterField(
+            model_name='match',
+            name='hometeamreg',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='hometeamreg', to='core.teamtournamentregistration'),
+        ),
+        migrations.AlterField(
+            model_name='matchevent',
+            name='match',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.match'),
+        ),
+        migrations.AlterField(
+            model_name='matchevent',
+            name='playerreg',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.playertournamentregistration'),
+        ),
+        migrations.AlterField(
+            model_name='matchevent',
+            name='teamreg',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.teamtournamentregistration'),
+        ),
+        migrations.AddIndex(
+            model_name='matchevent',
+            index=models.Index(fields=['match', 'teamreg', 'eventtype'], name='matchevent_match_team_type'),
+        ),
+    ]
@@ -1,13 +1,61 @@
 import datetime
+import functools
+import inspect
 import os
 import uuid
 
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Count
+from django.db import models, transaction
+from django.db.models import Count, F
 from stdimage import StdImageField
 from dynamic_filenames import FilePattern
 
+from .registry import registry, GAMESTAGE_GROUP, STATUS_SCHEDULED, STATUS_STARTED
+
+
+# Match summary fields (prefixed with 'home'/'away') and the event types they count
+MATCH_SUMMARY_EVENTTYPES = {
+    'goals': 'goal',
+    'owngoals': 'own goal',
+    'tiebreakgoals': 'tie-break penalty goal',
+    'fouls': 'foul',
+    'yellowcards': 'yellow card',
+    'redcards': 'red card',
+}
+
+
+def memoized(method):
+    """Caches the result of a model method on the instance, per call arguments (model instances by their pk)"""
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        key = (method.__name__, ) + tuple(getattr(arg, 'pk', arg) for arg in args)
+        memo = self.__dict__.setdefault('_memo', {})
+        if key not in memo:
+            memo[key] = method(self, *args)
+        return memo[key]
+    return wrapper
+
+
+class MemoizedGettersMixin:
+    """Memoizes the get_* and is_* methods of a model, so that repeated calls on an instance (as in templates) only
+    compute them once. The memo lives as long as the instance, and is cleared when it is saved or reloaded"""
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name, value in list(vars(cls).items()):
+            if name.startswith(('get_', 'is_')) and inspect.isfunction(value):
+                setattr(cls, name, memoized(value))
+
+    def clear_memo(self):
+        self.__dict__.pop('_memo', None)
+
+    def save(self, *args, **kwargs):
+        self.clear_memo()
+        super().save(*args, **kwargs)
+
+    def refresh_from_db(self, *args, **kwargs):
+        self.clear_memo()
+        super().refresh_from_db(*args, **kwargs)
+
 
 def get_file_path(_instance, filename):
     """Generates a file name to store images"""
@@ -31,6 +79,11 @@ class Genre(models.Model):
 
 class Season(models.Model):
     name = models.CharField(name='name', max_length=255)
+    # Bumped on every change to the season and tournament menus shown in every page, see core.pagecache
+    version = models.IntegerField(name='version', default=0, editable=False)
+    modified = models.DateTimeField(name='modified', null=True, blank=True, editable=False)
+    # A closed season no longer changes, and its pages may be archived as static files, see core.archive
+    closed = models.BooleanField(name='closed', default=False)
 
     def __str__(self):
         return self.name
@@ -42,6 +95,9 @@ class Tournament(models.Model):
     competition = models.ForeignKey(to=Competition, on_delete=models.CASCADE)
     genre = models.ForeignKey(to=Genre, on_delete=models.CASCADE)
     season = models.ForeignKey(to=Season, on_delete=models.CASCADE)
+    # Bumped on every change to the data shown in the tournament pages, see core.pagecache
+    version = models.IntegerField(name='version', default=0, editable=False)
+    modified = models.DateTimeField(name='modified', null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -54,7 +110,7 @@ class Role(models.Model):
         return self.name
 
 
-class Person(models.Model):
+class Person(MemoizedGettersMixin, models.Model):
     name = models.CharField(name='name', max_length=255)
     short = models.CharField(name='short', max_length=255)
     doc = models.CharField(name='doc', max_length=14, null=True, blank=True, unique=True)
@@ -75,62 +131,65 @@ class Person(models.Model):
     instagram = models.URLField(name='instagram', max_length=255, null=True, blank=True)
     hood = models.CharField(name='hood', max_length=50, null=True, blank=True)
     summary = models.TextField(name='summary', null=True, blank=True)
+    # Bumped on every change to the data shown in the player boxes of the person, see core.pagecache
+    version = models.IntegerField(name='version', default=0, editable=False)
 
     def get_age(self):
         now = datetime.datetime.now()
         return now.year - self.dob.year - int((now.month, now.day) < (self.dob.month, self.dob.day))
 
+    def get_stats(self):
+        """Returns the career stats record of the person, kept up to date as the matches change (see core.aggregates).
+        Without a record, the person has not played yet"""
+        try:
+            return self.stats
+        except PersonStats.DoesNotExist:
+            return PersonStats(person_id=self.id)
+
     def get_tournament_count(self):
-        return PlayerTournamentRegistration.objects.filter(person=self).count()
+        return self.get_stats().tournaments
 
     def get_match_count(self):
-        return sum([playerreg.teamreg.get_match_count() for playerreg in
-                    PlayerTournamentRegistration.objects.filter(person=self)])
+        return self.get_stats().matches
 
     def get_goal_count(self):
-        return MatchEvent.objects.filter(eventtype__name='goal', playerreg__person=self).count()
+        return self.get_stats().goals
 
     def get_owngoal_count(self):
-        return MatchEvent.objects.filter(eventtype__name='own goal', playerreg__person=self).count()
+        return self.get_stats().owngoals
 
     def get_win_count(self):
-        return sum([playerreg.teamreg.get_win_count() for playerreg in
-                    PlayerTournamentRegistration.objects.filter(person=self)])
+        return self.get_stats().wins
 
     def get_draw_count(self):
-        return sum([playerreg.teamreg.get_draw_count() for playerreg in
-                    PlayerTournamentRegistration.objects.filter(person=self)])
+        return self.get_stats().draws
 
     def get_loss_count(self):
-        return sum([playerreg.teamreg.get_loss_count() for playerreg in
-                    PlayerTournamentRegistration.objects.filter(person=self)])
+        return self.get_stats().losses
 
     def get_tiebreakgoal_count(self):
-        return sum([playerreg.teamreg.get_tiebreakgoalscored_count() for playerreg in
-                    PlayerTournamentRegistration.objects.filter(person=self)])
+        return self.get_stats().tiebreakgoals
 
     def get_foul_count(self):
-        return MatchEvent.objects.filter(eventtype__name='foul', playerreg__person=self).count()
+        return self.get_stats().fouls
 
     def get_yellowcard_count(self):
-        return MatchEvent.objects.filter(eventtype__name='yellow card', playerreg__person=self).count()
+        return self.get_stats().yellowcards
 
     def get_redcard_count(self):
-        return MatchEvent.objects.filter(eventtype__name='red card', playerreg__person=self).count()
+        return self.get_stats().redcards
 
     def get_goalconceded_count(self):
-        return sum([playerreg.teamreg.get_goalconceded_count() for playerreg in
-                    PlayerTournamentRegistration.objects.filter(person=self)])
+        return self.get_stats().goalsconceded
 
     def get_cleansheet_count(self):
-        return sum(playerreg.teamreg.get_cleansheet_count() for playerreg in
-                   PlayerTournamentRegistration.objects.filter(person=self))
+        return self.get_stats().cleansheets
 
     def __str__(self):
         return self.name
 
 
-class Team(models.Model):
+class Team(MemoizedGettersMixin, models.Model):
     name = models.CharField(name='name', max_length=255)
     genre = models.ForeignKey(to=Genre, on_delete=models.CASCADE)
     admin = models.ForeignKey(to=Person, on_delete=models.CASCADE)
@@ -150,87 +209,73 @@ class Team(models.Model):
     twitter = models.URLField(name='twitter', max_length=255, null=True, blank=True)
     youtube = models.URLField(name='youtube', max_length=255, null=True, blank=True)
 
+    def get_stats(self):
+        """Returns the all-time stats record of the team, kept up to date as the matches change (see core.aggregates).
+        Without a record, the team has not played yet"""
+        try:
+            return self.stats
+        except TeamStats.DoesNotExist:
+            return TeamStats(team_id=self.id)
+
     def get_tournament_count(self):
-        return TeamTournamentRegistration.objects.filter(team_id=self.id).count()
+        return self.get_stats().tournaments
 
     def get_match_count(self):
-        return Match.objects.filter(hometeamreg__team__id=self.id).count() \
-            + Match.objects.filter(awayteamreg__team__id=self.id).count()
+        return self.get_stats().matches
 
     def get_win_count(self):
-        return sum([match.is_homewin() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.is_awaywin() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().wins
 
     def get_draw_count(self):
-        return sum([match.is_draw() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.is_draw() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().draws
 
     def get_loss_count(self):
-        return sum([match.is_awaywin() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.is_homewin() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().losses
 
     def get_goalscored_count(self):
-        return sum([match.get_homescore() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.get_awayscore() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().goalsscored
 
     def get_goalconceded_count(self):
-        return sum([match.get_awayscore() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.get_homescore() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().goalsconceded
 
     def get_tiebreakgoalscored_count(self):
-        return sum([match.get_hometiebreakscore() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.get_awaytiebreakscore() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().tiebreakgoalsscored
 
     def get_tiebreakgoalconceded_count(self):
-        return sum([match.get_awaytiebreakscore() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.get_hometiebreakscore() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().tiebreakgoalsconceded
 
     def get_foul_count(self):
-        return sum([match.get_homefouls() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.get_awayfouls() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().fouls
 
     def get_foulagainst_count(self):
-        return sum([match.get_awayfouls() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.get_homefouls() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().foulsagainst
 
     def get_yellowcard_count(self):
-        return sum([match.get_homeyellowcards() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.get_awayyellowcards() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().yellowcards
 
     def get_redcard_count(self):
-        return sum([match.get_homeredcards() for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.get_awayredcards() for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().redcards
 
     def get_owngoal_count(self):
-        return MatchEvent.objects.filter(teamreg__team__id=self.id, eventtype__name='own goal').count()
+        return self.get_stats().owngoals
 
     def get_cleansheet_count(self):
-        return sum([match.get_awayscore() == 0 for match in Match.objects.filter(hometeamreg__team__id=self.id)]) \
-            + sum([match.get_homescore() == 0 for match in Match.objects.filter(awayteamreg__team__id=self.id)])
+        return self.get_stats().cleansheets
 
     def get_title_count(self):
-        return sum([match.is_homewin() for match in Match.objects.filter(hometeamreg__team__id=self.id,
-                                                                         group__gamestage__id=3)]) \
-            + sum([match.is_awaywin() for match in Match.objects.filter(awayteamreg__team__id=self.id,
-                                                                        group__gamestage__id=3)])
+        return self.get_stats().titles
 
     def get_runnerup_count(self):
-        return sum([match.is_awaywin() for match in Match.objects.filter(hometeamreg__team__id=self.id,
-                                                                         group__gamestage__id=3)]) \
-            + sum([match.is_homewin() for match in Match.objects.filter(awayteamreg__team__id=self.id,
-                                                                        group__gamestage__id=3)])
+        return self.get_stats().runnerups
 
     def get_thirdplace_count(self):
-        return sum([match.is_homewin() for match in Match.objects.filter(hometeamreg__team__id=self.id,
-                                                                         group__gamestage__id=2)]) \
-            + sum([match.is_awaywin() for match in Match.objects.filter(awayteamreg__team__id=self.id,
-                                                                        group__gamestage__id=2)])
+        return self.get_stats().thirdplaces
 
     def __str__(self):
         return self.name
 
 
-class TeamTournamentRegistration(models.Model):
+class TeamTournamentRegistration(MemoizedGettersMixin, models.Model):
     tournament = models.ForeignKey(to=Tournament, on_delete=models.CASCADE)
     team = models.ForeignKey(to=Team, on_delete=models.CASCADE)
     capitain = models.ForeignKey(to=Person, on_delete=models.CASCADE)
@@ -242,8 +287,9 @@ class TeamTournamentRegistration(models.Model):
     def get_group_results(self, group_id):
         result = {'matches': 0, 'wins': 0, 'draws': 0, 'losses': 0, 'goalsscored': 0, 'goalsconceded': 0,
                   'goaldifference': 0, 'tiebreakgoals': 0, 'fouls': 0, 'yellowcards': 0, 'redcards': 0}
+        scheduled_id = registry.status_id(STATUS_SCHEDULED)
         # Results when playing as home team
-        for match in Match.objects.filter(hometeamreg_id=self.id, group_id=group_id, status__id__gt=1):
+        for match in Match.objects.filter(hometeamreg_id=self.id, group_id=group_id).exclude(status_id=scheduled_id):
             result['matches'] += 1
             result['wins'] += match.is_homewin()
             result['draws'] += match.is_draw()
@@ -256,7 +302,7 @@ class TeamTournamentRegistration(models.Model):
             result['yellowcards'] += match.get_homeyellowcards()
             result['redcards'] += match.get_homeredcards()
         # Result when playing as away team
-        for match in Match.objects.filter(awayteamreg_id=self.id, group_id=group_id, status__id__gt=1):
+        for match in Match.objects.filter(awayteamreg_id=self.id, group_id=group_id).exclude(status_id=scheduled_id):
             result['matches'] += 1
             result['wins'] += match.is_awaywin()
             result['draws'] += match.is_draw()
@@ -306,13 +352,13 @@ class TeamTournamentRegistration(models.Model):
             + sum([match.get_homescore() == 0 for match in Match.objects.filter(awayteamreg=self)])
 
     def get_foul_count(self):
-        return MatchEvent.objects.filter(teamreg=self, eventtype__name='foul').count()
+        return MatchEvent.objects.filter(teamreg=self, eventtype_id=registry.eventtype_id('foul')).count()
 
     def get_yellowcard_count(self):
-        return MatchEvent.objects.filter(teamreg=self, eventtype__name='yellow card').count()
+        return MatchEvent.objects.filter(teamreg=self, eventtype_id=registry.eventtype_id('yellow card')).count()
 
     def get_redcard_count(self):
-        return MatchEvent.objects.filter(teamreg=self, eventtype__name='red card').count()
+        return MatchEvent.objects.filter(teamreg=self, eventtype_id=registry.eventtype_id('red card')).count()
 
     def get_fairplay_score(self):
         return self.get_foul_count() / self.get_match_count() if self.get_match_count() > 0 else 1000
@@ -334,46 +380,58 @@ class Group(models.Model):
     gamestage = models.ForeignKey(to=GameStage, on_delete=models.CASCADE)
     teams = models.ManyToManyField(to=TeamTournamentRegistration)
 
+    def is_group_stage(self):
+        return self.gamestage_id == registry.gamestage_id(GAMESTAGE_GROUP)
+
     def get_results(self):
-        results = [(teamreg, teamreg.get_group_results(self.id)) for teamreg in self.teams.all()]
-        results.sort(reverse=True, key=lambda item: item[1]['idx'])
-        return results
+        from .standings import get_group_standings
+        return get_group_standings(self)
 
     def __str__(self):
         return self.name
 
 
-class PlayerTournamentRegistration(models.Model):
+class PlayerTournamentRegistration(MemoizedGettersMixin, models.Model):
     person = models.ForeignKey(to=Person, on_delete=models.CASCADE)
     teamreg = models.ForeignKey(to=TeamTournamentRegistration, on_delete=models.CASCADE)
     position = models.CharField(name='position', max_length=20, null=True, blank=True)
     shirtno = models.CharField(name='shirtno', max_length=10)
 
     def get_goal_count(self):
-        return MatchEvent.objects.filter(eventtype__name='goal', playerreg=self).count()
+        return MatchEvent.objects.filter(eventtype_id=registry.eventtype_id('goal'), playerreg=self).count()
 
     def get_goal_count_at_match(self, match):
-        return MatchEvent.objects.filter(eventtype__name='goal', playerreg=self, match=match).count()
+        return MatchEvent.objects.filter(eventtype_id=registry.eventtype_id('goal'), playerreg=self,
+                                         match=match).count()
 
     def get_owngoal_count_at_match(self, match):
-        return MatchEvent.objects.filter(eventtype__name='own goal', playerreg=self, match=match).count()
+        return MatchEvent.objects.filter(eventtype_id=registry.eventtype_id('own goal'), playerreg=self,
+                                         match=match).count()
 
     def get_foul_count_at_match(self, match):
-        return MatchEvent.objects.filter(eventtype__name='foul', playerreg=self, match=match).count()
+        return MatchEvent.objects.filter(eventtype_id=registry.eventtype_id('foul'), playerreg=self,
+                                         match=match).count()
 
     def get_yellowcard_count_at_match(self, match):
-        return MatchEvent.objects.filter(eventtype__name='yellow card', playerreg=self, match=match).count()
+        return MatchEvent.objects.filter(eventtype_id=registry.eventtype_id('yellow card'), playerreg=self,
+                                         match=match).count()
 
     def get_redcard_count_at_match(self, match):
-        return MatchEvent.objects.filter(eventtype__name='red card', playerreg=self, match=match).count()
+        return MatchEvent.objects.filter(eventtype_id=registry.eventtype_id('red card'), playerreg=self,
+                                         match=match).count()
 
     def get_tiebreakgoal_count_at_match(self, match):
-        return MatchEvent.objects.filter(eventtype__name='tie-break penalty goal', playerreg=self, match=match).count()
+        return MatchEvent.objects.filter(eventtype_id=registry.eventtype_id('tie-break penalty goal'), playerreg=self,
+                                         match=match).count()
 
     def __str__(self):
         return f'Registry: ({self.teamreg}) <-> ({self.person}) Shirt ({self.shirtno})'
 
 
+def get_scheduled_status_id():
+    return registry.status_id(STATUS_SCHEDULED)
+
+
 class MatchStatus(models.Model):
     name = models.CharField(name='name', max_length=11)
 
@@ -393,40 +451,105 @@ class Venue(models.Model):
         return self.name
 
 
-class Match(models.Model):
+class MatchQuerySet(models.QuerySet):
+    def with_stats(self):
+        """Loads the related objects shown in match lists and results. The scoreline and the event counters are
+        stored in the match row, so the whole list comes with its stats in a single query"""
+        return self.select_related('venue', 'status', 'group__tournament', 'group__gamestage',
+                                   'hometeamreg__team', 'awayteamreg__team')
+
+
+class Match(MemoizedGettersMixin, models.Model):
     matchno = models.IntegerField(name='matchno')
-    group = models.ForeignKey(to=Group, on_delete=models.CASCADE)
-    hometeamreg = models.ForeignKey(to=TeamTournamentRegistration, related_name='hometeamreg', on_delete=models.CASCADE)
-    awayteamreg = models.ForeignKey(to=TeamTournamentRegistration, related_name='awayteamreg', on_delete=models.CASCADE)
+    # Indexed by the composite indexes of Meta, that lead with them
+    group = models.ForeignKey(to=Group, on_delete=models.CASCADE, db_index=False)
+    hometeamreg = models.ForeignKey(to=TeamTournamentRegistration, related_name='hometeamreg', on_delete=models.CASCADE,
+                                    db_index=False)
+    awayteamreg = models.ForeignKey(to=TeamTournamentRegistration, related_name='awayteamreg', on_delete=models.CASCADE,
+                                    db_index=False)
     datetime = models.DateTimeField(name='datetime', null=True, blank=True)
     actualstart = models.DateTimeField(name='actualstart', null=True, blank=True)
     actualfinish = models.DateTimeField(name='actualfinish', null=True, blank=True)
     refree = models.ForeignKey(to=Person, null=True, blank=True, related_name='refree', on_delete=models.SET_NULL)
     matchofficial = models.ForeignKey(to=Person, null=True, blank=True, related_name='matchofficial',
                                       on_delete=models.SET_NULL)
-    status = models.ForeignKey(to=MatchStatus, on_delete=models.CASCADE, default=1)
+    status = models.ForeignKey(to=MatchStatus, on_delete=models.CASCADE, default=get_scheduled_status_id)
     venue = models.ForeignKey(to=Venue, on_delete=models.CASCADE)
     summarytext = models.TextField(name='summarytext', null=True, blank=True)
     summaryphoto = models.ImageField(name='summaryphoto', null=True, blank=True, upload_to='match_summaries')
+    # Scoreline and counters, kept in sync with the match events by update_summary()
+    homegoals = models.IntegerField(name='homegoals', default=0)
+    awaygoals = models.IntegerField(name='awaygoals', default=0)
+    homeowngoals = models.IntegerField(name='homeowngoals', default=0)
+    awayowngoals = models.IntegerField(name='awayowngoals', default=0)
+    hometiebreakgoals = models.IntegerField(name='hometiebreakgoals', default=0)
+    awaytiebreakgoals = models.IntegerField(name='awaytiebreakgoals', default=0)
+    homefouls = models.IntegerField(name='homefouls', default=0)
+    awayfouls = models.IntegerField(name='awayfouls', default=0)
+    homeyellowcards = models.IntegerField(name='homeyellowcards', default=0)
+    awayyellowcards = models.IntegerField(name='awayyellowcards', default=0)
+    homeredcards = models.IntegerField(name='homeredcards', default=0)
+    awayredcards = models.IntegerField(name='awayredcards', default=0)
+    # Bumped on every change to the data shown in the match cards, see core.pagecache
+    version = models.IntegerField(name='version', default=0, editable=False)
+
+    objects = MatchQuerySet.as_manager()
 
     class Meta:
         verbose_name_plural = 'Matches'
+        indexes = [
+            models.Index(fields=['hometeamreg', 'group', 'status'], name='match_home_group_status'),
+            models.Index(fields=['awayteamreg', 'group', 'status'], name='match_away_group_status'),
+            models.Index(fields=['group', 'datetime'], name='match_group_datetime'),
+        ]
+
+    @transaction.atomic
+    def update_summary(self):
+        """Recounts the match events and stores the scoreline and counters in the match row.
+
+        Returns the (previous, current) summaries of the match, as unsaved matches with the gamestage_id of their group,
+        for the stats to add the difference (see core.aggregates.add_stats_changes)"""
+        # Locking the match before counting serializes concurrent recounts, so that the last one stored counts every
+        # committed event. Unlike FOR UPDATE, the lock does not wait for the key share locks taken by inserting events
+        summary_fields = [f'{side}{field}' for side in ('home', 'away') for field in MATCH_SUMMARY_EVENTTYPES]
+        stored = Match.objects.select_for_update(no_key=True, of=('self', )).filter(id=self.id) \
+            .values('group_id', 'hometeamreg_id', 'awayteamreg_id', 'status_id', 'group__gamestage_id',
+                    *summary_fields).get()
+        gamestage_id = stored.pop('group__gamestage_id')
+        previous = Match(id=self.id, **stored)
+        eventtype_names = registry.eventtype_names()
+        counts = {(row['teamreg_id'], eventtype_names.get(row['eventtype_id'])): row['count'] for row in
+                  MatchEvent.objects.filter(match_id=self.id).values('teamreg_id', 'eventtype_id')
+                  .annotate(count=Count('id'))}
+        summary = {f'{side}{field}': counts.get((teamreg_id, eventtype), 0)
+                   for side, teamreg_id in (('home', self.hometeamreg_id), ('away', self.awayteamreg_id))
+                   for field, eventtype in MATCH_SUMMARY_EVENTTYPES.items()}
+        Match.objects.filter(id=self.id).update(**summary, version=F('version') + 1)
+        for field, value in summary.items():
+            setattr(self, field, value)
+        self.refresh_from_db(fields=['version'])
+        current = Match(id=self.id, **dict(stored, **summary))
+        previous.gamestage_id = current.gamestage_id = gamestage_id
+        return previous, current
 
     def get_homescore(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.hometeamreg, eventtype__name='goal').count() \
-            + MatchEvent.objects.filter(match_id=self.id, teamreg=self.awayteamreg, eventtype__name='own goal').count()
+        return self.homegoals + self.awayowngoals
 
     def get_awayscore(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.awayteamreg, eventtype__name='goal').count() \
-            + MatchEvent.objects.filter(match_id=self.id, teamreg=self.hometeamreg, eventtype__name='own goal').count()
+        return self.awaygoals + self.homeowngoals
 
     def get_hometiebreakscore(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.hometeamreg,
-                                         eventtype__name='tie-break penalty goal').count()
+        return self.hometiebreakgoals
 
     def get_awaytiebreakscore(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.awayteamreg,
-                                         eventtype__name='tie-break penalty goal').count()
+        return self.awaytiebreakgoals
+
+    def is_played(self):
+        """Whether the match has started, finished or not"""
+        return self.status_id != registry.status_id(STATUS_SCHEDULED)
+
+    def is_started(self):
+        return self.status_id == registry.status_id(STATUS_STARTED)
 
     def is_draw(self):
         return 1 if self.get_homescore() == self.get_awayscore() else 0
@@ -438,24 +561,22 @@ class Match(models.Model):
         return 1 if self.get_homescore() < self.get_awayscore() else 0
 
     def get_homefouls(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.hometeamreg, eventtype__name='foul').count()
+        return self.homefouls
 
     def get_awayfouls(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.awayteamreg, eventtype__name='foul').count()
+        return self.awayfouls
 
     def get_homeyellowcards(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.hometeamreg,
-                                         eventtype__name='yellow card').count()
+        return self.homeyellowcards
 
     def get_awayyellowcards(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.awayteamreg,
-                                         eventtype__name='yellow card').count()
+        return self.awayyellowcards
 
     def get_homeredcards(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.hometeamreg, eventtype__name='red card').count()
+        return self.homeredcards
 
     def get_awayredcards(self):
-        return MatchEvent.objects.filter(match_id=self.id, teamreg=self.awayteamreg, eventtype__name='red card').count()
+        return self.awayredcards
 
     def __str__(self):
         return f'M({self.matchno}): ({self.hometeamreg.team}) vs ({self.awayteamreg.team})'
@@ -472,12 +593,93 @@ class MatchEventType(models.Model):
 class MatchEvent(models.Model):
     timestamp = models.DateTimeField(name='timestamp', null=True, blank=True)
     matchtimeminutes = models.FloatField(name='matchtimeminutes', null=True, blank=True)
-    match = models.ForeignKey(to=Match, on_delete=models.CASCADE)
-    playerreg = models.ForeignKey(to=PlayerTournamentRegistration, on_delete=models.CASCADE, null=True, blank=True)
-    teamreg = models.ForeignKey(to=TeamTournamentRegistration, on_delete=models.CASCADE, null=True, blank=True)
+    # Indexed by the composite indexes of Meta, that lead with them
+    match = models.ForeignKey(to=Match, on_delete=models.CASCADE, db_index=False)
+    playerreg = models.ForeignKey(to=PlayerTournamentRegistration, on_delete=models.CASCADE, null=True, blank=True,
+                                  db_index=False)
+    teamreg = models.ForeignKey(to=TeamTournamentRegistration, on_delete=models.CASCADE, null=True, blank=True,
+                                db_index=False)
     eventtype = models.ForeignKey(to=MatchEventType, on_delete=models.CASCADE)
+    # Key given by the device that recorded the event, so that the replays of its upload are ignored
+    clientkey = models.CharField(name='clientkey', max_length=64, null=True, blank=True, unique=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['match', 'teamreg', 'eventtype'], name='matchevent_match_team_type'),
+            models.Index(fields=['playerreg', 'eventtype'], name='matchevent_player_type'),
+            models.Index(fields=['playerreg', 'match', 'eventtype'], name='matchevent_player_match_type'),
+            models.Index(fields=['teamreg', 'eventtype'], name='matchevent_team_type'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # The match summary is updated by the post_save signal, within the same transaction
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return ''.join([f'{self.eventtype}', f' ({self.playerreg.person})' if self.playerreg else '',
                         f' ({self.teamreg.team})' if self.teamreg else '',
                         f' at {self.matchtimeminutes:.2f} min' if self.matchtimeminutes else ''])
+
+
+class MatchInputKey(models.Model):
+    """Key given by the device that recorded the start or finish of a match, so that the replays of its upload are
+    ignored as those of the events (see MatchEvent.clientkey)"""
+    clientkey = models.CharField(name='clientkey', max_length=64, unique=True)
+    match = models.ForeignKey(to=Match, on_delete=models.CASCADE)
+
+    def __str__(self):
+        return f'{self.clientkey} ({self.match_id})'
+
+
+class PersonStats(models.Model):
+    """Career stats of a person, kept up to date by core.aggregates as events and matches change"""
+    person = models.OneToOneField(to=Person, related_name='stats', on_delete=models.CASCADE)
+    tournaments = models.IntegerField(name='tournaments', default=0)
+    matches = models.IntegerField(name='matches', default=0)
+    wins = models.IntegerField(name='wins', default=0)
+    draws = models.IntegerField(name='draws', default=0)
+    losses = models.IntegerField(name='losses', default=0)
+    goals = models.IntegerField(name='goals', default=0)
+    owngoals = models.IntegerField(name='owngoals', default=0)
+    tiebreakgoals = models.IntegerField(name='tiebreakgoals', default=0)
+    fouls = models.IntegerField(name='fouls', default=0)
+    yellowcards = models.IntegerField(name='yellowcards', default=0)
+    redcards = models.IntegerField(name='redcards', default=0)
+    goalsconceded = models.IntegerField(name='goalsconceded', default=0)
+    cleansheets = models.IntegerField(name='cleansheets', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Person stats'
+
+    def __str__(self):
+        return f'Stats: ({self.person})'
+
+
+class TeamStats(models.Model):
+    """All-time stats of a team, kept up to date by core.aggregates as its matches change"""
+    team = models.OneToOneField(to=Team, related_name='stats', on_delete=models.CASCADE)
+    tournaments = models.IntegerField(name='tournaments', default=0)
+    matches = models.IntegerField(name='matches', default=0)
+    wins = models.IntegerField(name='wins', default=0)
+    draws = models.IntegerField(name='draws', default=0)
+    losses = models.IntegerField(name='losses', default=0)
+    goalsscored = models.IntegerField(name='goalsscored', default=0)
+    goalsconceded = models.IntegerField(name='goalsconceded', default=0)
+    tiebreakgoalsscored = models.IntegerField(name='tiebreakgoalsscored', default=0)
+    tiebreakgoalsconceded = models.IntegerField(name='tiebreakgoalsconceded', default=0)
+    fouls = models.IntegerField(name='fouls', default=0)
+    foulsagainst = models.IntegerField(name='foulsagainst', default=0)
+    yellowcards = models.IntegerField(name='yellowcards', default=0)
+    redcards = models.IntegerField(name='redcards', default=0)
+    owngoals = models.IntegerField(name='owngoals', default=0)
+    cleansheets = models.IntegerField(name='cleansheets', default=0)
+    titles = models.IntegerField(name='titles', default=0)
+    runnerups = models.IntegerField(name='runnerups', default=0)
+    thirdplaces = models.IntegerField(name='thirdplaces', default=0)
+
+    class Meta:
+        verbose_name_plural = 'Team stats'
+
+    def __str__(self):
+        return f'Stats: ({self.team})'
@@ -0,0 +1,183 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.backends.base import SessionBase
+from django.db.models import F, Q
+from django.http import HttpRequest, HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.utils.translation import get_language, override
+
+from .archive import get_archived_page
+from .caching import get_or_revalidate, tournament_key
+from .dbrouter import use_replica
+from .models import Match, Person, Season, Tournament
+
+# Seconds a rendered page is kept. The version counters already make sure that a stale page is not served (but for
+# the serve_stale pages, for up to settings.PAGE_CACHE_MAX_STALENESS seconds), so this only bounds how long the pages
+# of old versions take up the cache
+PAGE_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def bump_versions(model, filters, **updates):
+    """Increments the version of the rows of model matching any of the filters, a dictionary of lookups of lists of
+    ids, and sets the given updates on them"""
+    q = Q()
+    for lookup, ids in filters.items():
+        ids = set(ids) - {None}
+        if ids:
+            q |= Q(**{f'{lookup}__in': ids})
+    if q:
+        model.objects.filter(id__in=model.objects.filter(q).values('id')).update(version=F('version') + 1, **updates)
+
+
+def bump_tournament_versions(tournament_ids=(), group_ids=(), teamreg_ids=(), person_ids=(), team_ids=(),
+                             venue_ids=()):
+    """Increments the version of the tournaments, of the groups, of the team registrations, where the people are
+    registered, where the teams are registered or with matches at the venues, so that their cached pages are no
+    longer used"""
+    bump_versions(Tournament, {'id': tournament_ids, 'group__id': group_ids,
+                               'teamtournamentregistration__id': teamreg_ids,
+                               'teamtournamentregistration__playertournamentregistration__person_id': person_ids,
+                               'teamtournamentregistration__team_id': team_ids,
+                               'group__match__venue_id': venue_ids}, modified=timezone.now())
+
+
+def bump_season_versions():
+    """Increments the version of every season, as the seasons and their tournaments are listed in every page"""
+    Season.objects.update(version=F('version') + 1, modified=timezone.now())
+
+
+def bump_match_versions(group_ids=(), tournament_ids=(), team_ids=(), venue_ids=(), playerreg_ids=(), person_ids=()):
+    """Increments the version of the matches of the groups, of the tournaments, of the teams, at the venues or with
+    events of the player registrations or of the people, so that their cached match cards are no longer used"""
+    bump_versions(Match, {'group__id': group_ids, 'group__tournament_id': tournament_ids,
+                          'hometeamreg__team_id': team_ids, 'awayteamreg__team_id': team_ids, 'venue__id': venue_ids,
+                          'matchevent__playerreg_id': playerreg_ids, 'matchevent__playerreg__person_id': person_ids})
+
+
+def bump_person_versions(person_ids=(), team_ids=()):
+    """Increments the version of the people and of everyone registered with the teams, so that their cached player
+    boxes are no longer used"""
+    bump_versions(Person, {'id': person_ids, 'playertournamentregistration__teamreg__team_id': team_ids})
+
+
+def get_page_request(request):
+    """Returns a new anonymous GET request for the URL and parameters of request, with only the season of its session,
+    to render a page that is cached for every anonymous user, possibly once request has been answered"""
+    page_request = HttpRequest()
+    page_request.method = 'GET'
+    page_request.path, page_request.path_info = request.path, request.path_info
+    page_request.GET = request.GET.copy()
+    page_request.META = {key: value for key, value in request.META.items() if isinstance(value, str)}
+    page_request.user = AnonymousUser()
+    page_request.session = SessionBase()
+    if 'season' in request.session:
+        page_request.session['season'] = request.session['season']
+    return page_request
+
+
+def is_cacheable(response):
+    return response.status_code == 200 and not response.cookies
+
+
+def tag_response(response, etag, timestamp):
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    # Clients may keep the page, but must check with the ETag that it is still current before showing it
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+class VersionedPageCacheMixin:
+    """Caches the GET responses of a public view, for anonymous users, and answers their conditional requests.
+
+    The cache key holds the version of the season and of the tournaments shown in the page, which are bumped on every
+    change to their data (see core.signals), so that a cached page is used until that data changes. The same key is
+    the ETag of the page, and the last version bump its Last-Modified date, so that a client polling an unchanged page
+    gets a 304 answer before any stats are computed.
+
+    The pages of a closed season are answered with their archived static copies, when there are (see core.archive)."""
+    page_cache_timeout = PAGE_CACHE_TIMEOUT
+    read_from_replica = True
+    # Whether the last render of the page is served while a single request renders its new version, for pages that
+    # are expensive to render and requested by many at once when their data changes
+    serve_stale = False
+
+    def get_page_tournaments(self, request, season_id):
+        """Returns the filter of the tournaments whose data the page shows, or None if it only shows the menus.
+
+        By default, the tournament of the 'tournament' parameter or else every tournament of the season."""
+        if 'tournament' in request.GET:
+            return Q(id=int(request.GET['tournament']))
+        return Q(season_id=season_id)
+
+    def get_page_season(self, request):
+        """Returns the (id, version, modified, closed) of the season of the session, or else of the last season"""
+        seasons = Season.objects.values_list('id', 'version', 'modified', 'closed')
+        if 'season' in request.session:
+            return seasons.filter(id=request.session['season']).first() or \
+                (request.session['season'], None, None, False)
+        return seasons.last()
+
+    def get_page_identity(self, request, season_id):
+        """Returns what tells the page apart from the other pages, whatever the versions of its data"""
+        return f'{type(self).__name__}:{request.get_full_path()}:{get_language()}:{season_id}'
+
+    def get_page_versions(self, request, season):
+        """Returns the cache key of the page and the time of its last change (None if unknown)"""
+        season_id, season_version, season_modified, _ = season
+        tournaments = self.get_page_tournaments(request, season_id)
+        tournament_versions = list(Tournament.objects.filter(tournaments).distinct().order_by('id')
+                                   .values_list('id', 'version', 'modified')) if tournaments is not None else []
+        key = f'{self.get_page_identity(request, season_id)}:{season_version}:' \
+              f'{[(tournament_id, version) for tournament_id, version, _ in tournament_versions]}'
+        changes = [season_modified] + [modified for _, _, modified in tournament_versions]
+        last_modified = max([modified for modified in changes if modified is not None], default=None)
+        digest = hashlib.md5(key.encode()).hexdigest()
+        if len(tournament_versions) == 1:
+            tournament_id, version, _ = tournament_versions[0]
+            return tournament_key(tournament_id, version, 'page', digest), last_modified
+        return f'page:{digest}', last_modified
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return super().dispatch(request, *args, **kwargs)
+        if not self.read_from_replica:
+            return self.dispatch_cached(request, *args, **kwargs)
+        # The public pages only read, and may do it from the replica (see core.dbrouter)
+        with use_replica(request):
+            return self.dispatch_cached(request, *args, **kwargs)
+
+    def dispatch_cached(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return super().dispatch(request, *args, **kwargs)
+        season = self.get_page_season(request)
+        archived_page = get_archived_page(request, season[0]) if season[3] else None
+        if archived_page is not None:
+            return HttpResponse(archived_page)
+        key, last_modified = self.get_page_versions(request, season)
+        etag = quote_etag(key)
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            return tag_response(response, etag, timestamp)
+        page_request, language = get_page_request(request), get_language()
+
+        def render_page():
+            # Also run in a background thread once the request has been answered (see get_or_revalidate), so with a
+            # view and a request of its own
+            view = type(self)()
+            view.setup(page_request, *args, **kwargs)
+            with override(language):
+                response = super(VersionedPageCacheMixin, view).dispatch(page_request, *args, **kwargs)
+            return tag_response(response, etag, timestamp) if is_cacheable(response) else response
+
+        max_staleness = settings.PAGE_CACHE_MAX_STALENESS if self.serve_stale else 0
+        stale_key = 'page-latest:' + hashlib.md5(self.get_page_identity(request, season[0]).encode()).hexdigest()
+        # The cached response holds the ETag and Last-Modified of its own version, which may be an older one
+        return get_or_revalidate(key, stale_key, render_page, self.page_cache_timeout, timestamp, max_staleness,
+                                 cacheable=is_cacheable)
@@ -0,0 +1,112 @@
+import threading
+import time
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+# Match statuses referenced by the code (see ReferenceRegistry.status_id)
+STATUS_SCHEDULED = 'scheduled'
+STATUS_STARTED = 'started'
+STATUS_FINISHED = 'finished'
+
+# Game stages referenced by the code (see ReferenceRegistry.gamestage_id)
+GAMESTAGE_GROUP = 'groups'
+GAMESTAGE_THIRDPLACE = 'third place'
+GAMESTAGE_FINAL = 'final'
+
+# Ids of their rows, as created with the site. The rows are named for the users (and may be renamed), so they are
+# found by id, which the MATCH_STATUS_IDS and GAMESTAGE_IDS settings override where the rows were created otherwise
+DEFAULT_MATCH_STATUS_IDS = {STATUS_SCHEDULED: 1, STATUS_STARTED: 2, STATUS_FINISHED: 3}
+DEFAULT_GAMESTAGE_IDS = {GAMESTAGE_GROUP: 1, GAMESTAGE_THIRDPLACE: 2, GAMESTAGE_FINAL: 3}
+
+# Seconds between two checks of the registry stamp in the shared cache, so that edits made through another process
+# are seen within this delay
+REGISTRY_CHECK_INTERVAL = 5
+
+REGISTRY_STAMP_KEY = 'registry-stamp'
+
+
+def get_registry_stamp():
+    """Returns the token that changes whenever the lookup tables change, in any process (see invalidate)"""
+    stamp = cache.get(REGISTRY_STAMP_KEY)
+    if stamp is None:
+        cache.add(REGISTRY_STAMP_KEY, uuid.uuid4().hex, None)
+        stamp = cache.get(REGISTRY_STAMP_KEY)
+    return stamp
+
+
+class ReferenceRegistry:
+    """Process-wide copy of the match event types, and the ids of the match statuses and game stages.
+
+    The tables are loaded on first use, and reloaded once the registry stamp in the shared cache has changed, which
+    every process checks at most every REGISTRY_CHECK_INTERVAL seconds. An edit bumps the stamp (see core.signals),
+    and reloads the tables of its own process at once."""
+    models = {'eventtype': 'MatchEventType'}
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tables = None
+        self._stamp = None
+        self._checked_at = 0
+
+    def _load(self):
+        tables = {}
+        for table, model_name in self.models.items():
+            model = apps.get_model('core', model_name)
+            instances = list(model.objects.all())
+            tables[table] = {'by_id': {instance.id: instance for instance in instances},
+                             'by_name': {instance.name: instance for instance in instances}}
+        return tables
+
+    def _get_tables(self):
+        tables = self._tables
+        if tables is None or time.monotonic() - self._checked_at > REGISTRY_CHECK_INTERVAL:
+            with self._lock:
+                if self._tables is tables:
+                    # Read before loading, so that a change made meanwhile is loaded at the next check
+                    stamp = get_registry_stamp()
+                    if self._tables is None or stamp != self._stamp:
+                        self._tables, self._stamp = self._load(), stamp
+                    self._checked_at = time.monotonic()
+                tables = self._tables
+        return tables
+
+    def invalidate(self):
+        """Drops the tables of every process: of this one at once, of the others at their next check"""
+        cache.set(REGISTRY_STAMP_KEY, uuid.uuid4().hex, None)
+        with self._lock:
+            self._tables = None
+
+    def _get(self, table, name):
+        try:
+            return self._get_tables()[table]['by_name'][name]
+        except KeyError:
+            raise apps.get_model('core', self.models[table]).DoesNotExist(f'No {self.models[table]} named {name!r}')
+
+    def eventtype(self, name):
+        return self._get('eventtype', name)
+
+    def eventtype_id(self, name):
+        """Returns the id of a match event type, or None if there is no such type (so that filters match nothing)"""
+        instance = self._get_tables()['eventtype']['by_name'].get(name)
+        return instance.id if instance is not None else None
+
+    def eventtype_ids(self):
+        """Returns the {name: id} map of the match event types"""
+        return {name: instance.id for name, instance in self._get_tables()['eventtype']['by_name'].items()}
+
+    def eventtype_names(self):
+        """Returns the {id: name} map of the match event types"""
+        return {instance.id: name for name, instance in self._get_tables()['eventtype']['by_name'].items()}
+
+    def status_id(self, status):
+        """Returns the id of the match status row of a status (see STATUS_SCHEDULED...)"""
+        return {**DEFAULT_MATCH_STATUS_IDS, **getattr(settings, 'MATCH_STATUS_IDS', {})}[status]
+
+    def gamestage_id(self, gamestage):
+        """Returns the id of the game stage row of a stage (see GAMESTAGE_GROUP...)"""
+        return {**DEFAULT_GAMESTAGE_IDS, **getattr(settings, 'GAMESTAGE_IDS', {})}[gamestage]
+
+registry = ReferenceRegistry()
@@ -0,0 +1,214 @@
+from collections import Counter
+from contextvars import ContextVar
+
+from django.contrib.auth.models import Group as UserGroup, User
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .aggregates import add_stats_changes, refresh_stats_on_commit
+from .context_processors import invalidate_groups_stamp
+from .matchinput import invalidate_match_rosters
+from .models import Match, MatchEvent, PlayerTournamentRegistration, TeamTournamentRegistration, MatchEventType, \
+    Group, Person, Team, Season, Tournament, Venue
+from .pagecache import bump_tournament_versions, bump_season_versions, bump_match_versions, bump_person_versions
+from .registry import registry
+
+# Matches being deleted, whose events go away first without updating them (see remember_deleted_match)
+deleted_match_ids = ContextVar('deleted_match_ids', default=frozenset())
+
+
+@receiver(pre_save, sender=MatchEvent)
+def remember_previous_event(sender, instance, **kwargs):
+    # An edited event may have been moved to another match, whose summary must be updated as well, or given to
+    # another player or type, whose former count goes down
+    instance._previous_event = MatchEvent.objects.filter(id=instance.id) \
+        .values_list('match_id', 'playerreg_id', 'eventtype_id').first() if instance.id is not None else None
+
+
+@receiver(post_save, sender=MatchEvent)
+def update_match_summary_on_save(sender, instance, **kwargs):
+    matches = [instance.match]
+    events = Counter({(instance.playerreg_id, instance.eventtype_id): 1})
+    previous_event = getattr(instance, '_previous_event', None)
+    if previous_event is not None:
+        previous_match_id, previous_playerreg_id, previous_eventtype_id = previous_event
+        events[(previous_playerreg_id, previous_eventtype_id)] -= 1
+        if previous_match_id != instance.match_id:
+            matches += list(Match.objects.filter(id=previous_match_id))
+    summaries = [match.update_summary() for match in matches]
+    bump_tournament_versions(group_ids={match.group_id for match in matches})
+    add_stats_changes(summaries, events)
+
+
+@receiver(post_delete, sender=MatchEvent)
+def update_match_summary_on_delete(sender, instance, **kwargs):
+    # The events of a deleted match are deleted along with it (cascade delete), and the stats of its teams are then
+    # refreshed at once (see update_stats_on_match_delete)
+    if instance.match_id in deleted_match_ids.get():
+        return
+    for match in Match.objects.filter(id=instance.match_id):
+        summary = match.update_summary()
+        bump_tournament_versions(group_ids=(match.group_id, ))
+        add_stats_changes([summary], {(instance.playerreg_id, instance.eventtype_id): -1})
+
+
+@receiver(pre_save, sender=Match)
+def remember_previous_teams(sender, instance, **kwargs):
+    # The teams of an edited match may have changed, and the stats of the former teams must be updated as well. So
+    # must the titles and places of the teams when the match is moved to a group of another stage
+    previous = Match.objects.filter(id=instance.id).values_list('hometeamreg_id', 'awayteamreg_id', 'group_id') \
+        .first() if instance.id is not None else None
+    instance._previous_teamreg_ids = previous[:2] if previous else None
+    instance._previous_group_id = previous[2] if previous else None
+
+
+@receiver(post_save, sender=Match)
+def update_stats_on_match_save(sender, instance, created, **kwargs):
+    previous_teamreg_ids = getattr(instance, '_previous_teamreg_ids', None)
+    teamreg_ids = (instance.hometeamreg_id, instance.awayteamreg_id) + (previous_teamreg_ids or ())
+    teams_changed = previous_teamreg_ids is not None and \
+        tuple(previous_teamreg_ids) != (instance.hometeamreg_id, instance.awayteamreg_id)
+    # The events are counted by team, and must be counted again for the new sides
+    if teams_changed:
+        instance.update_summary()
+    bump_tournament_versions(group_ids=(instance.group_id, ), teamreg_ids=teamreg_ids)
+    # The other changes of a match (status, times, venue) leave the stats as they were
+    if created or teams_changed or getattr(instance, '_previous_group_id', None) != instance.group_id:
+        refresh_stats_on_commit(teamreg_ids=teamreg_ids)
+    if teams_changed:
+        invalidate_match_rosters(match_ids=(instance.id, ))
+
+
+@receiver(pre_delete, sender=Match)
+def remember_deleted_match(sender, instance, **kwargs):
+    deleted_match_ids.set(deleted_match_ids.get() | {instance.id})
+
+
+@receiver(post_delete, sender=Match)
+def update_stats_on_match_delete(sender, instance, **kwargs):
+    deleted_match_ids.set(deleted_match_ids.get() - {instance.id})
+    bump_tournament_versions(group_ids=(instance.group_id, ))
+    refresh_stats_on_commit(teamreg_ids=(instance.hometeamreg_id, instance.awayteamreg_id))
+    invalidate_match_rosters(match_ids=(instance.id, ))
+
+
+@receiver(pre_save, sender=PlayerTournamentRegistration)
+def remember_previous_teamreg(sender, instance, **kwargs):
+    # A player moved to another team must leave the rosters of the matches of the former team
+    instance._previous_teamreg_id = PlayerTournamentRegistration.objects.filter(id=instance.id) \
+        .values_list('teamreg_id', flat=True).first() if instance.id is not None else None
+
+
+@receiver(post_save, sender=PlayerTournamentRegistration)
+@receiver(post_delete, sender=PlayerTournamentRegistration)
+def update_stats_on_registration_change(sender, instance, **kwargs):
+    bump_tournament_versions(teamreg_ids=(instance.teamreg_id, ))
+    bump_match_versions(playerreg_ids=(instance.id, ))
+    bump_person_versions(person_ids=(instance.person_id, ))
+    refresh_stats_on_commit(person_ids=(instance.person_id, ))
+    invalidate_match_rosters(teamreg_ids={instance.teamreg_id, getattr(instance, '_previous_teamreg_id', None)} -
+                             {None})
+
+
+@receiver(post_save, sender=TeamTournamentRegistration)
+@receiver(post_delete, sender=TeamTournamentRegistration)
+def update_stats_on_team_registration_change(sender, instance, **kwargs):
+    bump_tournament_versions(tournament_ids=(instance.tournament_id, ))
+    refresh_stats_on_commit(team_ids=(instance.team_id, ))
+
+
+@receiver(post_save, sender=MatchEventType)
+@receiver(post_delete, sender=MatchEventType)
+def invalidate_registry(sender, instance, **kwargs):
+    registry.invalidate()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def bump_versions_on_group_change(sender, instance, **kwargs):
+    bump_tournament_versions(tournament_ids=(instance.tournament_id, ))
+    bump_match_versions(group_ids=(instance.id, ))
+
+
+@receiver(m2m_changed, sender=Group.teams.through)
+def bump_versions_on_group_membership_change(sender, instance, action, **kwargs):
+    # Both the groups and the team registrations belong to a tournament, whichever side of the relation changed
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_tournament_versions(tournament_ids=(instance.tournament_id, ))
+
+
+@receiver(post_save, sender=Person)
+def bump_versions_on_person_change(sender, instance, **kwargs):
+    bump_tournament_versions(person_ids=(instance.id, ))
+    bump_match_versions(person_ids=(instance.id, ))
+    invalidate_match_rosters(teamreg_ids=list(PlayerTournamentRegistration.objects.filter(person_id=instance.id)
+                                              .values_list('teamreg_id', flat=True)))
+
+
+@receiver(post_save, sender=Team)
+def bump_versions_on_team_change(sender, instance, **kwargs):
+    bump_tournament_versions(team_ids=(instance.id, ))
+    bump_match_versions(team_ids=(instance.id, ))
+    bump_person_versions(team_ids=(instance.id, ))
+
+
+@receiver(post_save, sender=Venue)
+def bump_versions_on_venue_change(sender, instance, **kwargs):
+    # The venue is shown in the match cards, and in the fixtures and results of the tournaments
+    bump_tournament_versions(venue_ids=(instance.id, ))
+    bump_match_versions(venue_ids=(instance.id, ))
+
+
+@receiver(pre_save, sender=Person)
+@receiver(pre_save, sender=Match)
+def increment_stored_version(sender, instance, **kwargs):
+    # Incremented from the stored version, which may have been bumped since the instance was loaded
+    if not instance._state.adding:
+        instance.version = F('version') + 1
+
+
+@receiver(post_save, sender=Person)
+@receiver(post_save, sender=Match)
+def refresh_version(sender, instance, created, **kwargs):
+    if not created:
+        instance.refresh_from_db(fields=['version'])
+
+
+@receiver(pre_save, sender=Season)
+@receiver(pre_save, sender=Tournament)
+def keep_stored_version(sender, instance, **kwargs):
+    # The version may have been bumped since the instance was loaded, so the stored one is kept
+    if not instance._state.adding:
+        instance.version = F('version')
+        instance.modified = F('modified')
+
+
+@receiver(post_save, sender=Season)
+@receiver(post_save, sender=Tournament)
+def bump_versions_on_season_save(sender, instance, **kwargs):
+    bump_season_versions()
+    if isinstance(instance, Tournament):
+        bump_match_versions(tournament_ids=(instance.id, ))
+    instance.refresh_from_db(fields=['version', 'modified'])
+
+
+@receiver(post_delete, sender=Season)
+@receiver(post_delete, sender=Tournament)
+def bump_versions_on_season_delete(sender, instance, **kwargs):
+    bump_season_versions()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def invalidate_referee_flag_on_membership_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'pre_clear'):
+        if not reverse:
+            invalidate_groups_stamp([instance.pk])
+        else:
+            invalidate_groups_stamp(pk_set if pk_set else instance.user_set.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=UserGroup)
+@receiver(pre_delete, sender=UserGroup)
+def invalidate_referee_flag_on_group_change(sender, instance, **kwargs):
+    invalidate_groups_stamp(instance.user_set.values_list('id', flat=True))
@@ -0,0 +1,228 @@
+import copy
+import datetime
+import threading
+from array import array
+from collections import OrderedDict
+
+from django.db.models import Count
+
+from .leaderboards import NO_MATCHES_FAIRPLAY_SCORE, rank_items
+from .models import Group, Match, MatchEvent, PlayerTournamentRegistration, Season, TeamTournamentRegistration, \
+    Tournament
+from .registry import registry, STATUS_SCHEDULED
+from .standings import compute_standings
+
+# Sides of a match, as the second index of the match event counts
+HOME, AWAY = 0, 1
+
+# Most tournaments kept in memory per worker, the least recently used evicted first
+SNAPSHOTS_MAX_ENTRIES = 32
+
+_snapshots = OrderedDict()
+# Guards _snapshots and _build_locks, held only briefly: the snapshots are built under the lock of their tournament
+_lock = threading.Lock()
+_build_locks = {}
+
+
+class TournamentSnapshot:
+    """Immutable in-memory copy of a tournament: its team and player registrations, groups, matches and event counts.
+
+    The whole tournament is loaded at once, and the snapshot is never changed afterwards, so that it can be shared by
+    the threads of a worker (see get_snapshot). The instances it holds are shared as well, and must not be modified
+    by its users: the ranking methods return copies."""
+
+    def __init__(self, tournament_id):
+        self.tournament = Tournament.objects.select_related('season', 'genre').get(id=tournament_id)
+        self.version = self.tournament.version
+        self.teamregs = list(TeamTournamentRegistration.objects.filter(tournament_id=tournament_id)
+                             .select_related('team').order_by('id'))
+        teamregs = {teamreg.id: teamreg for teamreg in self.teamregs}
+        for teamreg in self.teamregs:
+            teamreg.tournament = self.tournament
+        self.playerregs = list(PlayerTournamentRegistration.objects.filter(teamreg__tournament_id=tournament_id)
+                               .select_related('person').order_by('id'))
+        for playerreg in self.playerregs:
+            playerreg.teamreg = teamregs[playerreg.teamreg_id]
+        self.groups = list(Group.objects.filter(tournament_id=tournament_id).select_related('gamestage')
+                           .order_by('id'))
+        groups = {group.id: group for group in self.groups}
+        for group in self.groups:
+            group.tournament = self.tournament
+        memberships = Group.teams.through.objects.filter(group_id__in=groups).order_by('id') \
+            .values_list('group_id', 'teamtournamentregistration_id')
+        self.memberships = [(group_id, teamregs[teamreg_id]) for group_id, teamreg_id in memberships
+                            if teamreg_id in teamregs]
+        self.matches = list(Match.objects.filter(group__tournament_id=tournament_id).select_related('venue', 'status')
+                            .order_by('datetime', 'id'))
+        for match in self.matches:
+            match.group = groups[match.group_id]
+            match.hometeamreg = teamregs[match.hometeamreg_id]
+            match.awayteamreg = teamregs[match.awayteamreg_id]
+        self._load_event_counts()
+        scheduled_id = registry.status_id(STATUS_SCHEDULED)
+        standings = compute_standings(self.memberships,
+                                      [match for match in self.matches if match.status_id != scheduled_id])
+        # The {group_id: [(teamreg, result), ...]} standings of every group, as core.standings.get_standings
+        self.standings = {group.id: standings.get(group.id, []) for group in self.groups}
+
+    def _load_event_counts(self):
+        """Loads the event counts by match, side and event type, by team registration and by player registration,
+        into flat arrays indexed by the position of each row and of each event type"""
+        self.eventtype_index = {eventtype_id: index for index, eventtype_id in
+                                enumerate(sorted(registry.eventtype_ids().values()))}
+        self.match_index = {match.id: index for index, match in enumerate(self.matches)}
+        self.teamreg_index = {teamreg.id: index for index, teamreg in enumerate(self.teamregs)}
+        self.playerreg_index = {playerreg.id: index for index, playerreg in enumerate(self.playerregs)}
+        types = len(self.eventtype_index)
+        self.match_counts = array('l', bytes(array('l').itemsize * len(self.matches) * 2 * types))
+        self.teamreg_counts = array('l', bytes(array('l').itemsize * len(self.teamregs) * types))
+        self.playerreg_counts = array('l', bytes(array('l').itemsize * len(self.playerregs) * types))
+        sides = {match.id: {match.hometeamreg_id: HOME, match.awayteamreg_id: AWAY} for match in self.matches}
+        rows = MatchEvent.objects.filter(match__group__tournament_id=self.tournament.id).order_by() \
+            .values_list('match_id', 'teamreg_id', 'eventtype_id').annotate(count=Count('id'))
+        for match_id, teamreg_id, eventtype_id, count in rows:
+            eventtype = self.eventtype_index.get(eventtype_id)
+            if eventtype is None:
+                continue
+            side = sides[match_id].get(teamreg_id)
+            if side is not None:
+                self.match_counts[(self.match_index[match_id] * 2 + side) * types + eventtype] += count
+            if teamreg_id in self.teamreg_index:
+                self.teamreg_counts[self.teamreg_index[teamreg_id] * types + eventtype] += count
+        rows = MatchEvent.objects.filter(playerreg__teamreg__tournament_id=self.tournament.id).order_by() \
+            .values_list('playerreg_id', 'eventtype_id').annotate(count=Count('id'))
+        for playerreg_id, eventtype_id, count in rows:
+            eventtype = self.eventtype_index.get(eventtype_id)
+            if eventtype is not None:
+                self.playerreg_counts[self.playerreg_index[playerreg_id] * types + eventtype] += count
+
+    def _eventtype(self, name):
+        return self.eventtype_index.get(registry.eventtype_id(name))
+
+    def match_count(self, match_id, side, eventtype):
+        """Returns the number of events of a type (by name) of the HOME or AWAY team of a match"""
+        index = self._eventtype(eventtype)
+        if index is None:
+            return 0
+        return self.match_counts[(self.match_index[match_id] * 2 + side) * len(self.eventtype_index) + index]
+
+    def teamreg_count(self, teamreg_id, eventtype):
+        """Returns the number of events of a type (by name) of a team registration"""
+        index = self._eventtype(eventtype)
+        if index is None:
+            return 0
+        return self.teamreg_counts[self.teamreg_index[teamreg_id] * len(self.eventtype_index) + index]
+
+    def playerreg_count(self, playerreg_id, eventtype):
+        """Returns the number of events of a type (by name) of a player registration"""
+        index = self._eventtype(eventtype)
+        if index is None:
+            return 0
+        return self.playerreg_counts[self.playerreg_index[playerreg_id] * len(self.eventtype_index) + index]
+
+    def get_group(self, group_id):
+        return next((group for group in self.groups if group.id == group_id), None)
+
+    def get_groups(self, gamestage_id=None):
+        return [group for group in self.groups if gamestage_id is None or group.gamestage_id == gamestage_id]
+
+    def get_matches(self, group_id=None):
+        """Returns the matches by date (those without one last), or the matches of a group by number"""
+        if group_id is not None:
+            return sorted((match for match in self.matches if match.group_id == group_id),
+                          key=lambda match: match.matchno)
+        return sort_by_date(self.matches)
+
+    def get_topscorers(self, limit=None):
+        """Returns the goal scorers ranked by their 'goals', with their shared 'rank' (see rank_items)"""
+        players = []
+        for playerreg in self.playerregs:
+            goals = self.playerreg_count(playerreg.id, 'goal')
+            if goals > 0:
+                players.append(copy.copy(playerreg))
+                players[-1].goals = goals
+        return rank_items(players, lambda player: -player.goals, limit)
+
+    def get_card_leaders(self, limit=None):
+        """Returns the booked players ranked by their 'redcards', then by their 'yellowcards'"""
+        players = []
+        for playerreg in self.playerregs:
+            redcards = self.playerreg_count(playerreg.id, 'red card')
+            yellowcards = self.playerreg_count(playerreg.id, 'yellow card')
+            if redcards or yellowcards:
+                players.append(copy.copy(playerreg))
+                players[-1].redcards, players[-1].yellowcards = redcards, yellowcards
+        return rank_items(players, lambda player: (-player.redcards, -player.yellowcards), limit)
+
+    def get_fairplay(self, limit=None):
+        """Returns the team registrations ranked by their 'fairplay' score, the fouls per match as
+        TeamTournamentRegistration.get_fairplay_score (lower is better)"""
+        matches = {teamreg.id: 0 for teamreg in self.teamregs}
+        for match in self.matches:
+            matches[match.hometeamreg_id] += 1
+            matches[match.awayteamreg_id] += 1
+        teamregs = []
+        for teamreg in self.teamregs:
+            teamregs.append(copy.copy(teamreg))
+            teamregs[-1].fairplay = self.teamreg_count(teamreg.id, 'foul') / matches[teamreg.id] \
+                if matches[teamreg.id] > 0 else float(NO_MATCHES_FAIRPLAY_SCORE)
+        return rank_items(teamregs, lambda teamreg: teamreg.fairplay, limit)
+
+
+def sort_by_date(matches):
+    """Sorts matches by date and id, those without a date last (as the database orders them)"""
+    return sorted(matches, key=lambda match: (match.datetime is None, match.datetime or datetime.datetime.min,
+                                              match.id))
+
+
+def get_snapshot(tournament_id, version=None):
+    """Returns the snapshot of a tournament, rebuilding it if the tournament version is not the snapshot's.
+
+    The version of the tournament is queried unless given (e.g. from an already loaded tournament)."""
+    if version is None:
+        version = Tournament.objects.filter(id=tournament_id).values_list('version', flat=True).first()
+        if version is None:
+            raise Tournament.DoesNotExist(f'No Tournament with id {tournament_id}')
+    snapshot = _get_cached(tournament_id, version)
+    if snapshot is None:
+        with _lock:
+            build_lock = _build_locks.setdefault(tournament_id, threading.Lock())
+        with build_lock:
+            snapshot = _get_cached(tournament_id, version)
+            if snapshot is None:
+                snapshot = TournamentSnapshot(tournament_id)
+                with _lock:
+                    _snapshots[tournament_id] = snapshot
+                    _snapshots.move_to_end(tournament_id)
+                    while len(_snapshots) > SNAPSHOTS_MAX_ENTRIES:
+                        evicted_id, _ = _snapshots.popitem(last=False)
+                        _build_locks.pop(evicted_id, None)
+    return snapshot
+
+
+def _get_cached(tournament_id, version):
+    """Returns the kept snapshot of the tournament if it is of the version, marking it as the most recently used"""
+    with _lock:
+        snapshot = _snapshots.get(tournament_id)
+        if snapshot is None or snapshot.version != version:
+            return None
+        _snapshots.move_to_end(tournament_id)
+        return snapshot
+
+
+def get_snapshots(tournaments):
+    """Returns the snapshots of the tournaments, whose versions are already loaded"""
+    return [get_snapshot(tournament.id, tournament.version) for tournament in tournaments]
+
+
+def clear_snapshots():
+    with _lock:
+        _snapshots.clear()
+        _build_locks.clear()
+
+
+def warm_snapshots():
+    """Builds the snapshots of the tournaments of the last season, so that the first requests do not build them"""
+    season = Season.objects.last()
+    if season is not None:
+        get_snapshots(Tournament.objects.filter(season=season))
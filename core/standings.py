@@ -0,0 +1,92 @@
+from .models import Group, Match, MATCH_SUMMARY_EVENTTYPES
+from .registry import registry, STATUS_SCHEDULED
+
+# Keys of the result dictionaries, in the same format as TeamTournamentRegistration.get_group_results
+RESULT_FIELDS = ('matches', 'wins', 'draws', 'losses', 'goalsscored', 'goalsconceded', 'goaldifference',
+                 'tiebreakgoals', 'fouls', 'yellowcards', 'redcards')
+
+# Match columns needed to compute the standings
+MATCH_FIELDS = ('id', 'group_id', 'hometeamreg_id', 'awayteamreg_id', 'status_id') + tuple(
+    f'{side}{field}' for side in ('home', 'away') for field in MATCH_SUMMARY_EVENTTYPES)
+
+
+def empty_result():
+    return dict.fromkeys(RESULT_FIELDS, 0)
+
+
+def add_match_result(result, match, home):
+    """Adds a played match to the result of the home (home=True) or away (home=False) team"""
+    homescore, awayscore = match.get_homescore(), match.get_awayscore()
+    scored, conceded = (homescore, awayscore) if home else (awayscore, homescore)
+    side = 'home' if home else 'away'
+    result['matches'] += 1
+    result['wins'] += 1 if scored > conceded else 0
+    result['draws'] += 1 if scored == conceded else 0
+    result['losses'] += 1 if scored < conceded else 0
+    result['goalsscored'] += scored
+    result['goalsconceded'] += conceded
+    result['goaldifference'] += scored - conceded
+    result['tiebreakgoals'] += getattr(match, f'{side}tiebreakgoals')
+    result['fouls'] += getattr(match, f'{side}fouls')
+    result['yellowcards'] += getattr(match, f'{side}yellowcards')
+    result['redcards'] += getattr(match, f'{side}redcards')
+    return result
+
+
+def finish_result(result):
+    """Computes the points and the sorting index of a team result"""
+    result['points'] = 3*result['wins'] + 1*result['draws']
+    result['idx'] = result['points'] * 1E6 + result['wins'] * 1E4 + (50 + result['goaldifference']) * 1E2 \
+        + (result['goalsscored'] + result['tiebreakgoals']) * 1 + (99 - result['redcards']) * 1.0E-2 \
+        + (99 - result['yellowcards']) * 1.0E-4 + (999 - result['fouls']) * 1E-7
+    return result
+
+
+def compute_standings(memberships, matches):
+    """Returns a dictionary {group_id: [(teamreg, result), ...]} with the sorted standings of the groups, from their
+    (group_id, teamreg) memberships and played matches"""
+    results, teamregs = {}, {}
+    for group_id, teamreg in memberships:
+        teamregs[teamreg.id] = teamreg
+        results.setdefault(group_id, {})[teamreg.id] = empty_result()
+    for match in matches:
+        group_results = results.get(match.group_id, {})
+        if match.hometeamreg_id in group_results:
+            add_match_result(group_results[match.hometeamreg_id], match, home=True)
+        if match.awayteamreg_id in group_results:
+            add_match_result(group_results[match.awayteamreg_id], match, home=False)
+    standings = {}
+    for group_id, group_results in results.items():
+        standings[group_id] = [(teamregs[teamreg_id], finish_result(result))
+                               for teamreg_id, result in group_results.items()]
+        standings[group_id].sort(reverse=True, key=lambda item: item[1]['idx'])
+    return standings
+
+
+def get_standings(groups):
+    """Returns a dictionary {group_id: [(teamreg, result), ...]} with the sorted standings of the groups.
+
+    The whole computation takes two queries (group teams and played matches), whatever the number of groups,
+    teams or matches."""
+    group_ids = [group.id for group in groups]
+    memberships = Group.teams.through.objects.filter(group_id__in=group_ids) \
+        .select_related('teamtournamentregistration__team').order_by('id')
+    matches = Match.objects.filter(group_id__in=group_ids).exclude(status_id=registry.status_id(STATUS_SCHEDULED)) \
+        .only(*MATCH_FIELDS)
+    standings = compute_standings([(membership.group_id, membership.teamtournamentregistration)
+                                   for membership in memberships], matches)
+    return {group_id: standings.get(group_id, []) for group_id in group_ids}
+
+
+def get_group_standings(group):
+    """Returns the sorted standings [(teamreg, result), ...] of a single group"""
+    return get_standings([group])[group.id]
+
+
+def get_tournament_standings(tournament, gamestage_id=None):
+    """Returns a list [(group, standings), ...] for every group of a tournament, optionally of a single stage"""
+    groups = Group.objects.filter(tournament=tournament).order_by('id')
+    if gamestage_id is not None:
+        groups = groups.filter(gamestage_id=gamestage_id)
+    standings = get_standings(groups)
+    return [(group, standings[group.id]) for group in groups]
@@ -1,3 +1,1145 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import Group as UserGroup, User
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models import Count, Q, QuerySet
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .aggregates import refresh_person_stats, refresh_team_stats
+from . import archive
+from .archive import archive_name, archive_path, archive_season, get_season_urls
+from .boxscore import get_team_tables
+from .caching import SQLiteCache, get_or_compute, get_or_revalidate
+from .dbrouter import REPLICA_DB_ALIAS, ReadYourWritesMiddleware, ReplicaRouter, use_replica
+from .live import LiveFeed, live_application
+from .matchinput import record_match_input
+from .models import MATCH_SUMMARY_EVENTTYPES, Competition, Genre, Season, Tournament, Person, Team, \
+    TeamTournamentRegistration, GameStage, Group, PlayerTournamentRegistration, MatchStatus, Match, MatchEventType, \
+    MatchEvent, PersonStats, TeamStats, Venue
+from .registry import ReferenceRegistry, registry, GAMESTAGE_FINAL, GAMESTAGE_GROUP, STATUS_FINISHED, \
+    STATUS_SCHEDULED, STATUS_STARTED
+from .snapshot import clear_snapshots, get_snapshot
+from .standings import get_standings
+
+EVENTTYPES = ['goal', 'own goal', 'foul', 'yellow card', 'red card', 'tie-break penalty goal']
+
+
+def create_tournament_data(tournaments=2, teams=8, players=10, events_per_match=6):
+    """Creates the reference tables and a season of tournaments, each with two groups of teams that play each other"""
+    registry.invalidate()
+    clear_snapshots()
+    for i, name in enumerate(EVENTTYPES, 1):
+        MatchEventType.objects.create(id=i, name=name, name_ptbr=name)
+    for i, name in enumerate(['scheduled', 'started', 'finished'], 1):
+        MatchStatus.objects.create(id=i, name=name)
+    for i, name in enumerate(['groups', 'third place', 'final'], 1):
+        GameStage.objects.create(id=i, name=name)
+    competition, genre = Competition.objects.create(name='Futebloco'), Genre.objects.create(name='Misto')
+    season, venue = Season.objects.create(name='2024'), Venue.objects.create(name='Aterro', address='Rio de Janeiro')
+    eventtypes = list(MatchEventType.objects.order_by('id'))
+    for t in range(tournaments):
+        tournament = Tournament.objects.create(name=f'Tournament {t}', short=f'T{t}', competition=competition,
+                                               genre=genre, season=season)
+        teamregs = []
+        for k in range(teams):
+            admin = Person.objects.create(name=f'Admin {t}-{k}', short=f'A{t}{k}', dob=datetime(1980, 1, 1).date())
+            team = Team.objects.create(name=f'Team {t}-{k}', short=f'T{k}', genre=genre, admin=admin)
+            teamreg = TeamTournamentRegistration.objects.create(tournament=tournament, team=team, capitain=admin)
+            for j in range(players):
+                person = Person.objects.create(name=f'Player {t}-{k}-{j}', short=f'P{j}',
+                                               dob=datetime(1990, 1, j + 1).date())
+                PlayerTournamentRegistration.objects.create(person=person, teamreg=teamreg, shirtno=str(j + 1))
+            teamregs.append(teamreg)
+        matchno = 0
+        for g, groupregs in enumerate([teamregs[:teams // 2], teamregs[teams // 2:]]):
+            group = Group.objects.create(name=f'Group {g}', tournament=tournament, gamestage_id=1)
+            group.teams.set(groupregs)
+            for a, home in enumerate(groupregs):
+                for away in groupregs[a + 1:]:
+                    matchno += 1
+                    match = Match.objects.create(matchno=matchno, group=group, hometeamreg=home, awayteamreg=away,
+                                                 datetime=datetime(2024, 2, matchno % 28 + 1, tzinfo=timezone.utc),
+                                                 venue=venue, status_id=3)
+                    for e in range(events_per_match):
+                        teamreg = (home, away)[e % 2]
+                        MatchEvent.objects.create(match=match, teamreg=teamreg, eventtype=eventtypes[e % 5],
+                                                  playerreg=teamreg.playertournamentregistration_set.first(),
+                                                  matchtimeminutes=e)
+    # Built once the changes are committed (see refresh_stats_on_commit), which a TestCase never does
+    refresh_person_stats(Person.objects.values_list('id', flat=True))
+    refresh_team_stats(Team.objects.values_list('id', flat=True))
+    return season
+
+
+class RegistryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        registry.invalidate()
+
+    def test_ids_are_those_of_the_settings(self):
+        self.assertEqual((registry.status_id(STATUS_SCHEDULED), registry.gamestage_id(GAMESTAGE_FINAL)), (1, 3))
+        with override_settings(MATCH_STATUS_IDS={STATUS_SCHEDULED: 8}, GAMESTAGE_IDS={GAMESTAGE_FINAL: 4}):
+            self.assertEqual((registry.status_id(STATUS_SCHEDULED), registry.status_id(STATUS_FINISHED)), (8, 3))
+            self.assertEqual(registry.gamestage_id(GAMESTAGE_FINAL), 4)
+
+    def test_rows_are_not_looked_up_by_name(self):
+        create_tournament_data(tournaments=1, teams=4, players=2)
+        MatchStatus.objects.update(name='Encerrada')
+        GameStage.objects.update(name='Fase de grupos')
+        match = Match.objects.first()
+        match.save()
+        MatchEvent.objects.create(match=match, teamreg=match.hometeamreg, eventtype=registry.eventtype('foul'))
+        self.assertEqual(self.client.get('/groups/').status_code, 200)
+        match.status_id = registry.status_id(STATUS_STARTED)
+        match.save()
+        self.assertContains(self.client.get(f'/fixtures/?tournament={match.group.tournament_id}'), 'Em andamento')
+
+    def test_edits_reach_the_other_processes(self):
+        MatchEventType.objects.create(name='goal', name_ptbr='gol')
+        other = ReferenceRegistry()
+        self.assertEqual(set(other.eventtype_ids()), {'goal'})
+        MatchEventType.objects.create(name='foul', name_ptbr='falta')
+        # Seen by this process at once, and by the others at their next check of the stamp
+        self.assertEqual(set(registry.eventtype_ids()), {'goal', 'foul'})
+        self.assertEqual(set(other.eventtype_ids()), {'goal'})
+        with mock.patch('core.registry.REGISTRY_CHECK_INTERVAL', 0), self.assertNumQueries(1):
+            self.assertEqual(set(other.eventtype_ids()), {'goal', 'foul'})
+            # Not reloaded while the stamp stays the same
+            other.eventtype_ids()
+
+
+class QueryPlanTest(TestCase):
+    """Checks that the hot stats queries are answered through indexes instead of full table scans"""
+    tables = ['core_match', 'core_matchevent']
+
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data()
+
+    def get_plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # The planner prefers a sequential scan on small tables, so it is only allowed as a last resort
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+        return queryset.explain()
+
+    def assertUsesIndexes(self, queryset, *indexes):
+        """Checks that the query plan has no full scan of the tables, and that it uses the given indexes"""
+        plan = self.get_plan(queryset)
+        if connection.vendor == 'postgresql':
+            scanned = re.findall(r'Seq Scan on (\w+)', plan)
+        elif connection.vendor == 'sqlite':
+            scanned = re.findall(r'SCAN (?:TABLE )?(\w+)\b(?!\s+USING)', plan)
+        else:
+            self.skipTest(f'No query plan parser for {connection.vendor}')
+        self.assertFalse([table for table in scanned if table in self.tables],
+                         f'Sequential scan in the query plan:\n{plan}')
+        for index in indexes:
+            self.assertRegex(plan, rf'\b{index}\b', f'Index {index} not used by the query plan:\n{plan}')
+
+    def test_match_summary(self):
+        match = Match.objects.first()
+        self.assertUsesIndexes(MatchEvent.objects.filter(match_id=match.id).values('teamreg_id', 'eventtype_id')
+                               .annotate(count=Count('id')), 'matchevent_match_team_type')
+
+    def test_player_event_count(self):
+        playerreg = PlayerTournamentRegistration.objects.first()
+        self.assertUsesIndexes(MatchEvent.objects.filter(playerreg=playerreg,
+                                                         eventtype_id=registry.eventtype_id('goal')),
+                               'matchevent_player_type')
+
+    def test_player_event_count_at_match(self):
+        event = MatchEvent.objects.exclude(playerreg=None).first()
+        self.assertUsesIndexes(MatchEvent.objects.filter(playerreg_id=event.playerreg_id, match_id=event.match_id,
+                                                         eventtype_id=registry.eventtype_id('foul')),
+                               'matchevent_player_match_type')
+
+    def test_person_event_counts(self):
+        person_ids = PlayerTournamentRegistration.objects.values_list('person_id', flat=True)[:20]
+        self.assertUsesIndexes(MatchEvent.objects.filter(playerreg__person_id__in=list(person_ids),
+                                                         eventtype_id__in=[1, 2, 3])
+                               .values('playerreg__person_id', 'eventtype_id').annotate(count=Count('id')))
+
+    def test_team_event_count(self):
+        teamreg = TeamTournamentRegistration.objects.first()
+        self.assertUsesIndexes(MatchEvent.objects.filter(teamreg=teamreg, eventtype_id=registry.eventtype_id('foul')),
+                               'matchevent_team_type')
+
+    def test_team_group_matches(self):
+        match = Match.objects.first()
+        scheduled_id = registry.status_id(STATUS_SCHEDULED)
+        self.assertUsesIndexes(Match.objects.filter(hometeamreg_id=match.hometeamreg_id, group_id=match.group_id)
+                               .exclude(status_id=scheduled_id), 'match_home_group_status')
+        self.assertUsesIndexes(Match.objects.filter(awayteamreg_id=match.awayteamreg_id, group_id=match.group_id)
+                               .exclude(status_id=scheduled_id), 'match_away_group_status')
+
+    def test_team_registration_matches(self):
+        teamreg_ids = list(TeamTournamentRegistration.objects.values_list('id', flat=True)[:3])
+        self.assertUsesIndexes(Match.objects.filter(Q(hometeamreg_id__in=teamreg_ids) |
+                                                    Q(awayteamreg_id__in=teamreg_ids)),
+                               'match_home_group_status', 'match_away_group_status')
+
+    def test_tournament_fixtures(self):
+        tournament = Tournament.objects.first()
+        self.assertUsesIndexes(Match.objects.filter(group__tournament=tournament).order_by('datetime'),
+                               'match_group_datetime')
+
+    def test_group_standings(self):
+        group_ids = list(Group.objects.values_list('id', flat=True)[:2])
+        self.assertUsesIndexes(Match.objects.filter(group_id__in=group_ids)
+                               .exclude(status_id=registry.status_id(STATUS_SCHEDULED)), 'match_group_datetime')
+
+
+class StandingsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=2, teams=8, players=2)
+        # Unplayed matches are left out of the tables
+        Match.objects.filter(id__in=Match.objects.order_by('id').values_list('id', flat=True)[::5]) \
+            .update(status_id=registry.status_id(STATUS_SCHEDULED))
+
+    def test_standings_match_group_results(self):
+        groups = list(Group.objects.all())
+        standings = get_standings(groups)
+        for group in groups:
+            legacy = [(teamreg, teamreg.get_group_results(group.id)) for teamreg in group.teams.all()]
+            legacy.sort(reverse=True, key=lambda item: item[1]['idx'])
+            self.assertEqual([(teamreg.id, result) for teamreg, result in standings[group.id]],
+                             [(teamreg.id, result) for teamreg, result in legacy])
+
+
+class BoxScoreTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=1, teams=4, players=3)
+
+    def test_team_tables_match_player_getters(self):
+        match = Match.objects.first()
+        with self.assertNumQueries(2):
+            team_tables = get_team_tables(match)
+        self.assertEqual([len(table) for table in team_tables], [3, 3])
+        for table in team_tables:
+            for row in table:
+                p = PlayerTournamentRegistration.objects.get(id=row[2][1])
+                self.assertEqual([cell[0] for cell in row[2:]], [
+                    p.get_goal_count_at_match(match), p.get_foul_count_at_match(match),
+                    p.get_yellowcard_count_at_match(match), p.get_redcard_count_at_match(match),
+                    p.get_owngoal_count_at_match(match), p.get_tiebreakgoal_count_at_match(match)])
+
+
+class MatchSummaryTest(TestCase):
+    """Checks that the scoreline and counters stored in the matches follow the changes of their events"""
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=1, teams=4, players=2, events_per_match=6)
+
+    def assertSummaryCountsEvents(self, *matches):
+        for match in matches:
+            match.refresh_from_db()
+            events = MatchEvent.objects.filter(match=match)
+            self.assertEqual(
+                {f'{side}{field}': getattr(match, f'{side}{field}') for side in ('home', 'away')
+                 for field in MATCH_SUMMARY_EVENTTYPES},
+                {f'{side}{field}': events.filter(teamreg=teamreg, eventtype__name=eventtype).count()
+                 for side, teamreg in (('home', match.hometeamreg), ('away', match.awayteamreg))
+                 for field, eventtype in MATCH_SUMMARY_EVENTTYPES.items()})
+
+    def test_summary_follows_the_events(self):
+        match, other = Match.objects.order_by('id')[:2]
+        goal, foul = MatchEventType.objects.get(name='goal'), MatchEventType.objects.get(name='foul')
+        playerreg = match.hometeamreg.playertournamentregistration_set.first()
+        event = MatchEvent.objects.create(match=match, teamreg=match.hometeamreg, playerreg=playerreg, eventtype=goal,
+                                          matchtimeminutes=1)
+        self.assertSummaryCountsEvents(match)
+        event.eventtype = foul
+        event.save()
+        self.assertSummaryCountsEvents(match)
+        event.match = other
+        event.save()
+        self.assertSummaryCountsEvents(match, other)
+        event.delete()
+        self.assertSummaryCountsEvents(match, other)
+
+    def test_summary_follows_the_teams_of_the_match(self):
+        match = Match.objects.filter(homegoals__gt=0).first()
+        match.hometeamreg, match.awayteamreg = match.awayteamreg, match.hometeamreg
+        match.save()
+        self.assertSummaryCountsEvents(match)
+
+    def test_deleted_match_is_not_recounted_per_event(self):
+        match = Match.objects.first()
+        with mock.patch.object(Match, 'update_summary') as update_summary:
+            match.delete()
+        update_summary.assert_not_called()
+        self.assertFalse(MatchEvent.objects.filter(match_id=match.id).exists())
+
+
+class StoredStatsTest(TestCase):
+    """Checks that the stored stats, changed along with the matches and events, match what the former getters
+    counted on every call"""
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=2, teams=4, players=2, events_per_match=6)
+
+    def legacy_person_stats(self, person):
+        playerregs = PlayerTournamentRegistration.objects.filter(person=person)
+        events = MatchEvent.objects.filter(playerreg__person=person)
+        return {
+            'tournaments': playerregs.count(),
+            'matches': sum(playerreg.teamreg.get_match_count() for playerreg in playerregs),
+            'wins': sum(playerreg.teamreg.get_win_count() for playerreg in playerregs),
+            'draws': sum(playerreg.teamreg.get_draw_count() for playerreg in playerregs),
+            'losses': sum(playerreg.teamreg.get_loss_count() for playerreg in playerregs),
+            'tiebreakgoals': sum(playerreg.teamreg.get_tiebreakgoalscored_count() for playerreg in playerregs),
+            'goalsconceded': sum(playerreg.teamreg.get_goalconceded_count() for playerreg in playerregs),
+            'cleansheets': sum(playerreg.teamreg.get_cleansheet_count() for playerreg in playerregs),
+            'goals': events.filter(eventtype__name='goal').count(),
+            'owngoals': events.filter(eventtype__name='own goal').count(),
+            'fouls': events.filter(eventtype__name='foul').count(),
+            'yellowcards': events.filter(eventtype__name='yellow card').count(),
+            'redcards': events.filter(eventtype__name='red card').count(),
+        }
+
+    def legacy_team_stats(self, team):
+        home, away = Match.objects.filter(hometeamreg__team=team), Match.objects.filter(awayteamreg__team=team)
+
+        def total(home_value, away_value, **filters):
+            return sum(home_value(match) for match in home.filter(**filters)) + \
+                sum(away_value(match) for match in away.filter(**filters))
+        return {
+            'tournaments': TeamTournamentRegistration.objects.filter(team=team).count(),
+            'matches': home.count() + away.count(),
+            'wins': total(Match.is_homewin, Match.is_awaywin),
+            'draws': total(Match.is_draw, Match.is_draw),
+            'losses': total(Match.is_awaywin, Match.is_homewin),
+            'goalsscored': total(Match.get_homescore, Match.get_awayscore),
+            'goalsconceded': total(Match.get_awayscore, Match.get_homescore),
+            'tiebreakgoalsscored': total(Match.get_hometiebreakscore, Match.get_awaytiebreakscore),
+            'tiebreakgoalsconceded': total(Match.get_awaytiebreakscore, Match.get_hometiebreakscore),
+            'fouls': total(lambda match: match.homefouls, lambda match: match.awayfouls),
+            'foulsagainst': total(lambda match: match.awayfouls, lambda match: match.homefouls),
+            'yellowcards': total(lambda match: match.homeyellowcards, lambda match: match.awayyellowcards),
+            'redcards': total(lambda match: match.homeredcards, lambda match: match.awayredcards),
+            'owngoals': MatchEvent.objects.filter(teamreg__team=team, eventtype__name='own goal').count(),
+            'cleansheets': total(lambda match: match.get_awayscore() == 0, lambda match: match.get_homescore() == 0),
+            'titles': total(Match.is_homewin, Match.is_awaywin, group__gamestage_id=3),
+            'runnerups': total(Match.is_awaywin, Match.is_homewin, group__gamestage_id=3),
+            'thirdplaces': total(Match.is_homewin, Match.is_awaywin, group__gamestage_id=2),
+        }
+
+    def assertStatsMatchLegacy(self):
+        for person in Person.objects.all():
+            legacy = self.legacy_person_stats(person)
+            self.assertEqual({field: getattr(person.get_stats(), field) for field in legacy}, legacy, person.name)
+        for team in Team.objects.all():
+            legacy = self.legacy_team_stats(team)
+            self.assertEqual({field: getattr(team.get_stats(), field) for field in legacy}, legacy, team.name)
+
+    def test_stats_follow_the_changes_of_events(self):
+        self.assertStatsMatchLegacy()
+        match, other = Match.objects.order_by('id')[:2]
+        # A final, whose winner takes the title
+        with self.captureOnCommitCallbacks(execute=True):
+            final = Group.objects.create(name='Final', tournament=match.group.tournament, gamestage_id=3)
+            final = Match.objects.create(matchno=99, group=final, hometeamreg=match.hometeamreg,
+                                         awayteamreg=match.awayteamreg, datetime=match.datetime, venue=match.venue,
+                                         status_id=3)
+        self.assertStatsMatchLegacy()
+        goal, owngoal = MatchEventType.objects.get(name='goal'), MatchEventType.objects.get(name='own goal')
+        home, away = [teamreg.playertournamentregistration_set.order_by('id') for teamreg in
+                      (match.hometeamreg, match.awayteamreg)]
+        with self.captureOnCommitCallbacks() as callbacks:
+            event = MatchEvent.objects.create(match=final, teamreg=match.hometeamreg, playerreg=home[0],
+                                              eventtype=goal, matchtimeminutes=1)
+            self.assertStatsMatchLegacy()
+            # Given to a teammate, then turned into an own goal (a title to the away team)
+            event.playerreg, event.eventtype = home[1], owngoal
+            event.save()
+            self.assertStatsMatchLegacy()
+            # Moved to a match of the group stage
+            event.match = match
+            event.save()
+            self.assertStatsMatchLegacy()
+            MatchEvent.objects.filter(match=other).first().delete()
+            event.delete()
+            self.assertStatsMatchLegacy()
+        self.assertEqual(len(callbacks), 0)
+
+    def test_getters_do_not_write(self):
+        # Without a stats record, as the people and teams who have not played yet
+        person, team = PlayerTournamentRegistration.objects.first().person, Team.objects.first()
+        PersonStats.objects.filter(person=person).delete()
+        TeamStats.objects.filter(team=team).delete()
+        person, team = Person.objects.get(id=person.id), Team.objects.get(id=team.id)
+        with self.assertNumQueries(2):
+            self.assertEqual((person.get_match_count(), team.get_match_count()), (0, 0))
+        self.assertFalse(PersonStats.objects.filter(person=person).exists())
+        self.assertFalse(TeamStats.objects.filter(team=team).exists())
+
+    def test_admin_only_shows_the_stats(self):
+        self.client.force_login(User.objects.create_superuser('organizer'))
+        stats = PersonStats.objects.first()
+        self.assertEqual(self.client.get('/admin/core/personstats/').status_code, 200)
+        self.assertEqual(self.client.get(f'/admin/core/personstats/{stats.id}/change/').status_code, 200)
+        self.assertEqual(self.client.post(f'/admin/core/personstats/{stats.id}/change/', {'goals': 99}).status_code,
+                         403)
+        self.assertEqual(self.client.get('/admin/core/teamstats/add/').status_code, 403)
+        self.assertNotEqual(PersonStats.objects.get(id=stats.id).goals, 99)
+
+
+class LeaderboardTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=2, teams=4, players=3)
+        cls.tournament_ids = list(Tournament.objects.values_list('id', flat=True))
+
+    def test_topscorers(self):
+        for tournament_id in self.tournament_ids:
+            topscorers = get_snapshot(tournament_id).get_topscorers()
+            players = PlayerTournamentRegistration.objects.filter(teamreg__tournament_id=tournament_id)
+            goals = sorted([p.get_goal_count() for p in players if p.get_goal_count() > 0], reverse=True)
+            self.assertEqual([p.goals for p in topscorers], goals)
+            for p in topscorers:
+                self.assertEqual(p.rank, 1 + len([g for g in goals if g > p.goals]))
+
+    def test_topscorers_limit_keeps_ties(self):
+        snapshot = get_snapshot(self.tournament_ids[0])
+        self.assertEqual([p.id for p in snapshot.get_topscorers(limit=1)],
+                         [p.id for p in snapshot.get_topscorers() if p.rank == 1])
+
+    def test_card_leaders(self):
+        for tournament_id in self.tournament_ids:
+            leaders = get_snapshot(tournament_id).get_card_leaders()
+            counts = MatchEvent.objects.filter(teamreg__tournament_id=tournament_id, playerreg__isnull=False) \
+                .values('playerreg_id').annotate(redcards=Count('id', filter=Q(eventtype__name='red card')),
+                                                 yellowcards=Count('id', filter=Q(eventtype__name='yellow card')))
+            keys = sorted(((row['redcards'], row['yellowcards']) for row in counts
+                           if row['redcards'] or row['yellowcards']), reverse=True)
+            self.assertEqual([(p.redcards, p.yellowcards) for p in leaders], keys)
+            for p in leaders:
+                self.assertEqual(p.rank, 1 + len([key for key in keys if key > (p.redcards, p.yellowcards)]))
+
+    def test_fairplay(self):
+        for tournament_id in self.tournament_ids:
+            teamregs = TeamTournamentRegistration.objects.filter(tournament_id=tournament_id)
+            self.assertEqual([t.fairplay for t in get_snapshot(tournament_id).get_fairplay()],
+                             sorted(t.get_fairplay_score() for t in teamregs))
+
+    def test_awards_page_shows_the_card_leaders(self):
+        leaders = get_snapshot(self.tournament_ids[0]).get_card_leaders()
+        self.assertTrue(leaders)
+        response = self.client.get(f'/awards/?tournament={self.tournament_ids[0]}')
+        self.assertEqual([p.id for p in response.context['tournament_leaderboards'][0][2]], [p.id for p in leaders])
+        self.assertContains(response, 'Cartões')
+
+
+class PageCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=2, teams=4, players=3)
+        cls.tournament, cls.other = Tournament.objects.order_by('id')[:2]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_pages_cached_before_the_stats_refresh_are_not_used(self):
+        person = PersonStats.objects.filter(matches__gt=0).first().person
+        teamreg = TeamTournamentRegistration.objects.exclude(playertournamentregistration__person=person).first()
+        url = f'/single-player/?player={person.id}'
+        with self.captureOnCommitCallbacks() as callbacks:
+            PlayerTournamentRegistration.objects.create(person=person, teamreg=teamreg, shirtno='99')
+        # A request answered between the commit of the change and the refresh of the stats
+        tournaments = self.client.get(url).context['playerreg'].person.get_tournament_count()
+        for callback in callbacks:
+            callback()
+        self.assertContains(self.client.get(url), f'PARTICIPAÇÕES:</strong> <span>{tournaments + 1}</span>')
+
+    def test_cached_page_until_tournament_changes(self):
+        url, other_url = f'/groups/?tournament={self.tournament.id}', f'/groups/?tournament={self.other.id}'
+        self.client.get(url), self.client.get(other_url)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        match = Match.objects.filter(group__tournament=self.tournament).first()
+        MatchEvent.objects.create(match=match, teamreg=match.hometeamreg, eventtype=registry.eventtype('goal'))
+        self.assertNotEqual(Tournament.objects.get(id=self.tournament.id).version, self.tournament.version)
+        self.assertEqual(Tournament.objects.get(id=self.other.id).version, self.other.version)
+        with self.assertNumQueries(2):
+            self.client.get(other_url)
+
+    def test_venue_change_bumps_the_tournaments_playing_there(self):
+        venue = Venue.objects.create(name='Lagoa', address='Rio de Janeiro')
+        Match.objects.filter(group__tournament=self.tournament).update(venue=venue)
+        venue.name = 'Lagoa Rodrigo de Freitas'
+        venue.save()
+        self.assertEqual(Tournament.objects.get(id=self.tournament.id).version, self.tournament.version + 1)
+        self.assertEqual(Tournament.objects.get(id=self.other.id).version, self.other.version)
+
+    def test_season_change_bumps_every_season(self):
+        season = Season.objects.get()
+        version = season.version
+        season.name = '2025'
+        season.save()
+        self.assertEqual(season.version, version + 1)
+
+
+@override_settings(PAGE_CACHE_MAX_STALENESS=0)
+class FragmentCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=1, teams=4, players=3, events_per_match=0)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_match_version_bumped_by_events_and_saves(self):
+        match = Match.objects.first()
+        version = match.version
+        MatchEvent.objects.create(match=match, teamreg=match.hometeamreg, eventtype=registry.eventtype('goal'))
+        self.assertEqual(Match.objects.get(id=match.id).version, version + 1)
+        match.refresh_from_db()
+        match.save()
+        self.assertEqual(match.version, version + 2)
+
+    def test_fixture_row_shows_new_score(self):
+        match = Match.objects.first()
+        url = f'/fixtures/?tournament={match.group.tournament_id}'
+        self.assertContains(self.client.get(url), f'?match={match.id}')
+        for _ in range(3):
+            MatchEvent.objects.create(match=match, teamreg=match.hometeamreg, eventtype=registry.eventtype('goal'))
+        self.assertRegex(self.client.get(url).content.decode(), r'<td class="text-center">\s*3\s*</td>')
+
+    def test_person_version_bumped_by_team_change(self):
+        playerreg = PlayerTournamentRegistration.objects.select_related('person', 'teamreg__team').first()
+        team = playerreg.teamreg.team
+        team.name = 'Renamed'
+        team.save()
+        self.assertEqual(Person.objects.get(id=playerreg.person_id).version, playerreg.person.version + 1)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=1, teams=4, players=3)
+        cls.match = Match.objects.first()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_page_is_not_rendered(self):
+        for url in ['/groups/', f'/fixtures/?tournament={self.match.group.tournament_id}',
+                    f'/single-reuslt/?match={self.match.id}']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            cache.clear()
+            with self.assertNumQueries(2):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertTemplateNotUsed(response, 'base.html')
+
+    def test_changed_page_is_rendered(self):
+        url = f'/single-reuslt/?match={self.match.id}'
+        etag = self.client.get(url)['ETag']
+        MatchEvent.objects.create(match=self.match, teamreg=self.match.hometeamreg,
+                                  eventtype=registry.eventtype('goal'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        url = '/groups/'
+        Tournament.objects.get().save()
+        last_modified = self.client.get(url)['Last-Modified']
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+    def test_authenticated_users_get_full_pages(self):
+        self.client.force_login(User.objects.create_user('referee'))
+        response = self.client.get('/groups/')
+        self.assertNotIn('ETag', response)
+        self.assertEqual(self.client.get('/groups/', HTTP_IF_NONE_MATCH='"x"').status_code, 200)
+
+
+class CommonInfoTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=1, teams=2, players=1, events_per_match=0)
+        cls.user = User.objects.create_user('referee')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_catalog_is_cached_until_a_tournament_changes(self):
+        self.client.get('/login/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/login/')
+        self.assertEqual(len(response.context['all_tournaments_season']), 1)
+        Tournament.objects.create(name='Cup', short='C', competition=Competition.objects.get(),
+                                  genre=Genre.objects.get(), season=Season.objects.get())
+        self.assertEqual(len(self.client.get('/login/').context['all_tournaments_season']), 2)
+
+    def test_referee_flag_is_memoized_until_groups_change(self):
+        self.client.force_login(self.user)
+        self.assertFalse(self.client.get('/login/').context['is_referee'])
+        with self.assertNumQueries(3):
+            # Session and user, then the season version of the catalog
+            self.client.get('/login/')
+        self.user.groups.add(UserGroup.objects.create(name='referee'))
+        self.assertTrue(self.client.get('/login/').context['is_referee'])
+        UserGroup.objects.get(name='referee').user_set.clear()
+        self.assertFalse(self.client.get('/login/').context['is_referee'])
+
+
+class MemoizedGettersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=1, teams=4, players=2)
+
+    def test_repeated_getters_run_once(self):
+        teamreg = TeamTournamentRegistration.objects.first()
+        match_count, fairplay_score = teamreg.get_match_count(), teamreg.get_fairplay_score()
+        with self.assertNumQueries(0):
+            self.assertEqual(teamreg.get_match_count(), match_count)
+            self.assertEqual(teamreg.get_fairplay_score(), fairplay_score)
+        playerreg = PlayerTournamentRegistration.objects.first()
+        match = Match.objects.first()
+        playerreg.get_goal_count_at_match(match)
+        with self.assertNumQueries(0):
+            playerreg.get_goal_count_at_match(match)
+
+    def test_memo_is_cleared_on_save(self):
+        match = Match.objects.first()
+        homescore = match.get_homescore()
+        match.homegoals += 1
+        match.save()
+        self.assertEqual(match.get_homescore(), homescore + 1)
+
+
+class SnapshotTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=2, teams=4, players=3)
+        cls.tournament, cls.other_tournament = Tournament.objects.order_by('id')
+
+    def test_snapshot_matches_database(self):
+        snapshot = get_snapshot(self.tournament.id)
+        standings = get_standings(Group.objects.filter(tournament=self.tournament))
+        with self.assertNumQueries(0):
+            self.assertEqual({group_id: [(t.id, r) for t, r in results]
+                              for group_id, results in snapshot.standings.items()},
+                             {group_id: [(t.id, r) for t, r in results] for group_id, results in standings.items()})
+            snapshot.get_topscorers(), snapshot.get_card_leaders(), snapshot.get_fairplay()
+
+    def test_snapshot_is_rebuilt_on_version_change(self):
+        snapshot = get_snapshot(self.tournament.id)
+        with self.assertNumQueries(1):
+            self.assertIs(get_snapshot(self.tournament.id), snapshot)
+        match = Match.objects.filter(group__tournament=self.tournament).first()
+        MatchEvent.objects.create(match=match, teamreg=match.hometeamreg, eventtype=registry.eventtype('foul'))
+        rebuilt = get_snapshot(self.tournament.id)
+        self.assertIsNot(rebuilt, snapshot)
+        self.assertEqual(rebuilt.teamreg_count(match.hometeamreg_id, 'foul'),
+                         snapshot.teamreg_count(match.hometeamreg_id, 'foul') + 1)
+
+    def test_least_recently_used_snapshot_is_evicted(self):
+        with mock.patch('core.snapshot.SNAPSHOTS_MAX_ENTRIES', 1):
+            snapshot = get_snapshot(self.tournament.id)
+            other = get_snapshot(self.other_tournament.id)
+            with self.assertNumQueries(1):
+                self.assertIs(get_snapshot(self.other_tournament.id), other)
+            self.assertIsNot(get_snapshot(self.tournament.id), snapshot)
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SQLiteCache(os.path.join(directory.name, 'cache.sqlite3'), {'OPTIONS': {'MAX_ENTRIES': 4}})
+
+    def test_cache_operations(self):
+        self.assertTrue(self.cache.add('a', 1))
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertEqual(self.cache.incr('a', 2), 3)
+        self.cache.set('b', {'x': 1}, timeout=0)
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 3})
+        self.assertTrue(self.cache.delete('a'))
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_metrics_count_hits_misses_and_evictions(self):
+        for i in range(6):
+            self.cache.set(i, i)
+        self.cache.get(5)
+        self.cache.get('missing')
+        metrics = self.cache.get_metrics()
+        self.assertEqual((metrics['hits'], metrics['misses'], metrics['hit_rate']), (1, 1, 0.5))
+        self.assertGreater(metrics['evictions'], 0)
+
+    def test_get_or_compute_waits_for_the_computing_request(self):
+        cache.clear()
+        cache.add('answer:computing', True)
+        threading.Timer(0.1, lambda: cache.set('answer', 42)).start()
+        self.assertEqual(get_or_compute('answer', lambda: self.fail('computed twice'), 60), 42)
+
+
+class ArchiveTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=1, teams=4, players=2, events_per_match=2)
+        Season.objects.update(closed=True)
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = self.settings(ARCHIVE_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_closed_season_pages_are_archived_and_answered_in_place(self):
+        season = Season.objects.get()
+        self.assertEqual(archive_season(season), 2 * len(get_season_urls(season)))
+        url = f'/groups/?tournament={Tournament.objects.get().id}'
+        with open(archive_path(season.id, 'pt-br', url), 'a', encoding='utf-8') as file:
+            file.write('<!-- archived -->')
+        self.client.get(f'/set_season/?season={season.id}')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<!-- archived -->')
+        self.assertContains(response, 'href="/single-group/?group=')
+        # The pages left out of the archive are still rendered
+        self.assertEqual(self.client.get(f'/single-team/?team={Team.objects.first().id}').status_code, 200)
+
+    def test_previous_archive_is_served_until_replaced(self):
+        season = Season.objects.get()
+        archive_season(season)
+        url = f'/groups/?tournament={Tournament.objects.get().id}'
+
+        def render_season(season, language):
+            self.assertTrue(os.path.exists(archive_path(season.id, language, url)))
+            return original_render_season(season, language)
+
+        original_render_season = archive.render_season
+        with mock.patch('core.archive.render_season', render_season):
+            self.assertEqual(archive_season(season), 2 * len(get_season_urls(season)))
+        self.assertTrue(os.path.exists(archive_path(season.id, 'pt-br', url)))
+        self.assertEqual(os.listdir(os.path.dirname(os.path.dirname(archive_path(season.id, 'pt-br')))),
+                         [str(season.id)])
+
+    def test_archive_names_stay_in_the_archive(self):
+        self.assertEqual(archive_name('/groups/?tournament=../../settings'),
+                         'groups_tournament-..%2F..%2Fsettings.html')
+
+
+class ReplicaRouterTest(TestCase):
+    def test_public_reads_use_the_replica_until_the_session_writes(self):
+        router = ReplicaRouter()
+        request = RequestFactory().get('/')
+        request.session = {}
+        with mock.patch('core.dbrouter.has_replica', return_value=True):
+            with use_replica(request):
+                self.assertEqual(router.db_for_read(Match), REPLICA_DB_ALIAS)
+                self.assertEqual(router.db_for_write(Match), 'default')
+            self.assertEqual(router.db_for_read(Match), 'default')
+            ReadYourWritesMiddleware(lambda request: router.db_for_write(MatchEvent) and HttpResponse())(request)
+            with use_replica(request):
+                self.assertEqual(router.db_for_read(Match), 'default')
+
+
+
+@skipUnless(connection.vendor == 'sqlite', 'The replica is a copy of the SQLite test database')
+class ReplicaDatabaseTest(TransactionTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # A second SQLite database as the replica, as with REPLICA_DATABASE_URL=sqlite:///..., added once the test
+        # databases are set up, as the replica is not one of them
+        handle, cls.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(handle)
+        cls.replica_settings = mock.patch.dict(settings.DATABASES, {
+            REPLICA_DB_ALIAS: {**connections['default'].settings_dict, 'NAME': cls.replica_path, 'TEST': {}}})
+        cls.replica_settings.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA_DB_ALIAS].close()
+        del connections[REPLICA_DB_ALIAS]
+        cls.replica_settings.stop()
+        os.remove(cls.replica_path)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        clear_snapshots()
+        create_tournament_data(tournaments=1, teams=4, players=2, events_per_match=0)
+        Match.objects.update(status_id=registry.status_id(STATUS_SCHEDULED))
+        self.replicate()
+
+    def replicate(self):
+        connections[REPLICA_DB_ALIAS].close()
+        connection.ensure_connection()
+        replica = sqlite3.connect(self.replica_path)
+        try:
+            connection.connection.backup(replica)
+        finally:
+            replica.close()
+
+    def get(self, client, url):
+        with CaptureQueriesContext(connections[REPLICA_DB_ALIAS]) as replica_queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(replica_queries)
+
+    def test_public_reads_use_the_replica_until_the_session_writes(self):
+        match = Match.objects.order_by('id').first()
+        team = match.hometeamreg.team
+        # Not replicated yet
+        Team.objects.filter(id=team.id).update(name='Time renomeado')
+        url = f'/teams/?tournament={match.group.tournament_id}'
+        response, replica_queries = self.get(self.client, url)
+        self.assertContains(response, team.name)
+        self.assertNotContains(response, 'Time renomeado')
+        self.assertGreater(replica_queries, 0)
+
+        self.client.force_login(User.objects.create_superuser('referee'))
+        response, replica_queries = self.get(self.client, url)
+        self.assertNotContains(response, 'Time renomeado')
+        self.assertGreater(replica_queries, 0)
+        events = [{'key': 'start', 'event': 'start_match', 'match': match.id, 'timestamp': '2024-02-10T10:00:00'}]
+        response = self.client.post('/match-input/batch/', json.dumps({'events': events}),
+                                    content_type='application/json')
+        self.assertEqual(response.json()['results'][0]['status'], 'applied')
+        # The session that wrote reads its writes from the primary, the others still read from the replica
+        response, replica_queries = self.get(self.client, url)
+        self.assertContains(response, 'Time renomeado')
+        self.assertEqual(replica_queries, 0)
+        response, replica_queries = self.get(self.client_class(), url)
+        self.assertNotContains(response, 'Time renomeado')
+        self.assertGreater(replica_queries, 0)
+
+class StaleWhileRevalidateTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_stale_value_is_served_while_one_request_computes(self):
+        self.assertEqual(get_or_revalidate('v1', 'latest', lambda: 'v1', 60, time.time(), 10), 'v1')
+        computing, computed = threading.Event(), []
+
+        def compute():
+            computed.append('v2')
+            computing.wait(5)
+            return 'v2'
+
+        for _ in range(3):
+            self.assertEqual(get_or_revalidate('v2', 'latest', compute, 60, time.time(), 10), 'v1')
+        computing.set()
+        deadline = time.monotonic() + 5
+        while cache.get('v2') is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual((cache.get('v2'), cache.get('latest'), computed), ('v2', 'v2', ['v2']))
+        # Too stale to be served
+        self.assertEqual(get_or_revalidate('v3', 'latest', lambda: 'v3', 60, time.time() - 20, 10), 'v3')
+
+    def test_background_computations_are_bounded(self):
+        self.assertEqual(get_or_revalidate('v1', 'latest', lambda: 'v1', 60, time.time(), 10), 'v1')
+        computing, computed = threading.Event(), []
+
+        def compute(value):
+            computed.append(value)
+            computing.wait(5)
+            return value
+
+        slots = threading.BoundedSemaphore(1)
+        with mock.patch('core.caching._revalidate_slots', slots):
+            self.assertEqual(get_or_revalidate('v2', 'latest', lambda: compute('v2'), 60, time.time(), 10), 'v1')
+            # Served stale without computing while the only slot is busy, and computed by a later request
+            self.assertEqual(get_or_revalidate('v3', 'latest', lambda: compute('v3'), 60, time.time(), 10), 'v1')
+        self.assertIsNone(cache.get('v3:computing'))
+        computing.set()
+        self.assertTrue(slots.acquire(timeout=5))
+        self.assertEqual((cache.get('v2'), computed), ('v2', ['v2']))
+
+
+class LiveStreamTest(TestCase):
+    def setUp(self):
+        create_tournament_data(tournaments=1, teams=4, players=2, events_per_match=2)
+        self.match = Match.objects.order_by('id').first()
+
+    def add_goal(self):
+        return MatchEvent.objects.create(match=self.match, teamreg=self.match.hometeamreg, eventtype=registry.eventtype(
+            'goal'), playerreg=self.match.hometeamreg.playertournamentregistration_set.first(), matchtimeminutes=3)
+
+    async def read_stream(self, last_event_id):
+        communicator = ApplicationCommunicator(live_application, {
+            'type': 'http', 'method': 'GET', 'path': f'/live/match/{self.match.id}/',
+            'query_string': f'last_event_id={last_event_id}'.encode(), 'headers': []})
+        await communicator.send_input({'type': 'http.request'})
+        start = await communicator.receive_output(5)
+        initial = (await communicator.receive_output(5))['body'].decode()
+        matchevent = await sync_to_async(self.add_goal)()
+        update = (await communicator.receive_output(5))['body'].decode()
+        update += (await communicator.receive_output(5))['body'].decode()
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(5)
+        return start['status'], initial, update, matchevent
+
+    # The test transaction must stay open, and be seen by the queries of the streams
+    @mock.patch('core.live.close_old_connections')
+    @mock.patch('core.live.LIVE_POLL_INTERVAL', 0.01)
+    @mock.patch('core.live.LIVE_QUERY_THREAD_SENSITIVE', True)
+    def test_stream_resumes_after_last_event_and_pushes_changes(self, close_old_connections):
+        first, last = MatchEvent.objects.filter(match=self.match).order_by('id')
+        status, initial, update, matchevent = async_to_sync(self.read_stream)(first.id)
+        self.assertEqual(status, 200)
+        self.assertEqual(re.findall(r'^id: (\d+)$', initial, re.M), [str(last.id)])
+        self.assertIn('"homescore": 2, "awayscore": 0', initial)
+        self.assertTrue(update.startswith(f'id: {matchevent.id}\nevent: matchevent\n'))
+        self.assertIn('"homescore": 3, "awayscore": 0', update)
+
+    async def read_feed(self, feed):
+        queue = asyncio.Queue()
+        feed.queues.add(queue)
+        poller = asyncio.ensure_future(feed.poll())
+        try:
+            return await asyncio.wait_for(queue.get(), 5)
+        finally:
+            feed.queues.discard(queue)
+            await poller
+
+    @mock.patch('core.live.close_old_connections')
+    @mock.patch('core.live.LIVE_POLL_INTERVAL', 0.01)
+    @mock.patch('core.live.LIVE_QUERY_THREAD_SENSITIVE', True)
+    def test_feed_pushes_events_committed_after_greater_ids(self, close_old_connections):
+        first, last = MatchEvent.objects.filter(match=self.match).order_by('id')
+        # Seeded from a snapshot loaded before the first event was committed, after the last one
+        feed = LiveFeed([self.match.id])
+        feed.seed({self.match.id: self.match.version - 1}, {last.id})
+        self.assertEqual(async_to_sync(self.read_feed)(feed)[::2], ('matchevent', first.id))
+        self.assertEqual(feed.event_ids, {first.id, last.id})
+
+
+class MatchInputTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        create_tournament_data(tournaments=1, teams=4, players=2, events_per_match=2)
+        Match.objects.update(status_id=registry.status_id(STATUS_SCHEDULED))
+        self.match = Match.objects.order_by('id').first()
+        self.playerreg = self.match.awayteamreg.playertournamentregistration_set.order_by('id').first()
+        self.client.force_login(User.objects.create_superuser('referee'))
+
+    def post_batch(self, events):
+        return self.client.post('/match-input/batch/', json.dumps({'events': events}), content_type='application/json')
+
+    def test_event_answers_changed_counters_and_new_row(self):
+        events = [{'key': 'start', 'event': 'start_match', 'match': self.match.id, 'timestamp': '2024-02-10T10:00:00'},
+                  {'key': 'a', 'event': 'match_event', 'match': self.match.id, 'player': self.playerreg.id,
+                   'team': 0, 'eventtype': 'goal', 'timestamp': '2024-02-10T10:05:00'}]
+        response = self.post_batch(events)
+        self.assertEqual(response.status_code, 200)
+        changes = response.json()
+        [counters] = changes['matches']
+        self.assertEqual(counters['awaygoals'], 1)
+        self.assertEqual((counters['homescore'], counters['awayscore']), (2, 1))
+        row = changes['results'][1]['matchevent']
+        self.assertEqual((row['side'], row['shirtno']), ('away', self.playerreg.shirtno))
+        # The event is recorded for the team of the player, whatever the team posted
+        self.assertEqual(MatchEvent.objects.get(id=row['id']).teamreg_id, self.match.awayteamreg_id)
+
+    def test_invalid_input_is_rejected(self):
+        other = PlayerTournamentRegistration.objects.exclude(
+            teamreg_id__in=(self.match.hometeamreg_id, self.match.awayteamreg_id)).first()
+        events = [{'key': 'a', 'event': 'match_event', 'match': self.match.id, 'player': other.id,
+                   'eventtype': 'goal', 'timestamp': '2024-02-10T10:05:00'},
+                  {'key': 'b', 'event': 'match_event', 'match': self.match.id, 'player': self.playerreg.id,
+                   'eventtype': 'dive', 'timestamp': '2024-02-10T10:05:00'},
+                  {'key': 'c', 'event': 'kickoff', 'match': self.match.id, 'timestamp': '2024-02-10T10:05:00'}]
+        results = self.post_batch(events).json()['results']
+        self.assertEqual([result['status'] for result in results], ['invalid'] * 3)
+        self.assertFalse(any('timestamp' in result['error'] for result in results))
+        # Until the player joins a team of the match
+        other.teamreg = self.match.hometeamreg
+        other.save()
+        self.assertEqual(self.post_batch(events[:1]).json()['results'][0]['status'], 'created')
+
+    def test_invalid_form_post_is_redirected_with_the_error(self):
+        events = MatchEvent.objects.count()
+        response = self.client.post(reverse('match-input'), {'match': self.match.id, 'event': 'match_event',
+                                                              'player': self.playerreg.id, 'eventtype': 'dive'},
+                                    follow=True)
+        self.assertRedirects(response, reverse('match-input') + f'?match={self.match.id}')
+        self.assertEqual(len(response.context['messages']), 1)
+        self.assertEqual(MatchEvent.objects.count(), events)
+
+    def test_batch_is_recorded_once_with_minutes_from_the_recorded_start(self):
+        events = [{'key': 'start', 'event': 'start_match', 'match': self.match.id, 'timestamp': '2024-02-10T10:00:00'},
+                  {'key': 'a', 'event': 'match_event', 'match': self.match.id, 'player': self.playerreg.id,
+                   'eventtype': 'goal', 'timestamp': '2024-02-10T10:12:30-03:00'},
+                  {'key': 'b', 'event': 'match_event', 'match': self.match.id, 'player': self.playerreg.id,
+                   'eventtype': 'dive', 'timestamp': '2024-02-10T10:13:00'},
+                  {'key': 'a', 'event': 'match_event', 'match': self.match.id, 'player': self.playerreg.id,
+                   'eventtype': 'goal', 'timestamp': '2024-02-10T10:12:30'}]
+        results = self.post_batch(events).json()['results']
+        self.assertEqual([result['status'] for result in results], ['applied', 'created', 'invalid', 'duplicate'])
+        self.assertEqual(results[1]['matchevent']['minutes'], 12.5)
+        # A replayed upload records nothing
+        count = MatchEvent.objects.count()
+        response = self.post_batch(events[1:2]).json()
+        self.assertEqual((response['results'][0]['status'], response['matches']), ('duplicate', []))
+        self.assertEqual(MatchEvent.objects.count(), count)
+        self.match.refresh_from_db()
+        self.assertEqual((self.match.status_id, self.match.awaygoals), (2, 1))
+
+    def test_replayed_start_and_finish_keep_the_recorded_status(self):
+        events = [{'key': 'start', 'event': 'start_match', 'match': self.match.id, 'timestamp': '2024-02-10T10:00:00'},
+                  {'key': 'finish', 'event': 'finish_match', 'match': self.match.id,
+                   'timestamp': '2024-02-10T10:40:00'},
+                  {'key': 'a', 'event': 'match_event', 'match': self.match.id, 'player': self.playerreg.id,
+                   'eventtype': 'goal', 'timestamp': '2024-02-10T10:12:30'}]
+        results = self.post_batch(events + events[2:]).json()['results']
+        self.assertEqual([result['status'] for result in results], ['applied', 'applied', 'created', 'duplicate'])
+        self.assertEqual(results[3]['matchevent'], results[2]['matchevent']['id'])
+        self.match.refresh_from_db()
+        recorded = (self.match.status_id, self.match.actualstart, self.match.actualfinish)
+        self.assertEqual([result['status'] for result in self.post_batch(events[:2]).json()['results']],
+                         ['duplicate', 'duplicate'])
+        # A start posted later by the other official does not move the match back
+        response = self.post_batch([dict(events[0], key='start-2', timestamp='2024-02-10T10:50:00')]).json()
+        self.assertEqual((response['results'][0]['status'], response['matches']), ('ignored', []))
+        self.match.refresh_from_db()
+        self.assertEqual((self.match.status_id, self.match.actualstart, self.match.actualfinish), recorded)
+        self.assertEqual(recorded[0], 3)
+
+
+class MatchdayInputTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        create_tournament_data(tournaments=1, teams=4, players=2, events_per_match=0)
+        Match.objects.update(datetime=datetime(2024, 2, 10, 13, tzinfo=timezone.utc),
+                             status_id=registry.status_id(STATUS_SCHEDULED))
+        self.matches = list(Match.objects.order_by('id')[:2])
+        self.client.force_login(User.objects.create_superuser('organizer'))
+
+    def playerreg(self, teamreg):
+        return teamreg.playertournamentregistration_set.order_by('id').first()
+
+    def post(self, sheets):
+        return self.client.post('/matchday-input/batch/', json.dumps({'matches': sheets}),
+                                content_type='application/json')
+
+    def test_page_lists_every_match_of_the_day(self):
+        Match.objects.filter(id=self.matches[0].id).update(status_id=registry.status_id(STATUS_FINISHED))
+        response = self.client.get(f'/matchday-input/?tournament={self.matches[0].group.tournament_id}'
+                                   f'&date=2024-02-10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['matchday']), Match.objects.count())
+        self.assertContains(response, 'data-matchday-finished checked', count=1)
+
+    def test_sheets_are_recorded_at_once_with_the_stats_changes(self):
+        first, second = self.matches
+        sheets = [{'match': first.id, 'finished': True,
+                   'events': [{'player': self.playerreg(first.hometeamreg).id, 'eventtype': 'goal', 'count': 3},
+                              {'player': self.playerreg(first.awayteamreg).id, 'eventtype': 'yellow card'}]},
+                  {'match': second.id, 'finished': False,
+                   'events': [{'player': self.playerreg(second.awayteamreg).id, 'eventtype': 'foul', 'count': 2}]}]
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.post(sheets)
+        self.assertEqual((response.status_code, response.json()['created']), (200, 6))
+        # Added to the stored stats instead of refreshing them once committed
+        self.assertEqual(len(callbacks), 0)
+        self.assertEqual(PersonStats.objects.get(person_id=self.playerreg(first.hometeamreg).person_id).goals, 3)
+        self.assertEqual(first.hometeamreg.team.stats.wins, 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status_id, first.homegoals, first.awayyellowcards), (3, 3, 1))
+        self.assertEqual((second.status_id, second.awayfouls), (registry.status_id(STATUS_SCHEDULED), 2))
+
+    def test_nothing_is_recorded_unless_every_sheet_is_valid(self):
+        first, second = self.matches
+        outsider = PlayerTournamentRegistration.objects.exclude(
+            teamreg_id__in=(second.hometeamreg_id, second.awayteamreg_id)).first()
+        sheets = [{'match': first.id, 'finished': True,
+                   'events': [{'player': self.playerreg(first.hometeamreg).id, 'eventtype': 'goal'}]},
+                  {'match': second.id, 'events': [{'player': outsider.id, 'eventtype': 'goal'}]},
+                  {'match': 0, 'events': []}]
+        response = self.post(sheets)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(len(response.json()['errors']), 2)
+        sheets[1]['events'][0]['eventtype'] = 'dive'
+        self.assertEqual(self.post(sheets).status_code, 400)
+        self.assertFalse(MatchEvent.objects.exists())
+        self.assertEqual(Match.objects.get(id=first.id).status_id, registry.status_id(STATUS_SCHEDULED))
+
+
+class MatchInputLockTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_tournament_data(tournaments=1, teams=4, players=2, events_per_match=0)
+
+    def setUp(self):
+        self.match = Match.objects.order_by('id').first()
+        self.playerregs = [teamreg.playertournamentregistration_set.order_by('id').first()
+                           for teamreg in (self.match.hometeamreg, self.match.awayteamreg)]
+
+    def test_event_input_locks_the_match_without_key_and_keeps_exact_counts(self):
+        # Ignored by sqlite, so the locks taken are checked on the querysets rather than by racing writers
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True,
+                               side_effect=QuerySet.select_for_update) as select_for_update:
+            for i in range(8):
+                record_match_input({'event': 'match_event', 'match': self.match.id,
+                                    'player': self.playerregs[i % 2].id, 'eventtype': ('goal', 'foul')[i // 2 % 2]})
+        match_locks = [call for call in select_for_update.call_args_list if call.args[0].model is Match]
+        self.assertGreaterEqual(len(match_locks), 8)
+        self.assertTrue(all(call.kwargs.get('no_key') for call in select_for_update.call_args_list))
+        self.match.refresh_from_db()
+        self.assertEqual((self.match.homegoals, self.match.homefouls, self.match.awaygoals, self.match.awayfouls),
+                         (2, 2, 2, 2))
+        self.assertEqual(PersonStats.objects.get(person_id=self.playerregs[0].person_id).goals, 2)
+        self.assertEqual(PersonStats.objects.get(person_id=self.playerregs[1].person_id).fouls, 2)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class MatchInputConcurrencyTest(TransactionTestCase):
+    def test_concurrent_input_on_one_match_keeps_exact_counts(self):
+        cache.clear()
+        create_tournament_data(tournaments=1, teams=4, players=2, events_per_match=0)
+        match = Match.objects.order_by('id').first()
+        playerregs = [teamreg.playertournamentregistration_set.order_by('id').first()
+                      for teamreg in (match.hometeamreg, match.awayteamreg)]
+        threads, events_per_thread, errors = 8, 10, []
+
+        def record(thread):
+            # The referee and the match official posting on both sides at once
+            try:
+                for i in range(events_per_thread):
+                    record_match_input({'event': 'match_event', 'match': match.id,
+                                        'player': playerregs[thread % 2].id, 'eventtype': ('goal', 'foul')[i % 2]})
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=record, args=(thread, )) for thread in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        expected = threads // 2 * events_per_thread // 2
+        match.refresh_from_db()
+        self.assertEqual((match.homegoals, match.homefouls, match.awaygoals, match.awayfouls), (expected, ) * 4)
+        self.assertEqual(MatchEvent.objects.filter(match=match).count(), threads * events_per_thread)
+        # Refreshed once each write was committed
+        self.assertEqual(PersonStats.objects.get(person_id=playerregs[0].person_id).goals, expected)
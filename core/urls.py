@@ -3,8 +3,9 @@ from django.urls import path
 from .views import IndexView, SetSeasonView, GroupsView, SingleGroupView, SingleResultView, FixturesView, TeamsView, \
     SingleTeamView, CustomLoginView, CustomLogoutView, CustomSignupView, PersonDataView, CustomPasswordResetView, \
     CustomPasswordResetDoneView, CustomPasswordResetConfirmView, CustomPasswordResetCompleteView, SinglePlayerView, \
-    MatchInputView, MatchEventAddView, MatchEventListVew, MatchEventUpdateView, MatchEventDeleteView, PlayersView, \
-    ContactView, FixturesInputView, AwardsView
+    MatchInputView, MatchInputBatchView, MatchdayInputView, MatchdayInputBatchView, \
+    MatchEventAddView, MatchEventListVew, MatchEventUpdateView, MatchEventDeleteView, PlayersView, ContactView, \
+    FixturesInputView, AwardsView
 
 urlpatterns = [
     path('', IndexView.as_view(), name='index'),
@@ -27,6 +28,9 @@ urlpatterns = [
     path('reset/<uidb64>/<token>/', CustomPasswordResetConfirmView.as_view(), name='password_reset_confirm'),
     path('password_reset/complete/', CustomPasswordResetCompleteView.as_view(), name='password_reset_complete'),
     path('match-input/', MatchInputView.as_view(), name='match-input'),
+    path('match-input/batch/', MatchInputBatchView.as_view(), name='match-input-batch'),
+    path('matchday-input/', MatchdayInputView.as_view(), name='matchday-input'),
+    path('matchday-input/batch/', MatchdayInputBatchView.as_view(), name='matchday-input-batch'),
     path('match-event/', MatchEventListVew.as_view(), name='match-event'),
     path('match-event/<int:pk>/edit', MatchEventUpdateView.as_view(), name='match-event-update'),
     path('match-event/<int:pk>/delete', MatchEventDeleteView.as_view(), name='match-event-delete'),
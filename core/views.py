@@ -1,17 +1,19 @@
+import json
 from datetime import datetime, timezone
 
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.mixins import PermissionRequiredMixin
-from django.contrib.auth.models import Group as UserGroup
 from django.contrib.auth.views import LoginView, LogoutView, PasswordResetView, PasswordResetDoneView, \
     PasswordResetConfirmView, PasswordResetCompleteView
-from django.db.models import IntegerField
+from django.core.exceptions import ValidationError
+from django.db.models import IntegerField, Q
 from django.db.models.functions import Cast
 from django.http import JsonResponse, QueryDict
 from django.shortcuts import render, redirect
 from django.urls import reverse, reverse_lazy
+from django.utils.dateparse import parse_date
 from django.utils.translation import activate, get_language
 from django.views.generic import FormView, ListView, UpdateView, DeleteView
 from django.views.generic.base import TemplateView, View
@@ -20,20 +22,19 @@ from django.utils.translation import gettext as _
 from futebloco.settings import LANGUAGE_CODE, TIME_ZONE
 from .forms import PersonForm, CustomUserCreationForm, CustomPasswordResetForm, CustomSetPasswordForm, MatchEventForm, \
     ContactForm
-from .models import Tournament, Group, Match, Season, MatchEvent, Team, TeamTournamentRegistration, \
-    PlayerTournamentRegistration, Person, MatchEventType, Genre
+from .models import MATCH_SUMMARY_EVENTTYPES, Tournament, Group, Match, MatchEvent, Team, TeamTournamentRegistration, \
+    PlayerTournamentRegistration, Person, Genre
+from .boxscore import get_team_tables
+from .context_processors import get_common_info
 from .gmaplink import gmaplink
+from .matchinput import get_matchday, record_match_input, record_match_input_batch, record_matchday
+from .pagecache import VersionedPageCacheMixin
+from .registry import registry, GAMESTAGE_GROUP, STATUS_FINISHED
+from .snapshot import get_snapshot, get_snapshots, sort_by_date
 import pytz
 from icecream import ic
 
 
-def try_int(x):
-    try:
-        return int(x)
-    except ValueError:
-        return 1000000
-
-
 class SetSeasonView(View):
     @staticmethod
     def get(request):
@@ -43,44 +44,30 @@ class SetSeasonView(View):
         return redirect(to='index')
 
 
-def user_belongs_to_group(user, group_name):
-    try:
-        group = UserGroup.objects.get(name=group_name)
-        return user.groups.filter(name=group_name).exists()
-    except UserGroup.DoesNotExist:
-        return False
-
-
-def get_common_info(request):
-    # Season info
-    all_seasons = Season.objects.all()
-    season_id = request.session['season'] if 'season' in request.session else Season.objects.last().id
-    season = Season.objects.get(id=season_id)
-    all_tournaments_season = Tournament.objects.filter(season=season)
-    # User info
-    is_referee = user_belongs_to_group(request.user, 'referee')
-    return {'all_seasons': all_seasons, 'season_id': season_id, 'season': season,
-            'all_tournaments_season': all_tournaments_season, 'is_referee': is_referee}
-
-
-class IndexView(TemplateView):
+class IndexView(VersionedPageCacheMixin, TemplateView):
     template_name = 'index.html'
 
+    def get_page_tournaments(self, request, season_id):
+        return None
+
     def get(self, request, *args, **kwargs):
         common_info = get_common_info(request)
         return render(request, self.template_name, self.get_context_data(**common_info))
 
 
-class GroupsView(TemplateView):
+class GroupsView(VersionedPageCacheMixin, TemplateView):
     template_name = 'groups.html'
+    serve_stale = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if kwargs['tournament_id'] != 0:
-            tournaments = Tournament.objects.filter(id=kwargs['tournament_id'])
+            tournaments = list(Tournament.objects.filter(id=kwargs['tournament_id']))
         else:
-            tournaments = Tournament.objects.filter(season=context['season'])
-        groups_by_tournament = [Group.objects.filter(gamestage__id=1, tournament=t) for t in tournaments]
+            tournaments = list(Tournament.objects.filter(season=context['season']))
+        groups_by_tournament = [[(group, snapshot.standings[group.id])
+                                 for group in snapshot.get_groups(registry.gamestage_id(GAMESTAGE_GROUP))]
+                                for snapshot in get_snapshots(tournaments)]
         context['tournaments'] = tournaments
         context['groups_by_tournament'] = groups_by_tournament
         # context['groups'] = groups
@@ -92,16 +79,21 @@ class GroupsView(TemplateView):
         return render(request, self.template_name, self.get_context_data(**common_info, tournament_id=tournament_id))
 
 
-class SingleGroupView(TemplateView):
+class SingleGroupView(VersionedPageCacheMixin, TemplateView):
     template_name = 'single-group.html'
+    serve_stale = True
+
+    def get_page_tournaments(self, request, season_id):
+        return Q(group__id=int(request.GET['group']) if 'group' in request.GET else 0)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        group = Group.objects.get(id=kwargs['group_id'])
-        matches = Match.objects.filter(group=group).order_by('matchno')
-        context['group'] = group
-        context['group_results'] = group.get_results()
-        context['matches'] = matches
+        tournament_id, version = Tournament.objects.filter(group__id=kwargs['group_id']) \
+            .values_list('id', 'version').get()
+        snapshot = get_snapshot(tournament_id, version)
+        context['group'] = snapshot.get_group(kwargs['group_id'])
+        context['group_results'] = snapshot.standings[kwargs['group_id']]
+        context['matches'] = snapshot.get_matches(group_id=kwargs['group_id'])
         return context
 
     def get(self, request, *args, **kwargs):
@@ -110,36 +102,24 @@ class SingleGroupView(TemplateView):
         return render(request, self.template_name, self.get_context_data(**common_info, group_id=group_id))
 
 
-class SingleResultView(TemplateView):
+class SingleResultView(VersionedPageCacheMixin, TemplateView):
     template_name = 'single-result.html'
 
+    def get_page_tournaments(self, request, season_id):
+        return Q(group__match__id=int(request.GET['match']) if 'match' in request.GET else 0)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        match = Match.objects.get(id=kwargs['match_id'])
-        matchevents = MatchEvent.objects.filter(match=match)
-        team_tables = [
-            [
-                [
-                    (p.shirtno, ),
-                    (p.person.short, ),
-                    (p.get_goal_count_at_match(match), p.id, t.id, 'goal'),
-                    (p.get_foul_count_at_match(match), p.id, t.id, 'foul'),
-                    (p.get_yellowcard_count_at_match(match), p.id, t.id, 'yellow card'),
-                    (p.get_redcard_count_at_match(match), p.id, t.id, 'red card'),
-                    (p.get_owngoal_count_at_match(match), p.id, t.id, 'own goal'),
-                    (p.get_tiebreakgoal_count_at_match(match), p.id, t.id, 'tie-break penalty goal'),
-                ]
-                for p in PlayerTournamentRegistration.objects.filter(teamreg=t)
-            ]
-            for t in [match.hometeamreg, match.awayteamreg]
-        ]
-        team_tables[0].sort(key=lambda x: try_int(x[0][0]))
-        team_tables[1].sort(key=lambda x: try_int(x[0][0]))
+        match = Match.objects.with_stats().get(id=kwargs['match_id'])
+        matchevents = MatchEvent.objects.filter(match=match).select_related('eventtype', 'playerreg__person', 'teamreg')
+        team_tables = get_team_tables(match)
         context['match'] = match
         context['matchevents'] = matchevents
         context['team_tables'] = team_tables
         context['gmaplink'] = gmaplink(match.venue.address)
         context['input_permission'] = False
+        # The live updates of the page start after its last event (see core.live)
+        context['last_event_id'] = max((matchevent.id for matchevent in matchevents), default=0)
         return context
 
     def get(self, request, *args, **kwargs):
@@ -148,19 +128,19 @@ class SingleResultView(TemplateView):
         return render(request, self.template_name, self.get_context_data(**common_info, match_id=match_id))
 
 
-class FixturesView(TemplateView):
+class FixturesView(VersionedPageCacheMixin, TemplateView):
     template_name = 'fixtures.html'
+    serve_stale = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         if kwargs['tournament_id'] != 0:
             tournament = Tournament.objects.get(id=kwargs['tournament_id'])
-            matches = Match.objects.filter(group__tournament=tournament).order_by('datetime')
             context['tournament'] = tournament
-            context['matches'] = matches
+            context['matches'] = get_snapshot(tournament.id, tournament.version).get_matches()
         else:
-            matches = Match.objects.filter(group__tournament__season=kwargs['season']).order_by('datetime')
-            context['matches'] = matches
+            snapshots = get_snapshots(Tournament.objects.filter(season=kwargs['season']))
+            context['matches'] = sort_by_date([match for snapshot in snapshots for match in snapshot.matches])
             context['show_tournament'] = True
         context['show_group'] = True
         return context
@@ -172,28 +152,35 @@ class FixturesView(TemplateView):
 
 
 class FixturesInputView(FixturesView):
+    # The referees pick the matches to input from this list, which must be current
+    read_from_replica = False
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['to_input'] = True
         return context
 
 
-class TeamsView(TemplateView):
+class TeamsView(VersionedPageCacheMixin, TemplateView):
     template_name = 'teams.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        group_stage_id = registry.gamestage_id(GAMESTAGE_GROUP)
         if kwargs['tournament_id'] != 0:
             tournaments = Tournament.objects.filter(id=kwargs['tournament_id'])
             teamregs = TeamTournamentRegistration.objects.filter(tournament=tournaments[0]).order_by('team__name')
-            groups = [Group.objects.get(tournament=tournaments[0], teams=tr, gamestage__id=1) for tr in teamregs]
-            group_filter = Group.objects.filter(teams__in=teamregs, gamestage_id=1).order_by('name').distinct()
+            groups = [Group.objects.get(tournament=tournaments[0], teams=tr, gamestage_id=group_stage_id)
+                      for tr in teamregs]
+            group_filter = Group.objects.filter(teams__in=teamregs, gamestage_id=group_stage_id).order_by('name') \
+                .distinct()
         else:
             tournaments = Tournament.objects.filter(season=kwargs['season'])
             teamregs = TeamTournamentRegistration.objects.filter(tournament__in=tournaments).order_by('team__name')
-            groups = [Group.objects.get(tournament__in=tournaments, teams=tr, gamestage__id=1) for tr in teamregs]
-            group_filter = Group.objects.filter(teams__in=teamregs, gamestage_id=1).order_by('tournament__id',
-                                                                                             'name').distinct()
+            groups = [Group.objects.get(tournament__in=tournaments, teams=tr, gamestage_id=group_stage_id)
+                      for tr in teamregs]
+            group_filter = Group.objects.filter(teams__in=teamregs, gamestage_id=group_stage_id) \
+                .order_by('tournament__id', 'name').distinct()
         context['tournaments'] = tournaments
         context['teamregs_groups'] = zip(teamregs, groups)
         context['group_filter'] = group_filter
@@ -205,16 +192,21 @@ class TeamsView(TemplateView):
         return render(request, self.template_name, self.get_context_data(**common_info, tournament_id=tournament_id))
 
 
-class SingleTeamView(TemplateView):
+class SingleTeamView(VersionedPageCacheMixin, TemplateView):
     template_name = 'single-team.html'
 
+    def get_page_tournaments(self, request, season_id):
+        # The team page shows the matches and stats of the team in every tournament
+        return Q(teamtournamentregistration__team_id=int(request.GET['team']) if 'team' in request.GET else 0)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         team = Team.objects.get(id=kwargs['team_id'])
         teamreg = TeamTournamentRegistration.objects.filter(team=team, tournament__season=kwargs['season']).last()
-        players = PlayerTournamentRegistration.objects.filter(teamreg=teamreg) if teamreg is not None else None
+        players = PlayerTournamentRegistration.objects.filter(teamreg=teamreg) \
+            .select_related('person', 'teamreg__team') if teamreg is not None else None
         matches = (Match.objects.filter(hometeamreg__team=team) | Match.objects.filter(
-            awayteamreg__team=team)).order_by('-datetime')
+            awayteamreg__team=team)).with_stats().order_by('-datetime')
         context['team'] = team
         context['teamreg'] = teamreg
         context['players'] = players
@@ -228,7 +220,7 @@ class SingleTeamView(TemplateView):
         return render(request, self.template_name, self.get_context_data(**common_info, team_id=team_id))
 
 
-class PlayersView(TemplateView):
+class PlayersView(VersionedPageCacheMixin, TemplateView):
     template_name = 'players.html'
 
     def get_context_data(self, **kwargs):
@@ -242,7 +234,8 @@ class PlayersView(TemplateView):
             teams = TeamTournamentRegistration.objects.filter(tournament__season=kwargs['season']).values('team')
             genre_filter = Genre.objects.filter(team__in=teams).distinct()
             context['genre_filter'] = genre_filter
-        context['players'] = players.order_by('person__name')
+        context['players'] = players.select_related('person', 'teamreg__team', 'teamreg__tournament__genre') \
+            .order_by('person__name')
         context['show_team'] = True
         return context
 
@@ -252,9 +245,14 @@ class PlayersView(TemplateView):
         return render(request, self.template_name, self.get_context_data(**common_info, tournament_id=tournament_id))
 
 
-class SinglePlayerView(TemplateView):
+class SinglePlayerView(VersionedPageCacheMixin, TemplateView):
     template_name = 'single-player.html'
 
+    def get_page_tournaments(self, request, season_id):
+        # The player page shows the registrations and career stats of the person in every tournament
+        person_id = int(request.GET['player']) if 'player' in request.GET else 0
+        return Q(teamtournamentregistration__playertournamentregistration__person_id=person_id)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         person = Person.objects.get(id=kwargs['player_id'])
@@ -361,57 +359,17 @@ class MatchInputView(PermissionRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        match = Match.objects.get(id=kwargs['match_id'])
-        matchevents = MatchEvent.objects.filter(match=match)
-        team_tables = [
-            [
-                [
-                    (p.shirtno, ),
-                    (p.person.short, ),
-                    (p.get_goal_count_at_match(match), p.id, t.id, 'goal'),
-                    (p.get_foul_count_at_match(match), p.id, t.id, 'foul'),
-                    (p.get_yellowcard_count_at_match(match), p.id, t.id, 'yellow card'),
-                    (p.get_redcard_count_at_match(match), p.id, t.id, 'red card'),
-                    (p.get_owngoal_count_at_match(match), p.id, t.id, 'own goal'),
-                    (p.get_tiebreakgoal_count_at_match(match), p.id, t.id, 'tie-break penalty goal'),
-                ]
-                for p in PlayerTournamentRegistration.objects.filter(teamreg=t)
-            ]
-            for t in [match.hometeamreg, match.awayteamreg]
-        ]
-        team_tables[0].sort(key=lambda x: try_int(x[0][0]))
-        team_tables[1].sort(key=lambda x: try_int(x[0][0]))
+        match = Match.objects.with_stats().get(id=kwargs['match_id'])
+        matchevents = MatchEvent.objects.filter(match=match).select_related('eventtype', 'playerreg__person', 'teamreg')
+        team_tables = get_team_tables(match)
         context['match'] = match
         context['matchevents'] = matchevents
         context['team_tables'] = team_tables
         context['gmaplink'] = gmaplink(match.venue.address)
         context['input_permission'] = True
+        context['last_event_id'] = max((matchevent.id for matchevent in matchevents), default=0)
         return context
 
-    @staticmethod
-    def process_event(request):
-        match = Match.objects.get(id=int(request.POST['match']))
-        if request.POST['event'] == 'start_match':
-            match.actualstart = datetime.now(pytz.timezone(TIME_ZONE))
-            match.status = 2
-            match.save()
-        elif request.POST['event'] == 'finish_match':
-            match.actualfinish = datetime.now(pytz.timezone(TIME_ZONE))
-            match.status = 3
-            match.save()
-        elif request.POST['event'] == 'match_event':
-            timestamp = datetime.now(pytz.timezone(TIME_ZONE))
-            minutes = (timestamp-match.actualstart).total_seconds() / 60 if match.actualstart is not None else 0
-            matchevent = MatchEvent(
-                timestamp=timestamp,
-                matchtimeminutes=minutes,
-                match=match,
-                playerreg=PlayerTournamentRegistration.objects.get(id=int(request.POST['player'])),
-                teamreg=TeamTournamentRegistration.objects.get(id=int(request.POST['team'])),
-                eventtype=MatchEventType.objects.get(name=str(request.POST['eventtype'])),
-            )
-            matchevent.save()
-
     def get(self, request, *args, **kwargs):
         common_info = get_common_info(request)
         match_id = int(request.GET['match']) if 'match' in request.GET else (
@@ -420,11 +378,83 @@ class MatchInputView(PermissionRequiredMixin, TemplateView):
 
     def post(self, request, *args, **kwargs):
         match_id = int(request.POST['match']) if 'match' in request.POST else 0
-        self.process_event(request)
+        try:
+            record_match_input(request.POST)
+        except ValidationError as error:
+            messages.error(request, ' '.join(error.messages))
         target_url = reverse('match-input') + f'?match={match_id}'
         return redirect(to=target_url)
 
 
+class MatchInputBatchView(PermissionRequiredMixin, View):
+    """Records the batch of actions queued by the match input page (see record_match_input_batch), posted as JSON
+    {'events': [...]}, and answers the result of each action"""
+    permission_required = 'core.add_matchevent'
+    raise_exception = True
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body)
+            results = record_match_input_batch(data.get('events') if isinstance(data, dict) else None)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+        except ValidationError as error:
+            return JsonResponse({'success': False, 'error': ' '.join(error.messages)}, status=400)
+        return JsonResponse({'success': True, **results})
+
+
+class MatchdayInputView(PermissionRequiredMixin, TemplateView):
+    """Entry of the final sheets of every match of a tournament (or of the season) on a date, all recorded at once by
+    MatchdayInputBatchView"""
+    template_name = 'matchday-input.html'
+    permission_required = 'core.add_matchevent'
+    permission_denied_message = _('Usuário não autorizado')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        matches = Match.objects.filter(datetime__date=kwargs['date'])
+        if kwargs['tournament_id'] != 0:
+            matches = matches.filter(group__tournament_id=kwargs['tournament_id'])
+        else:
+            matches = matches.filter(group__tournament__season=kwargs['season'])
+        context['date'] = kwargs['date']
+        context['tournament_id'] = kwargs['tournament_id']
+        context['matchday'] = get_matchday(matches)
+        context['finished_id'] = registry.status_id(STATUS_FINISHED)
+        context['eventtypes'] = [registry.eventtype(name) for name in MATCH_SUMMARY_EVENTTYPES.values()]
+        return context
+
+    def get(self, request, *args, **kwargs):
+        common_info = get_common_info(request)
+        tournament_id = int(request.GET['tournament']) if request.GET.get('tournament') else 0
+        try:
+            date = parse_date(request.GET.get('date', ''))
+        except ValueError:
+            date = None
+        if date is None:
+            date = datetime.now(pytz.timezone(TIME_ZONE)).date()
+        return render(request, self.template_name,
+                      self.get_context_data(**common_info, tournament_id=tournament_id, date=date))
+
+
+class MatchdayInputBatchView(PermissionRequiredMixin, View):
+    """Records the final sheets of a matchday (see record_matchday), posted as JSON {'matches': [...]}, and answers
+    the counters of the matches"""
+    permission_required = 'core.add_matchevent'
+    raise_exception = True
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body)
+            results = record_matchday(data.get('matches') if isinstance(data, dict) else None)
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+        except ValidationError as error:
+            return JsonResponse({'success': False, 'error': ' '.join(error.messages), 'errors': error.messages},
+                                status=400)
+        return JsonResponse({'success': True, **results})
+
+
 class MatchEventAddView(TemplateView):
     template_name = 'match-event-add.html'
 
@@ -441,7 +471,7 @@ class MatchEventAddView(TemplateView):
         playerreg_id = int(request.GET['player']) if 'player' in request.GET else 0
         teamreg_id = int(request.GET['team']) if 'team' in request.GET else 0
         eventtype_name = str(request.GET['eventtype']) if 'eventtype' in request.GET else None
-        eventtype = MatchEventType.objects.get(name=eventtype_name) if eventtype_name is not None else 0
+        eventtype = registry.eventtype(eventtype_name) if eventtype_name is not None else 0
         if match is not None and match.actualstart is not None:
             minutes = (timestamp-match.actualstart).total_seconds() / 60
         else:
@@ -519,8 +549,9 @@ class ContactView(FormView):
         return super(ContactView, self).form_invalid(form)
 
 
-class AwardsView(TemplateView):
+class AwardsView(VersionedPageCacheMixin, TemplateView):
     template_name = 'awards.html'
+    serve_stale = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -528,14 +559,11 @@ class AwardsView(TemplateView):
             tournaments = Tournament.objects.filter(id=kwargs['tournament_id'])
         else:
             tournaments = Tournament.objects.filter(season=context['season'])
-        topscorer = [sorted(PlayerTournamentRegistration.objects.filter(teamreg__tournament=tournament),
-                            key=lambda g: g.get_goal_count(), reverse=True) for tournament in tournaments]
-        fairplay = [sorted(TeamTournamentRegistration.objects.filter(tournament=tournament),
-                           key=lambda t: t.get_fairplay_score(), reverse=False) for tournament in tournaments]
-        topscorer = [[t for t in t_ if t.get_goal_count() > 0] for t_ in topscorer]
-        if len(tournaments) > 1:
-            topscorer = [t_[:10] for t_ in topscorer]
-        context['tournament_topscorer_fairplay'] = zip(tournaments, topscorer, fairplay)
+        snapshots = get_snapshots(tournaments)
+        limit = 10 if len(snapshots) > 1 else None
+        context['tournament_leaderboards'] = [(snapshot.tournament, snapshot.get_topscorers(limit),
+                                               snapshot.get_card_leaders(limit), snapshot.get_fairplay())
+                                              for snapshot in snapshots]
         return context
 
     def get(self, request, *args, **kwargs):
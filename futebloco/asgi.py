@@ -9,8 +9,22 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from asgiref.wsgi import WsgiToAsgi
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'futebloco.settings')
 
-application = get_asgi_application()
+# The pages are served by the WSGI application (with its static and media files). WsgiToAsgi runs them one at a time,
+# in the single thread a process keeps for synchronous code, so the pages scale with the worker processes, and the
+# queries of the live streams run in threads of their own (see core.live.query)
+from futebloco.wsgi import application as wsgi_application  # noqa: E402
+# The live streams are served by an asynchronous application, as Django only streams responses from synchronous
+# iterators, holding a thread for each open stream
+from core.live import LIVE_PATH, live_application  # noqa: E402
+
+pages_application = WsgiToAsgi(wsgi_application)
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'http' and scope['path'].startswith(LIVE_PATH):
+        return await live_application(scope, receive, send)
+    return await pages_application(scope, receive, send)
@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.dbrouter.ReadYourWritesMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -69,6 +70,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.context_processors.common_info',
             ],
         },
     },
@@ -83,6 +85,32 @@ DATABASE_URL = os.environ.get('DATABASE_URL')
 
 DATABASES = {'default': dj_database_url.config(default=DATABASE_URL, conn_max_age=600, ssl_require=True)}
 
+# Optional read replica for the public pages (see core.dbrouter). It may be a copy of a local SQLite database, e.g.
+# REPLICA_DATABASE_URL=sqlite:////path/to/replica.sqlite3. The tests use the default database in its place
+REPLICA_DATABASE_URL = os.environ.get('REPLICA_DATABASE_URL')
+
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = dj_database_url.parse(REPLICA_DATABASE_URL, conn_max_age=600,
+                                                 ssl_require=not REPLICA_DATABASE_URL.startswith('sqlite'),
+                                                 test_options={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['core.dbrouter.ReplicaRouter']
+
+# Cache shared by the gunicorn workers: the memcached servers listed in MEMCACHED_SERVERS in production, or else a
+# local SQLite file, enough for development and tests
+MEMCACHED_SERVERS = os.environ.get('MEMCACHED_SERVERS')
+
+if MEMCACHED_SERVERS:
+    CACHES = {'default': {'BACKEND': 'core.caching.MemcachedCache', 'LOCATION': MEMCACHED_SERVERS.split(',')}}
+else:
+    CACHES = {'default': {'BACKEND': 'core.caching.SQLiteCache',
+                          'LOCATION': os.environ.get('CACHE_PATH', os.path.join(BASE_DIR, 'cache.sqlite3')),
+                          'OPTIONS': {'MAX_ENTRIES': 10000}}}
+
+# Seconds the last render of a busy page (standings, fixtures, awards) may still be served after its data changed,
+# while a single worker renders the new one, see core.pagecache
+PAGE_CACHE_MAX_STALENESS = int(os.environ.get('PAGE_CACHE_MAX_STALENESS', 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -122,6 +150,8 @@ STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Static copies of the pages of the closed seasons, answered in place of the pages (see core.archive)
+ARCHIVE_ROOT = os.path.join(BASE_DIR, 'archive')
 
 # Global variables
 LOGIN_URL = 'login'
@@ -0,0 +1,11 @@
+# Gunicorn settings, loaded from the working directory (see Procfile)
+
+
+def post_worker_init(worker):
+    """Builds the tournament snapshots of the current season before the worker serves its first request"""
+    from core.snapshot import warm_snapshots
+    try:
+        warm_snapshots()
+    except Exception:
+        # A worker without snapshots still works: they are built on first use
+        worker.log.exception('Could not warm the tournament snapshots')
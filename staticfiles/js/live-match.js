@@ -0,0 +1,134 @@
+// live-match.js
+
+$(document).ready(function() {
+    // Access the stream URL and the state of the rendered page from the data attributes
+    var script = $('script[src*="live-match.js"]');
+    var liveUrl = script.attr('data-live-url');
+    var matchId = parseInt(script.attr('data-match'), 10);
+    var lastEventId = parseInt(script.attr('data-last-event-id'), 10) || 0;
+    var knownEvents = parseInt(script.attr('data-events'), 10) || 0;
+    var addedEvents = new Set();
+    var timerInterval = null;
+
+    function time(isoTime) {
+        return new Date(isoTime).toLocaleTimeString('pt-BR', {hour12: false});
+    }
+
+    function minutes(event) {
+        return Math.round(event.minutes || 0);
+    }
+
+    function startTimer(isoStartTime) {
+        var startTime = new Date(isoStartTime);
+        var timer = $('[data-live-timer]').empty().append('<h1 id="timer"></h1>').find('h1');
+
+        function updateElapsedTime() {
+            var elapsedTime = new Date() - startTime;
+            var minutes = Math.floor(elapsedTime / 60000);
+            var seconds = Math.floor((elapsedTime % 60000) / 1000);
+            timer.text(`${minutes.toString().padStart(2, '0')}:${seconds.toString().padStart(2, '0')}`);
+        }
+
+        updateElapsedTime();
+        timerInterval = setInterval(updateElapsedTime, 1000);
+    }
+
+    // Applies the state of the match, or the part of it that changed
+    function updateMatch(state) {
+        if (state.match !== matchId) {
+            return;
+        }
+        // Events deleted or missed by the stream: the page is rendered again
+        if (state.events !== undefined && state.events !== knownEvents) {
+            location.reload();
+            return;
+        }
+        $('[data-live-field]').each(function() {
+            var field = $(this).attr('data-live-field');
+            if (!(field in state)) {
+                return;
+            }
+            var value = state[field];
+            $(this).text(value);
+            if (field.endsWith('fouls') && this.tagName === 'H1') {
+                $(this).css({'color': value > 4 ? '#ff0000' : '', 'font-weight': value > 4 ? 'bold' : ''});
+            }
+        });
+        var score = $('[data-live-score]');
+        if (state.homescore !== undefined) {
+            if (score.is('[data-live-tiebreak]') && state.homescore === state.awayscore) {
+                score.text(`${state.homescore} (${state.hometiebreakgoals}) : (${state.awaytiebreakgoals}) ${state.awayscore}`);
+            } else {
+                score.text(`${state.homescore} : ${state.awayscore}`);
+            }
+        }
+        if (state.actualstart) {
+            $('[data-live-start]').text('Partida iniciada às ' + time(state.actualstart));
+            if (!state.actualfinish && !$('#timer').length) {
+                startTimer(state.actualstart);
+            }
+        }
+        if (state.actualfinish) {
+            $('[data-live-finish]').text('Partida finalizada às ' + time(state.actualfinish));
+            clearInterval(timerInterval);
+            $('#timer').remove();
+        }
+    }
+
+    function addEvent(event) {
+        // Events both streamed and answered to the referee's input are added once
+        if (event.match !== matchId || event.id <= lastEventId || addedEvents.has(event.id)) {
+            return;
+        }
+        addedEvents.add(event.id);
+        knownEvents += 1;
+        var count = $(`[data-live-count="${event.playerreg}-${event.eventtype}"]`);
+        count.text((parseInt(count.text(), 10) || 0) + 1);
+
+        var player = `(${event.shirtno}) ${event.player}`;
+        var home = event.side === 'home';
+        var timeline = {
+            'goal': {title: 'Gol', top: home, color: 'goal'},
+            'own goal': {title: 'Gol Contra', top: !home, color: 'goal'},
+            'yellow card': {title: 'Cartão Amarelo', top: home, color: 'yellow'},
+            'red card': {title: 'Cartão Vermelho', top: home, color: 'red'}
+        }[event.eventtype];
+        if (!timeline) {
+            return;
+        }
+        if (event.eventtype === 'goal' || event.eventtype === 'own goal') {
+            var scorer = $('<li>').text(`${player} ${event.eventtype === 'own goal' ? '(contra) ' : ''}${minutes(event)}' `)
+                .append('<i class="fa fa-futbol-o" aria-hidden="true"></i>');
+            $(`[data-live-scorers="${timeline.top ? 'home' : 'away'}"]`).append(scorer);
+        }
+        var placement = timeline.top ? 'top' : 'bottom';
+        var item = $('<li>').addClass(`card-result ${placement} ${timeline.color}`)
+            .css('left', `${Math.round(minutes(event) / 20 * 80 + 10)}%`)
+            .attr({'data-placement': placement, 'data-trigger': 'hover', 'data-toggle': 'popover',
+                   'title': timeline.title, 'data-content': player})
+            .text(`${minutes(event)}'`);
+        $('[data-live-timeline]').append(item);
+        item.popover();
+    }
+
+    // Also used by match-input.js, with the changes answered to the referee's input
+    window.liveMatch = {updateMatch: updateMatch, addEvent: addEvent};
+
+    if (!window.EventSource || !liveUrl) {
+        return;
+    }
+
+    var source = new EventSource(`${liveUrl}?last_event_id=${lastEventId}`);
+    source.addEventListener('matchevent', function(message) {
+        addEvent(JSON.parse(message.data));
+    });
+    source.addEventListener('match', function(message) {
+        updateMatch(JSON.parse(message.data));
+    });
+    source.onerror = function() {
+        // Reconnected by the browser from the last event received, unless the stream is gone
+        if (source.readyState === EventSource.CLOSED) {
+            console.error('Live updates unavailable');
+        }
+    };
+});
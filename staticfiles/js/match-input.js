@@ -2,41 +2,110 @@
 
 $(document).ready(function() {
     // Access the URL from the data attribute
-    var processDataUrl = $('script[src*="match-input.js"]').attr('data-match-input-url');
+    var batchUrl = $('script[src*="match-input.js"]').attr('data-match-input-batch-url');
+    // The actions are queued on the device, and sent in batches whenever there is a connection
+    var QUEUE_KEY = 'match-input-queue';
+    var BATCH_SIZE = 100;
+    var RETRY_MILLISECONDS = 10000;
+    var sending = false;
 
-    $('.match-event-button').on('click', function() {
-        var event = $(this).data('event');
-        var matchId = $(this).data('match');
-        var playerregId = $(this).data('player');
-        var teamregId = $(this).data('team');
-        var eventtypeName = $(this).data('eventtype');
-        var csrf_token = $(this).data('csrf_token')
+    function loadQueue() {
+        try {
+            return JSON.parse(localStorage.getItem(QUEUE_KEY)) || [];
+        } catch (e) {
+            return [];
+        }
+    }
 
+    function saveQueue(queue) {
+        localStorage.setItem(QUEUE_KEY, JSON.stringify(queue));
+        var pending = $('[data-match-input-pending]');
+        pending.text(`${queue.length} registro(s) aguardando envio`).toggle(queue.length > 0);
+    }
+
+    function newKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return Date.now().toString(36) + Math.random().toString(36).slice(2);
+    }
+
+    function csrfToken() {
+        var cookie = document.cookie.split('; ').find(function(cookie) { return cookie.startsWith('csrftoken='); });
+        return cookie ? decodeURIComponent(cookie.split('=')[1]) : $('.match-event-button').data('csrf_token');
+    }
+
+    function applyResults(response) {
+        // Only the changes are answered, and applied to the page (see live-match.js)
+        if (!window.liveMatch) {
+            return;
+        }
+        response.results.forEach(function(result) {
+            if (result.status === 'created') {
+                window.liveMatch.addEvent(result.matchevent);
+            } else if (result.status === 'invalid') {
+                console.error('Match input rejected:', result.error);
+                alert(result.error);
+            }
+        });
+        response.matches.forEach(window.liveMatch.updateMatch);
+    }
+
+    function send() {
+        var batch = loadQueue().slice(0, BATCH_SIZE);
+        if (sending || !batch.length || !batchUrl) {
+            return;
+        }
+        sending = true;
         $.ajax({
-            url: processDataUrl,
+            url: batchUrl,
             type: 'POST',
-            data: {
-                'csrfmiddlewaretoken': csrf_token,
-                'event': event,
-                'match': matchId,
-                'player': playerregId,
-                'team': teamregId,
-                'eventtype': eventtypeName
-            },
+            contentType: 'application/json',
+            data: JSON.stringify({'events': batch}),
+            headers: {'X-CSRFToken': csrfToken()},
             dataType: 'json',
             success: function(response) {
-                if (response.success) {
-                    console.log('Match input data processed successfully');
-                    location.reload();
+                // Every action answered is done with, recorded or not
+                var answered = new Set(response.results.map(function(result) { return result.key; }));
+                saveQueue(loadQueue().filter(function(item) { return !answered.has(item.key); }));
+                applyResults(response);
+            },
+            error: function(xhr, status, error) {
+                if (xhr.status === 400) {
+                    // A batch the server will never take: sending it again would block the queue
+                    var rejected = new Set(batch.map(function(item) { return item.key; }));
+                    saveQueue(loadQueue().filter(function(item) { return !rejected.has(item.key); }));
+                    alert((xhr.responseJSON || {}).error || error);
                 } else {
-                    console.error('Error processing match input data:', response.error);
-                    location.reload();
+                    console.error('Match input not sent, will retry:', error);
                 }
             },
-            error: function(xhr, status, error) {
-                console.error('AJAX error:', error);
-                location.reload();
+            complete: function(xhr) {
+                sending = false;
+                if (xhr.status === 200 && loadQueue().length) {
+                    send();
+                }
             }
         });
+    }
+
+    $(document).on('click', '.match-event-button', function() {
+        var button = $(this);
+        var queue = loadQueue();
+        queue.push({
+            'key': newKey(),
+            'timestamp': new Date().toISOString(),
+            'event': button.data('event'),
+            'match': button.data('match'),
+            'player': button.data('player'),
+            'eventtype': button.data('eventtype')
+        });
+        saveQueue(queue);
+        send();
     });
+
+    saveQueue(loadQueue());
+    send();
+    window.addEventListener('online', send);
+    setInterval(send, RETRY_MILLISECONDS);
 });
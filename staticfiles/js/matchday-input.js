@@ -0,0 +1,58 @@
+// matchday-input.js
+
+$(document).ready(function() {
+    // Access the URL from the data attribute
+    var batchUrl = $('script[src*="matchday-input.js"]').attr('data-matchday-batch-url');
+    var form = $('[data-matchday-form]');
+    var message = $('[data-matchday-message]');
+
+    function csrfToken() {
+        var cookie = document.cookie.split('; ').find(function(cookie) { return cookie.startsWith('csrftoken='); });
+        return cookie ? decodeURIComponent(cookie.split('=')[1]) : '';
+    }
+
+    function showMessage(kind, lines) {
+        message.removeClass('alert-success alert-danger').addClass(`alert-${kind}`).empty().show();
+        lines.forEach(function(line) {
+            message.append($('<div>').text(line));
+        });
+    }
+
+    // Every match of the page, with the counts entered for its players
+    function sheets() {
+        return form.find('[data-matchday-match]').map(function() {
+            var match = $(this);
+            var events = match.find('[data-matchday-player]').filter(function() {
+                return parseInt($(this).val(), 10) > 0;
+            }).map(function() {
+                return {'player': $(this).data('matchday-player'), 'eventtype': $(this).data('eventtype'),
+                        'count': parseInt($(this).val(), 10)};
+            }).get();
+            return {'match': match.data('matchday-match'), 'finished': match.find('[data-matchday-finished]').is(':checked'),
+                    'events': events};
+        }).get();
+    }
+
+    form.on('submit', function(event) {
+        event.preventDefault();
+        var button = form.find('input[type="submit"]').prop('disabled', true);
+        $.ajax({
+            url: batchUrl,
+            type: 'POST',
+            contentType: 'application/json',
+            data: JSON.stringify({'matches': sheets()}),
+            headers: {'X-CSRFToken': csrfToken()},
+            dataType: 'json',
+            success: function(response) {
+                // Rendered again, with the recorded counts
+                showMessage('success', [`${response.created} evento(s) registrado(s)`]);
+                setTimeout(function() { location.reload(); }, 1000);
+            },
+            error: function(xhr, status, error) {
+                var response = xhr.responseJSON || {};
+                showMessage('danger', response.errors || [response.error || error]);
+                button.prop('disabled', false);
+            }
+        });
+    });
+});